@@ -0,0 +1 @@
+default_app_config = 'asylum.classes.apps.ClassesConfig'
@@ -1,48 +1,79 @@
-from .models import Course, Instructor, Person, Session, Room, TemplateText, Category
-from django.contrib import admin
+from .models import Course, EnrollmentRollup, Instructor, PayoutBatch, PayoutLine, Person, PublishJob, RequestSample, SyncJob, Session, Room, TemplateText, Category
+from .eb_sync import enqueue_sync
+from .export import HTMLToText, export_events, export_rollups, export_sessions
+from .forms import ScheduleTermForm, SessionAdminForm
+from .permissions import editable_ids, has_model_perm
+from .publishing import enqueue_publish
+from .rollups import build_rollups, term_bounds
+from .search import search
+from .sales import with_sales
+from .scheduling import schedule_term
+from collections import OrderedDict
+from datetime import timedelta
+from django.conf.urls import patterns, url
+from django.contrib import admin, messages
 from django.contrib.auth import get_permission_codename
 from django.db import models
-from django.shortcuts import redirect
+from django.db.models import Avg, Count, Max
+from django.shortcuts import redirect, render
+from django.utils import timezone
 from django.utils.module_loading import autodiscover_modules
 from django_eventbrite import admin as eb_admin
-from django_eventbrite.utils import load_event_attendees, load_event
+from django_eventbrite.utils import load_event_attendees
 from django_object_actions import DjangoObjectActions
-from html2text import HTML2Text
 from import_export import resources, fields
 from import_export.admin import ExportMixin
 from pagedown.widgets import AdminPagedownWidget
 import django_eventbrite
+import threading
 
 class AsylumAdminSite(admin.AdminSite):
-    site_header = "Artisan's Asylum Courses"
-    site_title = "Asylum Courses"
-    index_title = "Course Administration"
+    """The admin site, which takes over everything registered with the stock one.
 
-admin_site = AsylumAdminSite()
-
-def steal_registrations_from_stock_admin_site():
-    """Steals all the registrations from the admin site and reregisters them here
-
-    Lots of things register with the standard admin page automatically when the
-    autodiscovery is called. This is great ... except when using a custom
+    Lots of things register with the standard admin page automatically when
+    the autodiscovery is called. This is great ... except when using a custom
     AdminSite. There doesn't seem to be a clean way to do this The Right Way,
-    so this hack is in place. This lets them all do their registration thing,
-    then unregisters them from the stock admin and re-registers them here.
-
+    so once the site is first used, every installed app's admin module is
+    imported, and then whatever they registered is moved from the stock site
+    to this one. Until then, a process that only serves the public pages
+    needn't import any of them.
     """
-    autodiscover_modules('admin')
+    site_header = "Artisan's Asylum Courses"
+    site_title = "Asylum Courses"
+    index_title = "Course Administration"
 
-    for k,v in admin.site._registry.copy().items():
-        try:
-            admin.site.unregister(k)
-        except admin.sites.NotRegistered:
-            pass # Alright. We were stealing them anyhow
-        try:
-            admin_site.register(k,type(v))
-        except admin.sites.AlreadyRegistered:
-            pass # Also alright. No honor amongst thieves
+    def __init__(self, *args, **kwargs):
+        super(AsylumAdminSite, self).__init__(*args, **kwargs)
+        self.discovered = False
+        self._discover_lock = threading.Lock()
+
+    def discover(self):
+        """Imports the admin modules and steals their registrations, once."""
+        if self.discovered:
+            return
+        with self._discover_lock:
+            if self.discovered:
+                return
+            autodiscover_modules('admin')
+            self.steal_registrations(admin.site)
+            self.discovered = True
+
+    def steal_registrations(self, site):
+        for k,v in site._registry.copy().items():
+            try:
+                site.unregister(k)
+            except admin.sites.NotRegistered:
+                pass # Alright. We were stealing them anyhow
+            try:
+                self.register(k,type(v))
+            except admin.sites.AlreadyRegistered:
+                pass # Also alright. No honor amongst thieves
+
+    def get_urls(self):
+        self.discover()
+        return super(AsylumAdminSite, self).get_urls()
 
-steal_registrations_from_stock_admin_site()
+admin_site = AsylumAdminSite()
 
 class ObjPermModelAdmin(admin.ModelAdmin):
     """Admin for models that use object-based permissions
@@ -153,20 +184,221 @@ class AbsCourseAdmin(ObjPermModelAdmin):
         return ", ".join(map(lambda r: r.name, obj.room.all()))
     rooms.admin_order_field='room__name'
 
+    def get_queryset(self, request):
+        # instructors only see what they can edit, found in one query
+        # rather than by checking each row
+        qs = super(AbsCourseAdmin, self).get_queryset(request)
+        opts = self.opts
+        perm = '{0}.{1}'.format(opts.app_label, get_permission_codename('change', opts))
+        if has_model_perm(request.user, perm):
+            return qs
+        return qs.filter(pk__in=editable_ids(request.user, self.model))
+
+    def get_search_results(self, request, queryset, search_term):
+        # search_fields only turn the search box on; the search index covers
+        # the same fields without the joins or the duplicate rows
+        if not search_term.strip():
+            return queryset, False
+        return search(queryset, search_term), False
+
+
+def sync_and_report(modeladmin, request, eb_ids, attendees=True):
+    # paced to Eventbrite's rate limit, which is far too slow for a request
+    job = enqueue_sync(eb_ids, attendees=attendees, user=request.user)
+    modeladmin.message_user(request, "Queued a reload of {0} events; see sync job {1} for the results".format(
+        len(eb_ids), job.pk))
 
 def load_session_attendees_queryset(modeladmin, request, sessions):
-    for session in sessions:
-        if not session.event:
-            continue
-        print("Loading event {0}".format(session.event.eb_id))
-        load_event_attendees(session.event.eb_id)
+    eb_ids = sessions.exclude(event=None).values_list('event__eb_id', flat=True)
+    sync_and_report(modeladmin, request, list(eb_ids))
 load_session_attendees_queryset.short_description='Update Attendees'
 
 
+@admin.register(SyncJob, site=admin_site)
+class SyncJobAdmin(admin.ModelAdmin):
+    list_display = (
+        '__str__',
+        'state',
+        'requested_by',
+        'created',
+        'modified',
+    )
+    list_filter = (
+        'state',
+    )
+    readonly_fields = (
+        'eb_ids',
+        'attendees',
+        'state',
+        'summary',
+        'requested_by',
+    )
+
+    def has_add_permission(self, request):
+        return False
+
+
+class PublishJobInline(admin.TabularInline):
+    model = PublishJob
+    extra = 0
+    can_delete = False
+    fields = readonly_fields = (
+        'state',
+        'attempts',
+        'next_attempt',
+        'modified',
+        'last_error',
+    )
+
+    def has_add_permission(self, request):
+        return False
+
+def retry_publish_jobs(modeladmin, request, jobs):
+    for job in jobs.select_related('session'):
+        enqueue_publish(job.session)
+retry_publish_jobs.short_description='Retry publishing'
+
+@admin.register(PublishJob, site=admin_site)
+class PublishJobAdmin(admin.ModelAdmin):
+    actions = (
+        retry_publish_jobs,
+    )
+    list_display = (
+        'session',
+        'state',
+        'attempts',
+        'next_attempt',
+        'created',
+        'modified',
+    )
+    list_filter = (
+        'state',
+    )
+    list_select_related = (
+        'session',
+    )
+    readonly_fields = (
+        'session',
+        'idempotency_key',
+        'attempts',
+        'last_error',
+    )
+
+@admin.register(RequestSample, site=admin_site)
+class RequestSampleAdmin(admin.ModelAdmin):
+    """Reports the slowest endpoints among the sampled requests."""
+    report_days = 7
+
+    def has_add_permission(self, request):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        try:
+            days = int(request.GET.get('days', self.report_days))
+        except ValueError:
+            days = self.report_days
+        since = timezone.now() - timedelta(days=days)
+        endpoints = RequestSample.objects.filter(created__gte=since).values('view').annotate(
+                requests=Count('pk'),
+                average=Avg('duration'),
+                slowest=Max('duration'),
+                queries=Avg('queries'),
+                sql_time=Avg('sql_time'),
+                expansion_time=Avg('expansion_time'),
+                markdown_time=Avg('markdown_time'),
+                template_text_time=Avg('template_text_time'),
+                eventbrite_time=Avg('eventbrite_time'),
+                ).order_by('-average')[:50]
+        return render(request, 'admin/classes/requestsample/slowest.html', {
+            'endpoints': endpoints,
+            'days': days,
+            'opts': self.model._meta,
+            'title': 'Slowest endpoints',
+            })
+
+@admin.register(EnrollmentRollup, site=admin_site)
+class EnrollmentRollupAdmin(admin.ModelAdmin):
+    """Reports a term's enrollment and revenue from the rollups."""
+    def has_add_permission(self, request):
+        return False
+
+    def get_urls(self):
+        return patterns('',
+            url(r'^export/$', self.admin_site.admin_view(self.export_view),
+                name='classes_enrollmentrollup_export'),
+        ) + super(EnrollmentRollupAdmin, self).get_urls()
+
+    def export_view(self, request):
+        rollups = EnrollmentRollup.objects.all()
+        if request.GET.get('term'):
+            rollups = rollups.filter(term=request.GET['term'])
+        return export_rollups(rollups)
+
+    def changelist_view(self, request, extra_context=None):
+        if request.method == 'POST':
+            term = request.POST.get('term')
+            try:
+                if term:
+                    term_bounds(term)
+            except ValueError as e:
+                self.message_user(request, str(e), level=messages.ERROR)
+            else:
+                terms = build_rollups([term] if term else None)
+                self.message_user(request, "Rebuilt the rollups of {0} term{1}".format(len(terms), 's' if len(terms) != 1 else ''))
+            return redirect(request.get_full_path())
+
+        terms = list(EnrollmentRollup.objects.values_list('term', flat=True).distinct().order_by('-term'))
+        term = request.GET.get('term') or (terms[0] if terms else None)
+        dimensions = OrderedDict((label, []) for name, label in EnrollmentRollup.DIMENSIONS)
+        names = dict(EnrollmentRollup.DIMENSIONS)
+        for rollup in EnrollmentRollup.objects.filter(term=term):
+            dimensions[names[rollup.dimension]].append(rollup)
+        return render(request, 'admin/classes/enrollmentrollup/report.html', {
+            'terms': terms,
+            'term': term,
+            'dimensions': [(label, rollups) for label, rollups in dimensions.items() if rollups],
+            'opts': self.model._meta,
+            'title': 'Term report',
+            })
+
+class PayoutLineInline(admin.TabularInline):
+    model = PayoutLine
+    fields = readonly_fields = ('instructor', 'employment_type', 'payment_type', 'percentage',
+        'sessions', 'hours', 'tickets_sold', 'net_sales', 'materials', 'amount')
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(PayoutBatch, site=admin_site)
+class PayoutBatchAdmin(admin.ModelAdmin):
+    """Shows payout batches, which are made with the create_payout_batch
+    command and can't be changed.
+    """
+    list_display = ('__str__', 'created', 'created_by', 'total')
+    fields = readonly_fields = ('start', 'end', 'created', 'created_by', 'total')
+    inlines = [PayoutLineInline]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+def export_sessions_csv(modeladmin, request, sessions):
+    return export_sessions(sessions)
+export_sessions_csv.short_description='Export as CSV'
+
 @admin.register(Session, site=admin_site)
 class SessionAdmin(DjangoObjectActions, AbsCourseAdmin):
+    form = SessionAdminForm
     actions = (
         load_session_attendees_queryset,
+        export_sessions_csv,
+    )
+    inlines = (
+        PublishJobInline,
     )
     permissioned_fields = (
         ('classes.change_session_state', ('state',)),
@@ -197,25 +429,21 @@ class SessionAdmin(DjangoObjectActions, AbsCourseAdmin):
     )
     list_filter = (
         'state',
-        'calendar_event__start',
+        'first_start',
+        'occurrences__start',
     )
 
     objectactions = ('submit_for_approval', 'publish', 'cancel')
 
+    def get_queryset(self, request):
+        qs = super(SessionAdmin, self).get_queryset(request)
+        qs = qs.select_related('event').prefetch_related('instructors')
+        return with_sales(qs, 'event')
+
     def end_date(self, obj):
-        """The end time of the last meeting of this session.
-
-        This is computed and could potentially be quite expensive for things
-        that repeat many times. In reality, that should be pretty unusual.
-        However the database-based sort can't use this info, so it filters on
-        the end recurring period, which may be inaccurate. Still, it's better
-        than not being able to sort at all.
-        """
-        occurrences = obj.get_occurrences()
-        if not occurrences:
-           return None
-        return occurrences[-1].end
-    end_date.admin_order_field='calendar_event__end_recurring_period'
+        """The end time of the last meeting of this session."""
+        return obj.last_end
+    end_date.admin_order_field='last_end'
 
     def _max_enrollment(self, obj):
         return obj.max_enrollment
@@ -228,34 +456,33 @@ class SessionAdmin(DjangoObjectActions, AbsCourseAdmin):
     _min_enrollment.admin_order_field='min_enrollment'
 
     def eventbrite_fees(self, obj):
-        if not obj.event:
+        if not obj.event_id:
             return None
-        return obj.event.eventbrite_fees()
+        return obj.eventbrite_fees
     eventbrite_fees.short_description='EB fees'
+    eventbrite_fees.admin_order_field='eventbrite_fees'
 
     def ticket_sales(self, obj):
-        if not obj.event:
+        if not obj.event_id:
             return None
-        return obj.event.ticket_sales()
+        return obj.ticket_sales
     ticket_sales.short_description='Sales'
+    ticket_sales.admin_order_field='ticket_sales'
 
     def quantity_sold(self, obj):
-        if not obj.event:
-            return 0
-        return obj.event.quantity_sold()
+        return obj.quantity_sold
     quantity_sold.short_description='Sold'
+    quantity_sold.admin_order_field='quantity_sold'
 
     def quantity_refunded(self, obj):
-        if not obj.event:
-            return 0
-        return obj.event.quantity_refunded()
+        return obj.quantity_refunded
     quantity_refunded.short_description='Refunds'
+    quantity_refunded.admin_order_field='quantity_refunded'
 
     def quantity_canceled(self, obj):
-        if not obj.event:
-            return 0
-        return obj.event.quantity_canceled()
+        return obj.quantity_canceled
     quantity_canceled.short_description='Cancels'
+    quantity_canceled.admin_order_field='quantity_canceled'
 
     def get_object_actions(self, request, context, **kwargs):
         objectactions = []
@@ -270,13 +497,13 @@ class SessionAdmin(DjangoObjectActions, AbsCourseAdmin):
         return objectactions
 
     def start_date(self, obj):
-        if not obj.calendar_event:
-            return None
-        return obj.calendar_event.start
-    start_date.admin_order_field='calendar_event__start'
+        """The start time of the first meeting of this session."""
+        return obj.first_start
+    start_date.admin_order_field='first_start'
 
     def number_of_sessions(self, obj):
-        return len(obj.get_occurrences() or [])
+        return obj.meeting_count
+    number_of_sessions.admin_order_field='meeting_count'
     number_of_sessions.short_description='Scheduled sessions'
 
     def submit_for_approval(self, request, obj):
@@ -290,7 +517,7 @@ class SessionAdmin(DjangoObjectActions, AbsCourseAdmin):
             obj.publish(request)
             return redirect('admin:classes_session_changelist')
     publish.label = 'Publish'
-    publish.short_description = 'Publish on site and create Eventbrite event'
+    publish.short_description = 'Publish on site and queue creation of the Eventbrite event'
 
     def cancel(self, request, obj):
         if request.user.has_perm('classes.change_session_state'):
@@ -299,8 +526,25 @@ class SessionAdmin(DjangoObjectActions, AbsCourseAdmin):
     cancel.label = 'Cancel Session'
     cancel.short_description = 'Remove from site and cancel Eventbrite event'
 
+def schedule_term_queryset(modeladmin, request, courses):
+    form = ScheduleTermForm(request.POST if 'apply' in request.POST else None)
+    if form.is_valid():
+        sessions = schedule_term(courses, **form.schedule_kwargs())
+        modeladmin.message_user(request, "Created {0} draft sessions".format(len(sessions)))
+        return None
+    return render(request, 'admin/classes/course/schedule_term.html', {
+        'courses': courses,
+        'form': form,
+        'opts': modeladmin.model._meta,
+        'title': 'Schedule a term',
+        })
+schedule_term_queryset.short_description='Schedule a term of sessions'
+
 @admin.register(Course, site=admin_site)
 class CourseAdmin(DjangoObjectActions, AbsCourseAdmin):
+    actions = (
+        schedule_term_queryset,
+    )
     permissioned_fields = (
         ('classes.change_course_state', ('state',)),
     )
@@ -352,17 +596,9 @@ class CategoryAdmin(admin.ModelAdmin):
     }
 
 
-# Override the django_eventbrite model to allow for course conversion.
-try:
-    admin.site.unregister(django_eventbrite.models.Event)
-except admin.sites.NotRegistered:
-    pass # that's OK
-
-try:
-    admin_site.unregister(django_eventbrite.models.Event)
-except admin.sites.NotRegistered:
-    pass # that's OK
-
+# Override the django_eventbrite model to allow for course conversion. It's
+# registered here before the stock site's registrations are stolen, so the
+# stock EventAdmin is the one left behind.
 
 from django.contrib import admin
 from django.contrib.admin.util import flatten_fieldsets
@@ -390,41 +626,34 @@ def make_courses(modeladmin, request, queryset):
 make_courses.short_description='Convert Event into a Course'
 
 def load_attendees_queryset(modeladmin, request, events):
-    for event in events:
-        load_event_attendees(event.eb_id)
+    sync_and_report(modeladmin, request, list(events.values_list('eb_id', flat=True)))
 load_attendees_queryset.short_description='Load Attendees'
 
 def load_events_queryset(modeladmin, request, events):
-    for event in events:
-        load_event(event.eb_id)
+    sync_and_report(modeladmin, request, list(events.values_list('eb_id', flat=True)), attendees=False)
 load_events_queryset.short_description='Reload Events'
 
-import csv
-from django.http import HttpResponse
-
-def export_csv(modeladmin, request, queryset):
-   response = HttpResponse(content_type='text/csv')
-   response['Content-Disposition'] = 'attachment; filename="events-export.csv"'
-   writer = csv.writer(response)
-   for event in queryset:
-       writer
+def export_events_csv(modeladmin, request, events):
+    return export_events(events)
+export_events_csv.short_description='Export as CSV'
 
 class EventResource(resources.ModelResource):
     quantity_sold = fields.Field()
     quantity_refunded = fields.Field()
     quantity_canceled = fields.Field()
     ticket_sales = fields.Field()
-    h=HTML2Text()
+    h=HTMLToText()
+    # the figures come from the queryset, via EventAdmin.get_export_queryset
     def dehydrate_quantity_sold(self, event):
-        return event.quantity_sold()
+        return event.sales_quantity_sold
     def dehydrate_description(self, event):
-        return self.h.handle(event.description)
+        return self.h(event.description)
     def dehydrate_quantity_refunded(self, event):
-        return event.quantity_refunded()
+        return event.sales_quantity_refunded
     def dehydrate_quantity_canceled(self, event):
-        return event.quantity_canceled()
+        return event.sales_quantity_canceled
     def dehydrate_ticket_sales(self, event):
-        return event.ticket_sales()
+        return event.sales_ticket_sales
     class Meta:
         model = django_eventbrite.models.Event
 
@@ -433,9 +662,14 @@ class EventAdmin(ExportMixin, ReadonlyAdminMixin, DjangoObjectActions, eb_admin.
     formfield_overrides = {
             models.TextField: {'widget': AdminPagedownWidget },
     }
-    actions=[make_courses, load_attendees_queryset, load_events_queryset]
+    actions=[make_courses, load_attendees_queryset, load_events_queryset, export_events_csv]
     inlines=[AttendeeInline]
     resource_class = EventResource
+
+    def get_export_queryset(self, request):
+        events = super(EventAdmin, self).get_export_queryset(request)
+        return with_sales(events, prefix='sales_')
+
     def make_course(self, request, obj):
         c=Course()
         c.set_from_event(obj)
@@ -0,0 +1,33 @@
+"""The admin site's URLs.
+
+Django imports this as soon as it loads the root URLconf, and looks at the
+patterns whenever it reverses or resolves anything under the admin, so the
+patterns are built on first use: neither the admin nor anything registered
+with it is imported until a request first needs them.
+"""
+
+class AdminURLs(object):
+    """The admin site's URL patterns, built the first time they're read."""
+    def __init__(self):
+        self._patterns = None
+
+    @property
+    def patterns(self):
+        if self._patterns is None:
+            from asylum.classes.admin import admin_site
+            self._patterns = admin_site.get_urls()
+        return self._patterns
+
+    def __iter__(self):
+        return iter(self.patterns)
+
+    def __reversed__(self):
+        return reversed(self.patterns)
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def __getitem__(self, index):
+        return self.patterns[index]
+
+urlpatterns = AdminURLs()
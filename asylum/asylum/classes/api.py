@@ -0,0 +1,167 @@
+"""A read-only JSON API over the public sessions, for embedding elsewhere.
+
+Sessions are paged in (modified, pk) order with an opaque cursor, so a client
+can sync the whole catalogue a page at a time and then keep up by passing
+the cursor it stopped at, or a modified_since time. Everything a session
+shows that lives on another model bumps its modified time (see signals), so
+this ordering also picks up edits to its course, instructors and sales.
+
+A page costs a fixed number of queries: one for the (pk, modified) keys of
+the page, which is all a 304 needs, then one for the annotated sessions and
+one per requested relation.
+"""
+from asylum.classes.caching import digest
+from asylum.classes.models import Session
+from asylum.classes.sales import with_sales
+from asylum.classes.search import search
+from collections import OrderedDict
+from django.db.models import Q
+from django.http import HttpResponse, HttpResponseBadRequest
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.http import condition
+import base64
+import json
+
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+# sessions in these states are listed, so clients can drop cancellations
+LISTED_STATES = (Session.STATE_PUBLIC, Session.STATE_CANCELED)
+
+class BadRequest(Exception):
+    pass
+
+def money(value):
+    if value is None:
+        return None
+    return {'amount': str(value.amount), 'currency': value.currency.code}
+
+def occurrences(session):
+    return [{'start': o.start.isoformat(), 'end': o.end.isoformat()} for o in session.occurrences.all()]
+
+def schedule(session):
+    return OrderedDict((
+        ('first_start', session.first_start.isoformat() if session.first_start else None),
+        ('last_end', session.last_end.isoformat() if session.last_end else None),
+        ('meetings', session.meeting_count),
+        ('days', session.days_display),
+        ('dates', session.dates_display),
+        ('times', session.times_display),
+    ))
+
+def remaining(session):
+    return max(session.max_enrollment - (session.quantity_sold or 0), 0)
+
+# name -> (value, relations to prefetch, whether it needs the sales figures)
+FIELDS = OrderedDict((
+    ('id', (lambda s: s.pk, (), False)),
+    ('name', (lambda s: s.name, (), False)),
+    ('state', (lambda s: s.state, (), False)),
+    ('modified', (lambda s: s.modified.isoformat(), (), False)),
+    ('blurb', (lambda s: s.blurb, (), False)),
+    ('description', (lambda s: s.description, (), False)),
+    ('course', (lambda s: {'id': s.course_id, 'name': s.course.name}, (), False)),
+    ('categories', (lambda s: [{'id': c.pk, 'name': c.name} for c in s.category.all()], ('category',), False)),
+    ('instructors', (lambda s: [{'id': i.pk, 'name': i.name_display} for i in s.instructors.all()], ('instructors',), False)),
+    ('rooms', (lambda s: [{'id': r.pk, 'name': r.name} for r in s.room.all()], ('room',), False)),
+    ('schedule', (schedule, (), False)),
+    ('occurrences', (occurrences, ('occurrences',), False)),
+    ('ticket_price', (lambda s: money(s.ticket_price), (), False)),
+    ('material_cost', (lambda s: money(s.material_cost), (), False)),
+    ('max_enrollment', (lambda s: s.max_enrollment, (), False)),
+    ('remaining', (remaining, (), True)),
+    ('eb_url', (lambda s: s.event.eb_url if s.event else None, (), False)),
+))
+
+def encode_cursor(modified, pk):
+    value = '{0}|{1}'.format(modified.isoformat(), pk)
+    return base64.urlsafe_b64encode(value.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    try:
+        modified, pk = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|')
+        modified, pk = parse_datetime(modified), int(pk)
+    except (TypeError, ValueError, UnicodeError):
+        modified = None
+    if modified is None:
+        raise BadRequest('Invalid cursor')
+    return modified, pk
+
+def parse_params(params):
+    """The fields, filters and page size asked for in a query string."""
+    fields = list(FIELDS)
+    if params.get('fields'):
+        fields = [f for f in params['fields'].split(',') if f]
+        unknown = [f for f in fields if f not in FIELDS]
+        if unknown:
+            raise BadRequest('Unknown fields: {0}'.format(', '.join(unknown)))
+
+    try:
+        limit = min(int(params.get('limit', PAGE_SIZE)), MAX_PAGE_SIZE)
+    except ValueError:
+        raise BadRequest('Invalid limit')
+    if limit < 1:
+        raise BadRequest('Invalid limit')
+
+    sessions = Session.objects.filter(state__in=LISTED_STATES)
+    if params.get('modified_since'):
+        modified_since = parse_datetime(params['modified_since'])
+        if modified_since is None:
+            raise BadRequest('Invalid modified_since')
+        sessions = sessions.filter(modified__gte=modified_since)
+    if params.get('cursor'):
+        modified, pk = decode_cursor(params['cursor'])
+        sessions = sessions.filter(Q(modified__gt=modified) | Q(modified=modified, pk__gt=pk))
+    return fields, sessions.order_by('modified', 'pk'), limit
+
+def page_keys(request):
+    """The (pk, modified) of each session on the page, computed once per request."""
+    if not hasattr(request, 'api_page'):
+        fields, sessions, limit = parse_params(request.GET)
+        request.api_page = (fields, list(sessions.values_list('pk', 'modified')[:limit]), limit)
+    return request.api_page
+
+def sessions_etag(request):
+    try:
+        fields, keys, limit = page_keys(request)
+    except BadRequest:
+        return None
+    return digest('{0}:{1}:{2}'.format(','.join(fields), limit,
+        ','.join('{0}@{1}'.format(pk, modified.isoformat()) for pk, modified in keys)))
+
+def with_fields(sessions, fields):
+    """Loads what the fields of each session need along with sessions."""
+    sessions = sessions.select_related('course', 'event')
+    prefetch = [relation for name in fields for relation in FIELDS[name][1]]
+    if prefetch:
+        sessions = sessions.prefetch_related(*prefetch)
+    if any(FIELDS[name][2] for name in fields):
+        sessions = with_sales(sessions, 'event')
+    return sessions
+
+def serialize(sessions, fields):
+    return [OrderedDict((name, FIELDS[name][0](session)) for name in fields) for session in sessions]
+
+@condition(etag_func=sessions_etag)
+def session_list(request):
+    try:
+        fields, keys, limit = page_keys(request)
+    except BadRequest as e:
+        return HttpResponseBadRequest(str(e))
+
+    sessions = Session.objects.filter(pk__in=[pk for pk, modified in keys]).order_by('modified', 'pk')
+    page = OrderedDict((('results', serialize(with_fields(sessions, fields), fields)), ('next', None)))
+    if len(keys) == limit:
+        page['next'] = encode_cursor(keys[-1][1], keys[-1][0])
+    return HttpResponse(json.dumps(page), content_type='application/json')
+
+def session_search(request):
+    """The public sessions matching ?q=, best matches first."""
+    try:
+        fields, sessions, limit = parse_params(request.GET)
+    except BadRequest as e:
+        return HttpResponseBadRequest(str(e))
+    sessions = search(sessions.filter(state=Session.STATE_PUBLIC), request.GET.get('q', ''))
+    results = serialize(with_fields(sessions, fields)[:limit], fields)
+    return HttpResponse(json.dumps({'results': results}), content_type='application/json')
+
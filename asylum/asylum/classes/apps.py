@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+class ClassesConfig(AppConfig):
+    name = 'asylum.classes'
+    verbose_name = 'Classes'
+
+    def ready(self):
+        # connects the signal handlers
+        from asylum.classes import signals
+        from asylum.classes.search import create_index
+        post_migrate.connect(create_index, sender=self)
@@ -0,0 +1,455 @@
+"""Benchmarks of the app's hot paths.
+
+Each benchmark is a function returning a dict of measurements. Run them with
+the benchmark management command. Those that need data build a synthetic
+catalogue inside a transaction that is rolled back afterwards, so they can be
+run against any database.
+"""
+from asylum.classes import search, summaries
+from asylum.classes.eb_sync import store_attendees, store_events
+from asylum.classes.export import export_events
+from asylum.classes.intervals import IntervalIndex
+from asylum.classes.models import Category, Course, Instructor, Room, Session, TemplateText
+from asylum.classes.scheduling import schedule_term
+from asylum.classes.utils import publish_to_eb
+from collections import OrderedDict, namedtuple
+from datetime import date, datetime, time, timedelta
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Q
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from django_eventbrite.models import Event
+from functools import reduce
+import copy
+import json
+import os
+import random
+import subprocess
+import sys
+import time as clock
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2 has no way to measure peak memory from inside
+    tracemalloc = None
+
+BENCHMARKS = OrderedDict()
+
+def benchmark(func):
+    BENCHMARKS[func.__name__] = func
+    return func
+
+# how much slower or bigger a measurement can get before it's a regression
+REGRESSION_THRESHOLD = 0.25
+
+def regressions(baseline, results, threshold=REGRESSION_THRESHOLD):
+    """(benchmark, measure, old, new) for each measurement that got worse.
+
+    Any extra query is a regression; times and memory are allowed to vary by
+    the threshold, as a fraction of the baseline.
+    """
+    worse = []
+    for name, measures in results.items():
+        for measure, new in measures.items():
+            old = baseline.get(name, {}).get(measure)
+            if old is None or new is None:
+                continue
+            if measure.endswith('_queries'):
+                regressed = new > old
+            elif measure.endswith(('_seconds', '_kb')):
+                regressed = new > old * (1 + threshold)
+            else:
+                continue
+            if regressed:
+                worse.append((name, measure, old, new))
+    return worse
+
+def timed(func, repeat=5):
+    """The best wall time of several calls of func, in seconds."""
+    best = None
+    for i in range(repeat):
+        start = clock.time()
+        func()
+        elapsed = clock.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+class Rollback(Exception):
+    pass
+
+def rolled_back(func):
+    """Calls func in a transaction that is then rolled back, returning its result."""
+    try:
+        with transaction.atomic():
+            raise Rollback(func())
+    except Rollback as e:
+        return e.args[0]
+
+WORDS = ('welding', 'woodworking', 'electronics', 'sewing', 'jewelry', 'casting',
+    'machining', 'lathe', 'arduino', 'soldering', 'leather', 'glass', 'forging',
+    'printing', 'laser', 'plasma', 'cnc', 'pottery', 'bicycle', 'robotics')
+
+# recorded Eventbrite responses, which synthetic events and attendees copy
+EVENTBRITE_DATA = os.path.join(os.path.dirname(__file__), 'test_data', 'eventbrite_changes.json')
+
+def eventbrite_templates():
+    with open(EVENTBRITE_DATA) as f:
+        data = json.load(f)
+    return data['events'][0], data['attendees'][0]
+
+def synthetic_event(template, eb_id, name):
+    event = copy.deepcopy(template)
+    event['id'] = str(eb_id)
+    event['name'] = {'text': name, 'html': name}
+    event['url'] = 'http://www.eventbrite.com/e/tickets-{0}'.format(eb_id)
+    for ticket_class in event['ticket_classes']:
+        ticket_class['id'] = str(eb_id)
+        ticket_class['event_id'] = str(eb_id)
+    return event
+
+def synthetic_attendee(template, eb_id, event_id):
+    attendee = copy.deepcopy(template)
+    attendee['id'] = attendee['order_id'] = str(eb_id)
+    attendee['event_id'] = attendee['ticket_class_id'] = str(event_id)
+    return attendee
+
+def synthetic_catalogue(courses, sessions_per_course=0, attendees_per_event=0, template_texts=0, seed=0):
+    """Fills the database with a catalogue of random courses and their relations.
+
+    Courses, categories, rooms and template texts are bulk inserted, so no
+    signals are sent for them; index anything derived from them afterwards.
+    Each term of sessions is scheduled as the admin would, with weekly
+    rules, and the sessions are published to synthetic Eventbrite events
+    with attendees.
+    """
+    rng = random.Random(seed)
+    words = lambda count: ' '.join(rng.choice(WORDS) for i in range(count))
+    keywords = ['text{0}'.format(i) for i in range(template_texts)]
+    TemplateText.objects.bulk_create([TemplateText(keyword=keyword, text=words(20)) for keyword in keywords])
+    Category.objects.bulk_create([Category(name=word.title()) for word in WORDS])
+    Room.objects.bulk_create([Room(name='Room {0}'.format(i)) for i in range(20)])
+    # multi-table inheritance rules out bulk_create for these
+    for i in range(max(courses // 10, 2)):
+        Instructor.objects.create(name='Instructor {0} {1}'.format(i, words(1).title()),
+            employment_type='1099', payment_type='check')
+    Course.objects.bulk_create([Course(
+        name='{0} {1}'.format(words(2).title(), i),
+        blurb=words(30),
+        description=' '.join([words(200)] + ['{{{{{0}}}}}'.format(k) for k in keywords[:3]]),
+        number_of_meetings=rng.randrange(1, 8),
+        max_enrollment=rng.randrange(4, 20),
+        ticket_price=rng.randrange(20, 300),
+        material_cost=rng.randrange(0, 100),
+        ) for i in range(courses)])
+
+    course_ids = list(Course.objects.values_list('pk', flat=True))
+    for name, model in (('category', Category), ('room', Room), ('instructors', Instructor)):
+        related_ids = list(model.objects.values_list('pk', flat=True))
+        field = Course._meta.get_field(name)
+        through = field.rel.through
+        through.objects.bulk_create([through(**{
+            field.m2m_field_name() + '_id': course_id,
+            field.m2m_reverse_field_name() + '_id': related_id,
+            }) for course_id in course_ids for related_id in rng.sample(related_ids, 2)])
+
+    sessions = []
+    for term in range(sessions_per_course):
+        sessions += schedule_term(Course.objects.all(), date(2015, 1, 5) + timedelta(weeks=12 * term),
+                time(18), timedelta(hours=3), weekdays=[rng.randrange(7)])
+
+    if sessions:
+        event_template, attendee_template = eventbrite_templates()
+        store_events([synthetic_event(event_template, session.pk, session.name) for session in sessions])
+        store_attendees([synthetic_attendee(attendee_template, session.pk * 1000 + i, session.pk)
+            for session in sessions for i in range(attendees_per_event)])
+        events = dict(Event.objects.values_list('eb_id', 'pk'))
+        for session in sessions:
+            Session.objects.filter(pk=session.pk).update(
+                    event=events[str(session.pk)], state=Session.STATE_PUBLIC)
+    return course_ids
+
+def profile(func, setup=None, repeat=3):
+    """The wall time, query count and peak memory of calling func.
+
+    The time is the best of several calls; the queries and memory are
+    measured on a separate call, as tracing slows it down. setup is called
+    before each call, untimed, with its result passed to func.
+    """
+    setup = setup or (lambda: None)
+    best = None
+    for i in range(repeat):
+        arg = setup()
+        start = clock.time()
+        func(arg)
+        elapsed = clock.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    arg = setup()
+    if tracemalloc:
+        tracemalloc.start()
+    with CaptureQueriesContext(connection) as queries:
+        func(arg)
+    peak = None
+    if tracemalloc:
+        peak = tracemalloc.get_traced_memory()[1] // 1024
+        tracemalloc.stop()
+    return best, len(queries), peak
+
+DJANGO_SETUP = 'import django; django.setup()'
+
+# an empty test database and the test client, for serving real requests
+REQUEST_SETUP = DJANGO_SETUP + ('; from django.test.utils import setup_test_environment; setup_test_environment()'
+        '; from django.db import connection; name = connection.creation.create_test_db(0, autoclobber=True, serialize=False)'
+        '; from django.test import Client')
+REQUEST_TEARDOWN = 'connection.creation.destroy_test_db(name, 0)'
+
+# a course with a session that isn't on Eventbrite yet, so the listing links
+# to the session's own page
+SEED_SESSION = '''
+from asylum.classes.models import Category, Course
+from datetime import timedelta
+from django.utils import timezone
+from schedule.models import Event as CalEvent
+course = Course.objects.create(name='Welding', blurb='Learn to weld.', description='All about welding.',
+    max_enrollment=8, ticket_price=100, material_cost=20)
+course.category.add(Category.objects.create(name='Metal'))
+session = course.create_session()
+start = timezone.now() + timedelta(days=7)
+session.calendar_event = CalEvent.objects.create(title=course.name, start=start, end=start + timedelta(hours=3),
+    end_recurring_period=start + timedelta(hours=3))
+session.save()
+'''
+
+# run in a fresh interpreter: setup and teardown untimed, the statement timed
+COLD_SCRIPT = """import sys, time
+{setup}
+modules = len(sys.modules)
+start = time.time()
+{statement}
+seconds, modules = time.time() - start, len(sys.modules) - modules
+{teardown}
+print(seconds, modules)
+"""
+
+def cold_import(statement, setup=DJANGO_SETUP, repeat=3, teardown=''):
+    """The best wall time of running statement in a new process, in seconds,
+    and the number of modules it imported.
+
+    Each run is a fresh interpreter with this one's settings and path, so
+    the statement pays for every import it needs, as in a newly booted worker.
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(path for path in sys.path if path))
+    env.setdefault('DJANGO_SETTINGS_MODULE', settings.SETTINGS_MODULE)
+    script = COLD_SCRIPT.format(setup=setup, statement=statement, teardown=teardown)
+    best = None
+    for i in range(repeat):
+        output = subprocess.check_output([sys.executable, '-c', script], env=env)
+        seconds, modules = output.split()[-2:]
+        seconds, modules = float(seconds), int(modules)
+        best = seconds if best is None else min(best, seconds)
+    return best, modules
+
+Meeting = namedtuple('Meeting', 'start end')
+
+def random_meetings(count, rooms=10, seed=0):
+    """Synthetic (room, start, end, key) occurrences spread over a year.
+
+    Sessions meet weekly, so each key is used for several intervals.
+    """
+    rng = random.Random(seed)
+    year = datetime(2015, 1, 1)
+    meetings = []
+    key = 0
+    while len(meetings) < count:
+        key += 1
+        room = rng.randrange(rooms)
+        start = year + timedelta(days=rng.randrange(365), hours=rng.randrange(9, 21))
+        length = timedelta(hours=rng.choice((1, 2, 3)))
+        for week in range(min(rng.randrange(1, 9), count - len(meetings))):
+            meeting = start + timedelta(weeks=week)
+            meetings.append((room, meeting, meeting + length, key))
+    return meetings
+
+@benchmark
+def room_conflicts(size=5000):
+    """Checks one session against a room's schedule, indexed and pairwise."""
+    meetings = random_meetings(size)
+    by_room = {}
+    for room, start, end, key in meetings:
+        by_room.setdefault(room, []).append((start, end, key))
+    indexes = {}
+    build = timed(lambda: indexes.update((room, IntervalIndex(i)) for room, i in by_room.items()), 1)
+
+    room, start, end, key = meetings[len(meetings) // 2]
+    session = [(s, e) for r, s, e, k in meetings if k == key]
+
+    def indexed():
+        for s, e in session:
+            indexes[room].overlapping(s, e, exclude=key)
+
+    def pairwise():
+        for s, e in session:
+            [i for i in by_room[room] if i[0] < e and i[1] > s and i[2] != key]
+
+    return OrderedDict((
+        ('occurrences', len(meetings)),
+        ('build_seconds', build),
+        ('check_session_indexed_seconds', timed(indexed)),
+        ('check_session_pairwise_seconds', timed(pairwise)),
+        ('full_report_seconds', timed(lambda: [index.conflicts() for index in indexes.values()], 1)),
+    ))
+
+# what the admin's search_fields did before there was a search index
+SEARCH_FIELDS = ('name', 'description', 'blurb', 'instructors__name', 'instructors__asylum_name',
+    'category__name', 'room__name')
+
+def like_search(queryset, text):
+    for word in search.terms(text):
+        queryset = queryset.filter(
+            reduce(lambda q, field: q | Q(**{field + '__icontains': word}), SEARCH_FIELDS, Q()))
+    return queryset.distinct()
+
+@benchmark
+def course_search(size=5000):
+    """Searches a catalogue of courses with the index and with search_fields."""
+    def run():
+        synthetic_catalogue(size)
+        build = timed(lambda: search.reindex(Course.objects.all()), 1)
+        courses = Course.objects.all()
+        queries = ('weld', 'laser cutting', 'room 7 arduino')
+        return OrderedDict((
+            ('courses', size),
+            ('full_text', search.has_fts()),
+            ('index_seconds', build),
+            ('indexed_search_seconds', timed(lambda: [list(search.search(courses, q)[:50]) for q in queries])),
+            ('like_search_seconds', timed(lambda: [list(like_search(courses, q)[:50]) for q in queries])),
+        ))
+    return rolled_back(run)
+
+@benchmark
+def schedule_summaries(size=1000):
+    """Summarizes the meetings of each session in a listing, cold and memoized."""
+    by_session = {}
+    for room, start, end, key in random_meetings(size * 4):
+        start, end = timezone.make_aware(start, timezone.utc), timezone.make_aware(end, timezone.utc)
+        by_session.setdefault(key, []).append(Meeting(start, end))
+    sessions = list(by_session.values())
+
+    def summarize_all():
+        for meetings in sessions:
+            summaries.summarize(meetings, date_format='F j')
+
+    def cold():
+        summaries.summary_cache.clear()
+        summarize_all()
+
+    per_session = lambda seconds: seconds / len(sessions) * 1e6
+    return OrderedDict((
+        ('sessions', len(sessions)),
+        ('cold_per_session_microseconds', per_session(timed(cold))),
+        ('memoized_per_session_microseconds', per_session(timed(summarize_all))),
+    ))
+
+class StubEventbrite(object):
+    """A stand-in for the eb client that accepts everything, instantly."""
+    def __init__(self):
+        self.event, attendee = eventbrite_templates()
+        self.next_id = 900000000
+
+    def post_event(self, data):
+        self.next_id += 1
+        return synthetic_event(dict(self.event, ticket_classes=[]), self.next_id, 'Event {0}'.format(self.next_id))
+
+    def post_event_ticket_classes(self, eb_id, data):
+        self.next_id += 1
+        ticket_class = dict(self.event['ticket_classes'][0], id=str(self.next_id), event_id=eb_id)
+        return ticket_class
+
+@benchmark
+def catalogue(size=100):
+    """The public pages, admin changelists, export and publishing, measured
+    against a synthetic catalogue of size courses with two terms of sessions.
+    """
+    def run():
+        synthetic_catalogue(size, sessions_per_course=2, attendees_per_event=10, template_texts=20)
+        User.objects.create_superuser('benchmark', 'benchmark@example.com', 'benchmark')
+        client = Client()
+        client.login(username='benchmark', password='benchmark')
+        session = Session.objects.filter(description__contains='{{').first()
+
+        def get(url):
+            def request(arg):
+                response = client.get(url)
+                assert response.status_code == 200, (url, response.status_code)
+            return request
+
+        def uncached():
+            # nothing cached at all, as after a restart: pages, versions,
+            # fragments and the memoized summaries
+            cache.clear()
+            summaries.summary_cache.clear()
+
+        def ready_to_publish():
+            sessions = schedule_term(Course.objects.all()[:20], date(2015, 9, 7), time(18), timedelta(hours=3))
+            Session.objects.filter(pk__in=[s.pk for s in sessions]).update(state=Session.STATE_READY_TO_PUBLISH)
+            return Session.objects.filter(pk__in=[s.pk for s in sessions])
+
+        def publish(sessions):
+            stub = StubEventbrite()
+            for session in sessions:
+                publish_to_eb(session, stub)
+
+        scenarios = OrderedDict((
+            ('session_list', (get('/'), uncached)),
+            ('session_list_cached', (get('/'), None)),
+            ('session_item', (get('/courses/session/{0}/'.format(session.pk)), uncached)),
+            ('session_changelist', (get('/admin/classes/session/'), None)),
+            ('course_changelist', (get('/admin/classes/course/'), None)),
+            ('event_changelist', (get('/admin/django_eventbrite/event/'), None)),
+            ('event_export', (lambda arg: b''.join(export_events(Event.objects.all()).streaming_content), None)),
+            ('publish_20_sessions', (publish, ready_to_publish)),
+        ))
+        results = OrderedDict((
+            ('courses', size),
+            ('sessions', Session.objects.count()),
+        ))
+        for name, (func, setup) in scenarios.items():
+            seconds, queries, peak = profile(func, setup)
+            results[name + '_seconds'] = seconds
+            results[name + '_queries'] = queries
+            results[name + '_peak_kb'] = peak
+        return results
+
+    # lets the test client through ALLOWED_HOSTS
+    setup_test_environment()
+    try:
+        return rolled_back(run)
+    finally:
+        teardown_test_environment()
+
+
+# what a new worker does before, and while, serving its first requests
+STARTUP_STEPS = (
+    ('boot', '', DJANGO_SETUP, ''),
+    ('first_request', REQUEST_SETUP + SEED_SESSION,
+        'assert Client().get("/").status_code == 200', REQUEST_TEARDOWN),
+    # the index redirects to the login page, which is as far as a visitor gets
+    ('first_admin_request', REQUEST_SETUP,
+        'assert Client().get("/admin/").status_code == 302', REQUEST_TEARDOWN),
+)
+
+@benchmark
+def startup(size=3):
+    """How long a new worker takes to boot and to get ready for its first
+    public and admin requests, each the best of size fresh processes.
+    """
+    results = OrderedDict()
+    for name, setup, statement, teardown in STARTUP_STEPS:
+        seconds, modules = cold_import(statement, setup, repeat=size, teardown=teardown)
+        results[name + '_seconds'] = seconds
+        results[name + '_modules'] = modules
+    return results
@@ -0,0 +1,89 @@
+from collections import OrderedDict
+from django.core.cache import cache
+from hashlib import sha1
+import threading
+import time
+
+def digest(text):
+    """A stable digest of some text, for use in cache keys."""
+    return sha1(text.encode('utf-8')).hexdigest()
+
+def version_key(name):
+    return 'asylum:version:{0}'.format(name)
+
+def get_version(name):
+    """The current version of a named set of cached data.
+
+    Versions are kept in the shared cache so that bumping one in a single
+    process invalidates the data in all of them.
+    """
+    version = cache.get(version_key(name))
+    if version is None:
+        version = bump_version(name)
+    return version
+
+def bump_version(name):
+    """Invalidates everything cached under the current version of name."""
+    key = version_key(name)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Start from the clock so a version evicted from the cache can't be
+        # reissued while data cached under it is still around.
+        version = int(time.time() * 1000)
+        cache.set(key, version, None)
+        return version
+
+def get_versions(names):
+    """The current versions of several named sets of cached data at once."""
+    keys = dict((version_key(name), name) for name in names)
+    found = cache.get_many(keys)
+    missing = {}
+    for key in keys:
+        if key not in found:
+            missing[key] = int(time.time() * 1000)
+    if missing:
+        cache.set_many(missing, None)
+        found.update(missing)
+    return dict((name, found[key]) for key, name in keys.items())
+
+CATALOGUE_VERSION = 'catalogue'
+
+def course_version(course_id):
+    return 'course:{0}'.format(course_id)
+
+def invalidate_catalogue(course_ids=()):
+    """Invalidates the cached public pages, and the fragments for courses."""
+    for course_id in set(course_ids):
+        bump_version(course_version(course_id))
+    bump_version(CATALOGUE_VERSION)
+
+class LRUCache(object):
+    """A thread-safe, bounded, least-recently-used mapping."""
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                return default
+            self._data[key] = value
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,113 @@
+from asylum.classes.intervals import IntervalIndex
+from asylum.classes.models import Session, SessionOccurrence, TeachingOccurrence
+from collections import defaultdict, namedtuple
+
+# resource is the ID of the room or instructor that is double-booked
+Conflict = namedtuple('Conflict', ('resource', 'session', 'start', 'end', 'other_session', 'other_start', 'other_end'))
+
+def scheduled_occurrences():
+    """The stored occurrences of every session that still takes up a room."""
+    return SessionOccurrence.objects.exclude(session__state=Session.STATE_CANCELED)
+
+def build_indexes(rows):
+    """Builds an IntervalIndex for each resource in (resource, session, start, end) rows.
+
+    Intervals are keyed by session ID.
+    """
+    intervals = defaultdict(list)
+    for resource_id, session_id, start, end in rows:
+        intervals[resource_id].append((start, end, session_id))
+    return dict((resource_id, IntervalIndex(i)) for resource_id, i in intervals.items())
+
+def room_indexes(occurrences, rooms=None):
+    """An IntervalIndex of the given occurrences for each room they use, or
+    for each of the given rooms.
+    """
+    # Each filter() on the rooms would join them again, repeating every
+    # occurrence of a session in several rooms, so there's only the one.
+    if rooms is None:
+        occurrences = occurrences.filter(session__room__isnull=False)
+    else:
+        occurrences = occurrences.filter(session__room__in=rooms)
+    return build_indexes(occurrences.values_list('session__room', 'session', 'start', 'end'))
+
+def instructor_indexes(teaching):
+    """An IntervalIndex of the given teaching occurrences for each instructor."""
+    return build_indexes(teaching.values_list('instructor', 'session', 'start', 'end'))
+
+def find_conflicts(occurrences, resources, indexes, session_id):
+    conflicts = []
+    for resource in resources:
+        index = indexes.get(resource.pk)
+        if not index:
+            continue
+        for start, end in occurrences:
+            for other_start, other_end, other_session in index.overlapping(start, end):
+                conflicts.append(Conflict(resource.pk, session_id, start, end, other_session, other_start, other_end))
+    return conflicts
+
+def span_filter(occurrences):
+    """Lookups for stored occurrences within the span of some (start, end) pairs."""
+    return {
+        'start__lt': max(end for start, end in occurrences),
+        'end__gt': min(start for start, end in occurrences),
+    }
+
+def room_conflicts(occurrences, rooms, session_id=None):
+    """Finds where the given occurrences would double-book any of the rooms.
+
+    occurrences are (start, end) pairs for the session with the given ID, which
+    may be unsaved. Only the stored occurrences of other sessions in those
+    rooms within the span of the given ones are loaded, so checking a single
+    session doesn't depend on the size of the whole schedule.
+    """
+    occurrences = list(occurrences)
+    rooms = list(rooms)
+    if not occurrences or not rooms:
+        return []
+
+    nearby = scheduled_occurrences().filter(**span_filter(occurrences))
+    if session_id:
+        nearby = nearby.exclude(session=session_id)
+    return find_conflicts(occurrences, rooms, room_indexes(nearby, rooms), session_id)
+
+def instructor_conflicts(occurrences, instructors, session_id=None):
+    """Finds where the given occurrences overlap what the instructors already teach.
+
+    This reads the instructors' timelines in the same way room_conflicts()
+    reads the rooms' schedules.
+    """
+    occurrences = list(occurrences)
+    instructors = list(instructors)
+    if not occurrences or not instructors:
+        return []
+
+    nearby = TeachingOccurrence.objects.filter(instructor__in=instructors, **span_filter(occurrences))
+    if session_id:
+        nearby = nearby.exclude(session=session_id)
+    return find_conflicts(occurrences, instructors, instructor_indexes(nearby), session_id)
+
+def all_conflicts(indexes):
+    conflicts = []
+    for resource_id, index in indexes.items():
+        for a, b in index.conflicts():
+            conflicts.append(Conflict(resource_id, a[2], a[0], a[1], b[2], b[0], b[1]))
+    return sorted(conflicts, key=lambda c: c.start)
+
+def all_room_conflicts(start=None, end=None):
+    """Every double booking of every room, optionally within a period."""
+    occurrences = scheduled_occurrences()
+    if start:
+        occurrences = occurrences.filter(end__gt=start)
+    if end:
+        occurrences = occurrences.filter(start__lt=end)
+    return all_conflicts(room_indexes(occurrences))
+
+def all_instructor_conflicts(start=None, end=None):
+    """Every instructor who is down to teach two things at once."""
+    teaching = TeachingOccurrence.objects.all()
+    if start:
+        teaching = teaching.filter(end__gt=start)
+    if end:
+        teaching = teaching.filter(start__lt=end)
+    return all_conflicts(instructor_indexes(teaching))
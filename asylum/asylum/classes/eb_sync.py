@@ -0,0 +1,245 @@
+from asylum.classes.instrumentation import eb
+from asylum.classes.models import SyncCursor, SyncJob
+from asylum.classes.utils import check_response
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django_eventbrite.models import Attendee, Event, TicketType
+from django_eventbrite.utils import e2l
+import threading
+import time
+
+# Eventbrite allows a couple of thousand requests an hour per token.
+DEFAULT_RATE = 2.0
+DEFAULT_WORKERS = 4
+
+# how long a sync of the change feeds may hold its lease without progress
+SYNC_LEASE = timedelta(minutes=30)
+
+SyncResult = namedtuple('SyncResult', ('eb_id', 'seconds', 'attendees', 'error'))
+
+class RateLimiter(object):
+    """A thread-safe token bucket allowing rate requests a second."""
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = burst
+        self._tokens = burst
+        self._last = time.time()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        while True:
+            with self._lock:
+                now = time.time()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+
+def fetch_event(client, limiter, eb_id, attendees=True):
+    """Fetches an event and (optionally) all pages of its attendees."""
+    limiter.wait()
+    event = check_response(client.get_event(eb_id))
+    loaded = []
+    page = 1
+    while attendees:
+        limiter.wait()
+        result = check_response(client.get_event_attendees(eb_id, page=page))
+        loaded.extend(result.get('attendees', []))
+        if page >= result.get('pagination', {}).get('page_count', 1):
+            break
+        page += 1
+    return event, loaded
+
+def store_event(event, attendees):
+    """Writes a fetched event and its attendees in a single transaction."""
+    with transaction.atomic():
+        e2l(Event, 'event', event)
+        for attendee in attendees:
+            e2l(Attendee, 'attendee', attendee)
+
+def _timed(func, *args):
+    start = time.time()
+    try:
+        return func(*args), None, time.time() - start
+    except Exception as e:
+        return None, e, time.time() - start
+
+def sync_events(eb_ids, attendees=True, client=eb, workers=DEFAULT_WORKERS, rate=DEFAULT_RATE):
+    """Reloads the given Eventbrite events, returning a SyncResult for each.
+
+    Requests to Eventbrite are made concurrently, but no faster than rate a
+    second. Results are written from the calling thread as they arrive, so a
+    failure only affects the event it happened on.
+    """
+    limiter = RateLimiter(rate, burst=workers)
+    results = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for eb_id in eb_ids:
+            future = executor.submit(_timed, fetch_event, client, limiter, eb_id, attendees)
+            futures[future] = eb_id
+        for future in as_completed(futures):
+            eb_id = futures[future]
+            fetched, error, seconds = future.result()
+            if not error:
+                event, loaded = fetched
+                _, error, write_seconds = _timed(store_event, event, loaded)
+                seconds += write_seconds
+            if error:
+                results.append(SyncResult(eb_id, seconds, 0, error))
+            else:
+                results.append(SyncResult(eb_id, seconds, len(loaded), None))
+    return results
+
+def summarize(results):
+    """A one-line summary of a sync, for admin messages and logs."""
+    failed = [r for r in results if r.error]
+    loaded = sum(r.attendees for r in results)
+    slowest = max(results, key=lambda r: r.seconds) if results else None
+    summary = "Synced {0} events ({1} attendees)".format(len(results) - len(failed), loaded)
+    if slowest:
+        summary += "; slowest was {0} at {1:.1f}s".format(slowest.eb_id, slowest.seconds)
+    if failed:
+        summary += "; failed: {0}".format(", ".join(str(r.eb_id) for r in failed))
+    return summary
+
+def enqueue_sync(eb_ids, attendees=True, user=None):
+    """Queues a reload of the given events for the sync_worker command."""
+    return SyncJob.objects.create(eb_ids=','.join(str(eb_id) for eb_id in eb_ids),
+            attendees=attendees, requested_by=user)
+
+def claim_sync_job():
+    """Marks the oldest pending job as running and returns it, if any.
+
+    The job is claimed with a conditional update, so several workers can
+    drain the queue without running a job twice.
+    """
+    for pk in SyncJob.objects.filter(state=SyncJob.STATE_PENDING).order_by('created').values_list('pk', flat=True)[:10]:
+        if SyncJob.objects.filter(pk=pk, state=SyncJob.STATE_PENDING).update(
+                state=SyncJob.STATE_RUNNING, modified=timezone.now()):
+            return SyncJob.objects.get(pk=pk)
+    return None
+
+def run_sync_job(job, client=eb, workers=DEFAULT_WORKERS, rate=DEFAULT_RATE):
+    results = sync_events(job.event_ids(), attendees=job.attendees, client=client, workers=workers, rate=rate)
+    job.summary = summarize(results)
+    job.state = SyncJob.STATE_FAILED if any(r.error for r in results) else SyncJob.STATE_DONE
+    job.save()
+    return job
+
+def drain_sync_jobs(client=eb, workers=DEFAULT_WORKERS, rate=DEFAULT_RATE):
+    """Runs every pending sync job, returning them."""
+    ran = []
+    job = claim_sync_job()
+    while job:
+        ran.append(run_sync_job(job, client, workers, rate))
+        job = claim_sync_job()
+    return ran
+
+def store_events(events):
+    with transaction.atomic():
+        for event in events:
+            e2l(Event, 'event', event)
+            for ticket_class in event.get('ticket_classes', []):
+                e2l(TicketType, 'ticket_class', ticket_class)
+
+def store_attendees(attendees):
+    with transaction.atomic():
+        for attendee in attendees:
+            e2l(Attendee, 'attendee', attendee)
+
+# (resource, client method, response key, extra parameters, store function)
+# Events come first so that new attendees can find their events.
+CHANGE_FEEDS = (
+    ('events', 'get_user_owned_events', 'events', {'expand': 'ticket_classes'}, store_events),
+    ('attendees', 'get_user_owned_event_attendees', 'attendees', {}, store_attendees),
+)
+
+def format_changed(value):
+    return value.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def fetch_changes(client, cursor, method, key, params):
+    """Everything in one feed changed since the cursor, read page by page,
+    and the latest change among them.
+    """
+    params = dict(params)
+    if cursor.high_water:
+        params['changed_since'] = format_changed(cursor.high_water)
+    high_water = cursor.high_water
+    changed = []
+    page = 1
+    while True:
+        result = check_response(getattr(client, method)(cursor.organizer, page=page, **params))
+        for item in result.get(key, []):
+            item_changed = parse_datetime(item['changed'])
+            if cursor.high_water and item_changed < cursor.high_water:
+                continue
+            changed.append(item)
+            high_water = max(high_water, item_changed) if high_water else item_changed
+        if page >= result.get('pagination', {}).get('page_count', 1):
+            return changed, high_water
+        page += 1
+
+def sync_feed(client, cursor, method, key, params, store):
+    """Stores everything in one feed changed since the cursor.
+
+    The feed is read before anything is written, so the database isn't
+    locked while waiting on Eventbrite. The changes are then stored and the
+    cursor advanced in one transaction, so an interrupted run is simply
+    repeated next time.
+    """
+    changed, high_water = fetch_changes(client, cursor, method, key, params)
+    with transaction.atomic():
+        store(changed)
+        cursor.high_water = high_water
+        cursor.last_run = timezone.now()
+        # the lease is another run's business
+        cursor.save(update_fields=['high_water', 'last_run'])
+    return len(changed)
+
+def lease_cursor(organizer):
+    """The cursor that holds the lease on syncing an organizer."""
+    return SyncCursor.objects.filter(organizer=organizer, resource=CHANGE_FEEDS[0][0])
+
+def claim_lease(organizer):
+    """Takes the lease on syncing an organizer, returning whether it was free.
+
+    The lease is taken with a conditional update, so only one of several
+    overlapping runs gets it, and it expires so that a run that died
+    doesn't hold it forever.
+    """
+    now = timezone.now()
+    return bool(lease_cursor(organizer).filter(Q(locked_until=None) | Q(locked_until__lt=now)).update(
+            locked_until=now + SYNC_LEASE))
+
+def sync_changes(organizer='me', client=eb):
+    """Stores the events, ticket classes and attendees changed since last time.
+
+    Returns a dict of the number of changed items per resource, or None if
+    another sync of the same organizer is already running. Overlapping runs,
+    in any process, are kept apart by a lease on the organizer's cursors.
+    Each feed is committed as soon as it's stored, so a failure only loses
+    the progress of the feed that failed.
+    """
+    for resource, method, key, params, store in CHANGE_FEEDS:
+        # get_or_create tolerates another run creating the cursor first
+        SyncCursor.objects.get_or_create(organizer=organizer, resource=resource)
+    if not claim_lease(organizer):
+        return None
+    try:
+        cursors = dict((cursor.resource, cursor) for cursor in SyncCursor.objects.filter(organizer=organizer))
+        counts = {}
+        for resource, method, key, params, store in CHANGE_FEEDS:
+            counts[resource] = sync_feed(client, cursors[resource], method, key, params, store)
+            lease_cursor(organizer).update(locked_until=timezone.now() + SYNC_LEASE)
+        return counts
+    finally:
+        lease_cursor(organizer).update(locked_until=None)
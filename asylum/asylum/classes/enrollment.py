@@ -0,0 +1,37 @@
+"""Upcoming sessions that haven't sold enough tickets to run.
+
+A session is under-enrolled when fewer tickets have been sold than its
+min_enrollment. Finding them is a single query over the sessions' stored
+first meeting times, with the sales counted by a subquery on the attendees,
+however many sessions there are.
+"""
+from asylum.classes.models import Session
+from asylum.classes.sales import column, sales_selects, with_sales
+from django.conf import settings
+from django.core.mail import send_mail
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+def under_enrolled(start, end):
+    """Public sessions first meeting within the period that have sold fewer
+    tickets than their minimum, soonest first, with their quantity_sold.
+    """
+    sold = sales_selects(column(Session, 'event'))['quantity_sold']
+    sessions = Session.objects.filter(state=Session.STATE_PUBLIC,
+            first_start__gte=start, first_start__lt=end)
+    sessions = with_sales(sessions.select_related('event'), 'event').extra(
+            where=['({0}) < {1}'.format(sold, column(Session, 'min_enrollment'))])
+    return sessions.order_by('first_start')
+
+def send_digest(sessions, days, recipients):
+    """Emails a digest of the under-enrolled sessions, returning its text."""
+    subject = "{0} under-enrolled session{1} in the next {2} days".format(
+            len(sessions), '' if len(sessions) == 1 else 's', days)
+    body = render_to_string('low_enrollment_digest.txt', {
+        'sessions': sessions,
+        'days': days,
+        'now': timezone.now(),
+        })
+    if recipients:
+        send_mail(subject, body, settings.DEFAULT_FROM_EMAIL, recipients)
+    return body
@@ -0,0 +1,158 @@
+"""Streaming CSV exports of events and sessions.
+
+Rows are written as they are read, a chunk of objects at a time, so that an
+export uses the same memory however many rows it has, and the download starts
+right away.
+"""
+from asylum.classes.caching import LRUCache, digest
+from asylum.classes.models import Session
+from asylum.classes.sales import SALES_FIELDS, with_sales
+from django.http import StreamingHttpResponse
+from django_eventbrite.models import Event
+import csv
+
+CHUNK_SIZE = 500
+
+class Echo(object):
+    """A file-like object that hands back what is written to it."""
+    def write(self, value):
+        return value
+
+def csv_response(filename, header, rows):
+    writer = csv.writer(Echo())
+    def lines():
+        yield writer.writerow(header)
+        for row in rows:
+            yield writer.writerow(row)
+    response = StreamingHttpResponse(lines(), content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="{0}"'.format(filename)
+    return response
+
+def chunked(queryset, size=CHUNK_SIZE):
+    """Iterates over a queryset a chunk at a time, in primary key order.
+
+    Each chunk is a separate keyset query, so any prefetching is done per
+    chunk and never more than one chunk is held in memory.
+    """
+    queryset = queryset.order_by('pk')
+    last = None
+    while True:
+        chunk = queryset if last is None else queryset.filter(pk__gt=last)
+        chunk = list(chunk[:size])
+        if not chunk:
+            return
+        for obj in chunk:
+            yield obj
+        last = chunk[-1].pk
+
+class HTMLToText(object):
+    """Converts HTML to text, converting each distinct document only once."""
+    def __init__(self, maxsize=1024):
+        self.converted = LRUCache(maxsize)
+
+    def __call__(self, html):
+        if not html:
+            return ''
+        key = digest(html)
+        text = self.converted.get(key)
+        if text is None:
+            from html2text import HTML2Text
+            text = HTML2Text().handle(html)
+            self.converted.set(key, text)
+        return text
+
+def event_fields():
+    return [field for field in Event._meta.concrete_fields]
+
+def event_rows(events):
+    fields = event_fields()
+    to_text = HTMLToText()
+    for event in chunked(with_sales(events, prefix='sales_')):
+        row = []
+        for field in fields:
+            value = getattr(event, field.attname)
+            if field.name == 'description':
+                value = to_text(value)
+            row.append(value)
+        row.extend(getattr(event, 'sales_' + name) for name in SALES_FIELDS)
+        yield row
+
+def export_events(events, filename='events-export.csv'):
+    header = [field.name for field in event_fields()] + list(SALES_FIELDS)
+    return csv_response(filename, header, event_rows(events))
+
+SESSION_HEADER = (
+    'id',
+    'name',
+    'state',
+    'instructors',
+    'start',
+    'end',
+    'meetings',
+    'eb_id',
+    'ticket_price',
+    'min_enrollment',
+    'max_enrollment',
+) + SALES_FIELDS
+
+def session_rows(sessions):
+    # start afresh from just the IDs, so it doesn't matter what the given
+    # queryset was already annotated with
+    sessions = Session.objects.filter(pk__in=sessions.values_list('pk', flat=True))
+    sessions = sessions.select_related('event').prefetch_related('instructors')
+    for session in chunked(with_sales(sessions, 'event')):
+        row = [
+            session.pk,
+            session.name,
+            session.state,
+            session.instructor_names(),
+            session.first_start,
+            session.last_end,
+            session.meeting_count,
+            session.eb_id(),
+            session.ticket_price.amount,
+            session.min_enrollment,
+            session.max_enrollment,
+        ]
+        row.extend(getattr(session, name) for name in SALES_FIELDS)
+        yield row
+
+def export_sessions(sessions, filename='sessions-export.csv'):
+    return csv_response(filename, SESSION_HEADER, session_rows(sessions))
+
+ROLLUP_HEADER = (
+    'term',
+    'dimension',
+    'name',
+    'sessions',
+    'tickets_sold',
+    'tickets_refunded',
+    'gross_sales',
+    'eventbrite_fees',
+    'instructor_payout',
+    'min_enrollment',
+    'max_enrollment',
+    'sessions_under_minimum',
+    'fill_ratio',
+)
+
+def rollup_rows(rollups):
+    for rollup in chunked(rollups):
+        yield [
+            rollup.term,
+            rollup.dimension,
+            rollup.label,
+            rollup.sessions,
+            rollup.tickets_sold,
+            rollup.tickets_refunded,
+            rollup.gross_sales,
+            rollup.eventbrite_fees,
+            rollup.instructor_payout,
+            rollup.min_enrollment,
+            rollup.max_enrollment,
+            rollup.sessions_under_minimum,
+            '{0:.3f}'.format(rollup.fill_ratio),
+        ]
+
+def export_rollups(rollups, filename='rollups-export.csv'):
+    return csv_response(filename, ROLLUP_HEADER, rollup_rows(rollups))
@@ -0,0 +1,113 @@
+"""iCalendar feeds of the public sessions.
+
+Feeds are built from the stored occurrences and cached under an ETag derived
+from the newest change to any session in the feed, so the calendar clients
+that poll them are mostly answered with a 304 after a single query.
+"""
+from asylum.classes.caching import digest
+from asylum.classes.models import Category, Room, Session, SessionOccurrence
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.http import Http404, HttpResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import condition
+from icalendar import Calendar, Event
+
+FEED_CACHE_TIMEOUT = 60 * 60 * 24
+
+def feed_sessions(kind, id):
+    """Every session in a feed, whatever its state."""
+    sessions = Session.objects.all()
+    if kind == 'category':
+        sessions = sessions.filter(category=id)
+    elif kind == 'room':
+        sessions = sessions.filter(room=id)
+    return sessions
+
+# the object each kind of feed is for, when it's for one
+FEED_MODELS = {
+    'category': Category,
+    'room': Room,
+}
+
+def feed_stamp(request, kind, id=None):
+    """The (etag, last modified) of a feed, computed once per request.
+
+    This covers sessions in every state, so that a session leaving the feed
+    changes it too. The category or room a feed is for is read in the same
+    query, so a feed for one that doesn't exist is never a 304.
+    """
+    if not hasattr(request, 'feed_stamp'):
+        if kind in FEED_MODELS:
+            stamp = FEED_MODELS[kind].objects.filter(pk=id).aggregate(
+                    found=Count('pk', distinct=True),
+                    name=Max('name'),
+                    count=Count('session'),
+                    modified=Max('session__modified'),
+                    calendar_modified=Max('session__calendar_event__updated_on'),
+                    )
+            if not stamp['found']:
+                raise Http404("No such {0}".format(kind))
+        else:
+            stamp = feed_sessions(kind, id).aggregate(
+                    count=Count('pk'),
+                    modified=Max('modified'),
+                    calendar_modified=Max('calendar_event__updated_on'),
+                    )
+            stamp['name'] = None
+        modified = [d for d in (stamp['modified'], stamp['calendar_modified']) if d]
+        last_modified = max(modified) if modified else None
+        etag = digest(u'{0}:{1}:{2}:{3}:{4}:{5}'.format(kind, id, stamp['name'], stamp['count'],
+            stamp['modified'], stamp['calendar_modified']))
+        request.feed_stamp = (etag, last_modified)
+    return request.feed_stamp
+
+def feed_etag(request, kind, id=None):
+    return feed_stamp(request, kind, id)[0]
+
+def feed_last_modified(request, kind, id=None):
+    return feed_stamp(request, kind, id)[1]
+
+def build_calendar(sessions, name):
+    occurrences = SessionOccurrence.objects.filter(
+            session__in=sessions.filter(state=Session.STATE_PUBLIC),
+            ).select_related('session__event').prefetch_related('session__room').order_by('start')
+
+    calendar = Calendar()
+    calendar.add('prodid', "-//Artisan's Asylum//Courses//EN")
+    calendar.add('version', '2.0')
+    calendar.add('x-wr-calname', name)
+    for occurrence in occurrences:
+        session = occurrence.session
+        event = Event()
+        event.add('uid', 'session-{0}-{1}@courses.artisansasylum.com'.format(session.pk, occurrence.ordinal))
+        event.add('summary', session.name)
+        event.add('dtstart', occurrence.start)
+        event.add('dtend', occurrence.end)
+        event.add('dtstamp', session.modified)
+        event.add('description', session.blurb)
+        rooms = ', '.join(room.name for room in session.room.all())
+        if rooms:
+            event.add('location', rooms)
+        if session.event and session.event.eb_url:
+            event.add('url', session.event.eb_url)
+        calendar.add_component(event)
+    return calendar.to_ical()
+
+def feed_name(kind, id):
+    if kind == 'category':
+        return "Asylum Courses: {0}".format(get_object_or_404(Category, pk=id))
+    if kind == 'room':
+        return "Asylum Courses in {0}".format(get_object_or_404(Room, pk=id))
+    return 'Asylum Courses'
+
+@condition(etag_func=feed_etag, last_modified_func=feed_last_modified)
+def session_feed(request, kind, id=None):
+    etag = feed_etag(request, kind, id)
+    key = 'asylum:feed:{0}'.format(etag)
+    body = cache.get(key)
+    if body is None:
+        name = feed_name(kind, id)
+        body = build_calendar(feed_sessions(kind, id), name)
+        cache.set(key, body, FEED_CACHE_TIMEOUT)
+    return HttpResponse(body, content_type='text/calendar; charset=utf-8')
@@ -0,0 +1,72 @@
+from asylum.classes.conflicts import instructor_conflicts, room_conflicts
+from asylum.classes.models import Session
+from asylum.classes.scheduling import FREQUENCIES
+from datetime import timedelta
+from decimal import Decimal
+from django import forms
+from django.utils import formats, timezone
+
+WEEKDAY_CHOICES = (
+    (0, 'Monday'),
+    (1, 'Tuesday'),
+    (2, 'Wednesday'),
+    (3, 'Thursday'),
+    (4, 'Friday'),
+    (5, 'Saturday'),
+    (6, 'Sunday'),
+)
+
+class ScheduleTermForm(forms.Form):
+    first_day = forms.DateField(help_text='Sessions start on the first matching day on or after this')
+    start_time = forms.TimeField()
+    hours = forms.DecimalField(max_digits=4, decimal_places=2, min_value=Decimal('0.25'),
+            help_text='The length of each meeting')
+    frequency = forms.ChoiceField(choices=[(f, f.title()) for f in sorted(FREQUENCIES)], initial='WEEKLY')
+    weekdays = forms.TypedMultipleChoiceField(choices=WEEKDAY_CHOICES, coerce=int, required=False,
+            widget=forms.CheckboxSelectMultiple)
+
+    def schedule_kwargs(self):
+        data = self.cleaned_data
+        return {
+            'first_day': data['first_day'],
+            'start_time': data['start_time'],
+            'duration': timedelta(hours=float(data['hours'])),
+            'frequency': data['frequency'],
+            'weekdays': data['weekdays'],
+        }
+
+class SessionAdminForm(forms.ModelForm):
+    """Refuses to save a session that would double-book a room or instructor."""
+    class Meta:
+        model = Session
+        fields = '__all__'
+
+    def related(self, name):
+        if name in self.cleaned_data:
+            return list(self.cleaned_data[name])
+        return list(getattr(self.instance, name).all()) if self.instance.pk else []
+
+    def clean(self):
+        cleaned_data = super(SessionAdminForm, self).clean()
+        calendar_event = cleaned_data.get('calendar_event')
+        state = cleaned_data.get('state', self.instance.state)
+        if not calendar_event or state == Session.STATE_CANCELED:
+            return cleaned_data
+
+        occurrences = Session(calendar_event=calendar_event).expand_occurrences() or []
+        occurrences = [(o.start, o.end) for o in occurrences]
+        rooms = self.related('room')
+        instructors = self.related('instructors')
+        conflicts = [(c, rooms, "{0} is already booked for {1} at {2}")
+                for c in room_conflicts(occurrences, rooms, self.instance.pk)]
+        conflicts += [(c, instructors, "{0} is already teaching {1} at {2}")
+                for c in instructor_conflicts(occurrences, instructors, self.instance.pk)]
+        if conflicts:
+            others = Session.objects.in_bulk(set(c.other_session for c, resources, message in conflicts))
+            raise forms.ValidationError([
+                message.format(
+                    dict((r.pk, r) for r in resources)[c.resource],
+                    others[c.other_session],
+                    formats.date_format(timezone.localtime(c.other_start), 'DATETIME_FORMAT'))
+                for c, resources, message in conflicts])
+        return cleaned_data
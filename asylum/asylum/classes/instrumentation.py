@@ -0,0 +1,93 @@
+"""Where the time goes in a request.
+
+The hooks here time the expensive parts of a request: recurrence
+expansion, markdown, TemplateText substitution and calls to Eventbrite.
+They only record anything during a request that InstrumentationMiddleware
+has chosen to sample, so elsewhere they cost next to nothing.
+"""
+from collections import OrderedDict
+import functools
+import threading
+import time
+
+_local = threading.local()
+
+class Timings(object):
+    """The time spent in each instrumented part of one request."""
+    def __init__(self):
+        self.started = time.time()
+        self.parts = OrderedDict()
+
+    def add(self, name, seconds):
+        total, count = self.parts.get(name, (0.0, 0))
+        self.parts[name] = (total + seconds, count + 1)
+
+    def elapsed(self):
+        return time.time() - self.started
+
+def start():
+    _local.timings = Timings()
+    return _local.timings
+
+def stop():
+    timings = current()
+    _local.timings = None
+    return timings
+
+def current():
+    """The Timings of the request being sampled on this thread, if any."""
+    return getattr(_local, 'timings', None)
+
+class timer(object):
+    """Adds the time spent in a block to the current request's timings."""
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.timings = current()
+        self.start = time.time()
+
+    def __exit__(self, *exc_info):
+        if self.timings is not None:
+            self.timings.add(self.name, time.time() - self.start)
+
+def instrumented(name):
+    """Decorates a function to time its calls as the named part."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if current() is None:
+                return func(*args, **kwargs)
+            with timer(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def eventbrite_client():
+    # imported on first use, as most processes never call Eventbrite
+    from django_eventbrite.utils import eb
+    return eb
+
+class InstrumentedClient(object):
+    """Wraps an Eventbrite client to time each call it makes.
+
+    Given a load function in place of a client, it calls it for the client
+    the first time it's used.
+    """
+    def __init__(self, client=None, name='eventbrite', load=None):
+        self._client = client
+        self._load = load
+        self._name = name
+
+    def __getattr__(self, attr):
+        if attr.startswith('__'):
+            raise AttributeError(attr)
+        if self._client is None:
+            self._client = self._load()
+        value = getattr(self._client, attr)
+        if callable(value):
+            return instrumented(self._name)(value)
+        return value
+
+# the client to use in place of django_eventbrite's
+eb = InstrumentedClient(load=eventbrite_client)
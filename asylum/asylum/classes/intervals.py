@@ -0,0 +1,67 @@
+from bisect import bisect_left, bisect_right
+
+class IntervalIndex(object):
+    """A set of keyed, half-open [start, end) intervals, sorted by start.
+
+    Overlaps with an interval are found in O(log n + k): anything overlapping
+    it must start before it ends, and no earlier than the longest interval
+    in the index before it starts.
+    """
+    def __init__(self, intervals=()):
+        self._starts = []
+        self._intervals = []
+        self._longest = None
+        for start, end, key in sorted(intervals, key=lambda i: i[0]):
+            self._append(start, end, key)
+
+    def _append(self, start, end, key):
+        self._starts.append(start)
+        self._intervals.append((start, end, key))
+        self._note_length(end - start)
+
+    def _note_length(self, length):
+        if self._longest is None or length > self._longest:
+            self._longest = length
+
+    def add(self, start, end, key):
+        i = bisect_right(self._starts, start)
+        self._starts.insert(i, start)
+        self._intervals.insert(i, (start, end, key))
+        self._note_length(end - start)
+
+    def remove(self, key):
+        """Removes every interval with the given key."""
+        kept = [i for i in self._intervals if i[2] != key]
+        self._intervals = kept
+        self._starts = [i[0] for i in kept]
+
+    def overlapping(self, start, end, exclude=None):
+        """The (start, end, key) intervals overlapping [start, end)."""
+        if not self._intervals:
+            return []
+        lo = bisect_left(self._starts, start - self._longest)
+        hi = bisect_left(self._starts, end)
+        return [i for i in self._intervals[lo:hi] if i[1] > start and i[2] != exclude]
+
+    def conflicts(self):
+        """Every pair of overlapping intervals with different keys.
+
+        This is a single sweep over the intervals in start order, keeping
+        only those that haven't ended yet.
+        """
+        active = []
+        pairs = []
+        for interval in self._intervals:
+            start = interval[0]
+            active = [a for a in active if a[1] > start]
+            for other in active:
+                if other[2] != interval[2]:
+                    pairs.append((other, interval))
+            active.append(interval)
+        return pairs
+
+    def __len__(self):
+        return len(self._intervals)
+
+    def __iter__(self):
+        return iter(self._intervals)
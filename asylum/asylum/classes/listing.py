@@ -0,0 +1,18 @@
+from asylum.classes.models import Category, Course, Session
+from django.db.models import Prefetch
+
+def catalogue():
+    """All categories, with the courses and sessions shown in the listing.
+
+    The whole category → course → session tree is loaded with a fixed number
+    of queries, along with each session's Eventbrite event, so the cost of the
+    listing doesn't grow with the size of the catalogue. The sessions' meeting
+    times are shown from their stored summaries.
+    """
+    sessions = Session.objects.select_related('event').order_by('first_start', 'pk')
+    courses = Course.objects.order_by('name').prefetch_related(
+            Prefetch('sessions', queryset=sessions),
+        )
+    return Category.objects.order_by('name').prefetch_related(
+            Prefetch('course_set', queryset=courses),
+        )
@@ -0,0 +1,10 @@
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+import datetime
+
+def parse_day(value):
+    """The start of the given YYYY-MM-DD day in the current time zone, if any."""
+    if not value:
+        return None
+    return timezone.make_aware(datetime.datetime.combine(parse_date(value), datetime.time()),
+            timezone.get_current_timezone())
@@ -0,0 +1,54 @@
+from asylum.classes.benchmarks import BENCHMARKS, REGRESSION_THRESHOLD, regressions
+from collections import OrderedDict
+from django.core.management.base import BaseCommand, CommandError
+from optparse import make_option
+import json
+
+class Command(BaseCommand):
+    args = '[benchmark ...]'
+    help = 'Runs the performance benchmarks, or just the named ones'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--size', type='int',
+            help='The size of the synthetic data each benchmark runs on'),
+        make_option('--json', dest='output',
+            help='Save the results to this JSON file'),
+        make_option('--compare',
+            help='Report regressions against the results saved in this JSON file'),
+        make_option('--threshold', type='float', default=REGRESSION_THRESHOLD,
+            help='The fraction by which times and memory can grow before they count as regressions'),
+    )
+
+    def handle(self, *names, **options):
+        unknown = set(names) - set(BENCHMARKS)
+        if unknown:
+            raise CommandError("Unknown benchmarks: {0}. Choose from {1}".format(
+                ', '.join(sorted(unknown)), ', '.join(BENCHMARKS)))
+
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+
+        kwargs = {}
+        if options['size']:
+            kwargs['size'] = options['size']
+
+        results = OrderedDict()
+        for name in names or BENCHMARKS:
+            self.stdout.write(name)
+            results[name] = BENCHMARKS[name](**kwargs)
+            for measure, value in results[name].items():
+                self.stdout.write("  {0}: {1}".format(measure, value))
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+
+        if baseline is not None:
+            worse = regressions(baseline, results, options['threshold'])
+            for name, measure, old, new in worse:
+                self.stdout.write("REGRESSION {0} {1}: {2} -> {3}".format(name, measure, old, new))
+            if worse:
+                raise CommandError("{0} measurements regressed".format(len(worse)))
+            self.stdout.write("No regressions")
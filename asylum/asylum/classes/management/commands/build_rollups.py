@@ -0,0 +1,15 @@
+from asylum.classes.rollups import build_rollups, term_bounds
+from django.core.management.base import BaseCommand, CommandError
+
+class Command(BaseCommand):
+    args = '[term ...]'
+    help = 'Rebuilds the enrollment and revenue rollups of the given terms (e.g. 2015-Q1), or of them all'
+
+    def handle(self, *terms, **options):
+        for term in terms:
+            try:
+                term_bounds(term)
+            except ValueError as e:
+                raise CommandError(str(e))
+        built = build_rollups(list(terms) or None)
+        self.stdout.write("Built the rollups of {0} terms".format(len(built)))
@@ -0,0 +1,28 @@
+from asylum.classes.management import parse_day
+from asylum.classes.payouts import create_batch
+from django.core.management.base import BaseCommand, CommandError
+from optparse import make_option
+
+class Command(BaseCommand):
+    help = "Pays instructors for the sessions that ended in a period and haven't been paid"
+
+    option_list = BaseCommand.option_list + (
+        make_option('--from', dest='start',
+            help='Pay sessions that ended on or after this date (YYYY-MM-DD)'),
+        make_option('--to', dest='end',
+            help='Pay sessions that ended before this date (YYYY-MM-DD)'),
+    )
+
+    def handle(self, *args, **options):
+        start = parse_day(options['start'])
+        end = parse_day(options['end'])
+        if not start or not end:
+            raise CommandError('Both --from and --to are required')
+        batch = create_batch(start, end)
+        if batch is None:
+            self.stdout.write("There were no sessions to pay")
+            return
+        for line in batch.lines.select_related('instructor'):
+            self.stdout.write("{0}: {1} for {2} sessions".format(line.instructor, line.amount, line.sessions))
+        self.stdout.write("Batch {0}: {1} sessions, {2} in all".format(
+            batch.pk, batch.sessions.count(), batch.total))
@@ -0,0 +1,28 @@
+from asylum.classes.enrollment import send_digest, under_enrolled
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from optparse import make_option
+
+class Command(BaseCommand):
+    help = 'Emails a digest of public sessions starting soon that are below their minimum enrollment'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--days', type='int', default=14,
+            help='How many days ahead to look'),
+        make_option('--to', action='append', dest='recipients',
+            help='Who to email, in place of ASYLUM_LOW_ENROLLMENT_RECIPIENTS (repeatable)'),
+    )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        sessions = list(under_enrolled(now, now + timedelta(days=options['days'])))
+        if not sessions:
+            self.stdout.write("No sessions are under-enrolled")
+            return
+        recipients = options['recipients'] or settings.ASYLUM_LOW_ENROLLMENT_RECIPIENTS
+        digest = send_digest(sessions, options['days'], recipients)
+        if not recipients:
+            self.stdout.write(digest)
+        self.stdout.write("{0} sessions are under-enrolled".format(len(sessions)))
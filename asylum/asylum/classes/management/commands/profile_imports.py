@@ -0,0 +1,43 @@
+from asylum.classes.benchmarks import DJANGO_SETUP, cold_import
+from django.core.management.base import BaseCommand
+from optparse import make_option
+
+# the app's modules, and the dependencies that are slowest to import
+MODULES = (
+    'asylum.classes.views',
+    'asylum.classes.api',
+    'asylum.classes.feeds',
+    'asylum.classes.middleware',
+    'asylum.classes.utils',
+    'asylum.classes.export',
+    'asylum.classes.publishing',
+    'asylum.classes.eb_sync',
+    'asylum.classes.admin',
+    'django_eventbrite.utils',
+    'django_eventbrite.admin',
+    'import_export.admin',
+    'pagedown.widgets',
+    'html2text',
+    'icalendar',
+    'markdown_deux',
+)
+
+class Command(BaseCommand):
+    args = '[module ...]'
+    help = 'Times importing each module into a freshly set up process, slowest first'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--repeat', type='int', default=3,
+            help='The number of processes to time each import in, keeping the best'),
+    )
+
+    def handle(self, *modules, **options):
+        seconds, count = cold_import(DJANGO_SETUP, '', options['repeat'])
+        self.stdout.write("django.setup(): {0:.3f}s, {1} modules".format(seconds, count))
+
+        timings = []
+        for module in modules or MODULES:
+            seconds, count = cold_import('import {0}'.format(module), repeat=options['repeat'])
+            timings.append((seconds, count, module))
+        for seconds, count, module in sorted(timings, reverse=True):
+            self.stdout.write("{0}: {1:.3f}s, {2} modules".format(module, seconds, count))
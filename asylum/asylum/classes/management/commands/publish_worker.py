@@ -0,0 +1,24 @@
+from asylum.classes.publishing import drain
+from django.core.management.base import BaseCommand
+from optparse import make_option
+import time
+
+class Command(BaseCommand):
+    help = 'Publishes queued sessions to Eventbrite'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--workers', type='int', default=4,
+            help='The number of jobs to run concurrently'),
+        make_option('--interval', type='int', default=10,
+            help='Seconds to wait between polls of the queue'),
+        make_option('--once', action='store_true', default=False,
+            help='Exit once the queue has been drained instead of polling'),
+    )
+
+    def handle(self, *args, **options):
+        while True:
+            for job in drain(workers=options['workers']):
+                self.stdout.write("{0}: {1} (attempt {2})".format(job, job.state, job.attempts))
+            if options['once']:
+                break
+            time.sleep(options['interval'])
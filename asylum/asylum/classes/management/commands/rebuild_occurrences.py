@@ -0,0 +1,18 @@
+from asylum.classes.caching import invalidate_catalogue
+from asylum.classes.models import Session
+from django.core.management.base import BaseCommand
+
+class Command(BaseCommand):
+    help = 'Rebuilds the stored occurrences and instructor timelines of every scheduled session'
+
+    def handle(self, *args, **options):
+        sessions = Session.objects.exclude(calendar_event=None)
+        sessions = sessions.select_related('calendar_event__rule').prefetch_related('calendar_event__occurrence_set')
+        course_ids = set()
+        count = 0
+        for session in sessions:
+            session.rebuild_occurrences()
+            course_ids.add(session.course_id)
+            count += 1
+        invalidate_catalogue(course_ids)
+        self.stdout.write("Rebuilt occurrences for {0} sessions".format(count))
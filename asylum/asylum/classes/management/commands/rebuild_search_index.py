@@ -0,0 +1,12 @@
+from asylum.classes import search
+from asylum.classes.models import SearchDocument
+from django.core.management.base import BaseCommand
+
+class Command(BaseCommand):
+    help = 'Rebuilds the search documents of every course and session'
+
+    def handle(self, *args, **options):
+        search.create_index()
+        search.rebuild()
+        self.stdout.write("Indexed {0} courses and sessions{1}".format(
+            SearchDocument.objects.count(), '' if search.has_fts() else ' (without full-text search)'))
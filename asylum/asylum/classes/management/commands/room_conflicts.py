@@ -0,0 +1,27 @@
+from asylum.classes.conflicts import all_room_conflicts
+from asylum.classes.management import parse_day
+from asylum.classes.models import Room, Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from optparse import make_option
+
+class Command(BaseCommand):
+    help = 'Reports every room that is double-booked'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--from', dest='start',
+            help='Only report conflicts on or after this date (YYYY-MM-DD)'),
+        make_option('--to', dest='end',
+            help='Only report conflicts before this date (YYYY-MM-DD)'),
+    )
+
+    def handle(self, *args, **options):
+        conflicts = all_room_conflicts(parse_day(options['start']), parse_day(options['end']))
+        rooms = Room.objects.in_bulk(set(c.resource for c in conflicts))
+        sessions = Session.objects.in_bulk(set(c.session for c in conflicts) | set(c.other_session for c in conflicts))
+        for c in conflicts:
+            self.stdout.write("{0}: {1} ({2}) overlaps {3} ({4})".format(
+                rooms[c.resource],
+                sessions[c.session], timezone.localtime(c.start),
+                sessions[c.other_session], timezone.localtime(c.other_start)))
+        self.stdout.write("{0} conflicts".format(len(conflicts)))
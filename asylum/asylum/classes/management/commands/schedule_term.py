@@ -0,0 +1,46 @@
+from asylum.classes.forms import ScheduleTermForm
+from asylum.classes.models import Course
+from asylum.classes.scheduling import schedule_term
+from django.core.management.base import BaseCommand, CommandError
+from optparse import make_option
+
+class Command(BaseCommand):
+    args = '[course_id ...]'
+    help = 'Creates a draft session of each course, all meeting on the same pattern'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--first-day', dest='first_day',
+            help='Sessions start on the first matching day on or after this (YYYY-MM-DD)'),
+        make_option('--time', dest='start_time',
+            help='The start time of each meeting (HH:MM)'),
+        make_option('--hours',
+            help='The length of each meeting, in hours'),
+        make_option('--frequency', default='WEEKLY',
+            help='DAILY, WEEKLY or MONTHLY'),
+        make_option('--weekdays', default='',
+            help='Comma-separated days of the week to meet on, 0 being Monday'),
+        make_option('--category',
+            help='Schedule every current course in this category, or only those of the given courses'),
+    )
+
+    def handle(self, *course_ids, **options):
+        form = ScheduleTermForm({
+            'first_day': options['first_day'],
+            'start_time': options['start_time'],
+            'hours': options['hours'],
+            'frequency': options['frequency'],
+            'weekdays': [d for d in options['weekdays'].split(',') if d],
+            })
+        if not form.is_valid():
+            raise CommandError(form.errors.as_text())
+
+        if not course_ids and not options['category']:
+            raise CommandError('Give some course IDs or a --category')
+        courses = Course.objects.filter(state=Course.STATE_CURRENT)
+        if options['category']:
+            courses = courses.filter(category__name=options['category'])
+        if course_ids:
+            courses = courses.filter(pk__in=course_ids)
+
+        sessions = schedule_term(courses, **form.schedule_kwargs())
+        self.stdout.write("Created {0} draft sessions".format(len(sessions)))
@@ -0,0 +1,19 @@
+from asylum.classes.eb_sync import sync_changes
+from django.core.management.base import BaseCommand
+from optparse import make_option
+
+class Command(BaseCommand):
+    help = 'Loads the Eventbrite events and attendees changed since the last run'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--organizer', default='me',
+            help='The Eventbrite user whose events are synced'),
+    )
+
+    def handle(self, *args, **options):
+        counts = sync_changes(options['organizer'])
+        if counts is None:
+            self.stdout.write('Another sync is already running')
+            return
+        for resource, count in sorted(counts.items()):
+            self.stdout.write("{0}: {1} changed".format(resource, count))
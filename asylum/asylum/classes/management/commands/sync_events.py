@@ -0,0 +1,35 @@
+from asylum.classes.eb_sync import DEFAULT_RATE, DEFAULT_WORKERS, summarize, sync_events
+from django.core.management.base import BaseCommand, CommandError
+from django_eventbrite.models import Event
+from optparse import make_option
+
+class Command(BaseCommand):
+    args = '[eb_id ...]'
+    help = 'Reloads Eventbrite events and their attendees'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--all', action='store_true', default=False,
+            help='Reload every event in the database'),
+        make_option('--no-attendees', action='store_false', dest='attendees', default=True,
+            help="Only reload the events, not their attendees"),
+        make_option('--workers', type='int', default=DEFAULT_WORKERS,
+            help='The number of concurrent requests to Eventbrite'),
+        make_option('--rate', type='float', default=DEFAULT_RATE,
+            help='The maximum number of requests a second'),
+    )
+
+    def handle(self, *eb_ids, **options):
+        if options['all']:
+            eb_ids = Event.objects.values_list('eb_id', flat=True)
+        if not eb_ids:
+            raise CommandError('Give some Eventbrite event IDs or --all')
+
+        results = sync_events(list(eb_ids),
+                attendees=options['attendees'],
+                workers=options['workers'],
+                rate=options['rate'])
+        for result in sorted(results, key=lambda r: r.seconds, reverse=True):
+            self.stdout.write("{0}: {1} attendees in {2:.2f}s{3}".format(
+                result.eb_id, result.attendees, result.seconds,
+                " ({0})".format(result.error) if result.error else ''))
+        self.stdout.write(summarize(results))
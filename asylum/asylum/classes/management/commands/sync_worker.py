@@ -0,0 +1,26 @@
+from asylum.classes.eb_sync import DEFAULT_RATE, DEFAULT_WORKERS, drain_sync_jobs
+from django.core.management.base import BaseCommand
+from optparse import make_option
+import time
+
+class Command(BaseCommand):
+    help = 'Reloads the Eventbrite events queued from the admin'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--workers', type='int', default=DEFAULT_WORKERS,
+            help='The number of concurrent requests to Eventbrite'),
+        make_option('--rate', type='float', default=DEFAULT_RATE,
+            help='The maximum number of requests a second'),
+        make_option('--interval', type='int', default=10,
+            help='Seconds to wait between polls of the queue'),
+        make_option('--once', action='store_true', default=False,
+            help='Exit once the queue has been drained instead of polling'),
+    )
+
+    def handle(self, *args, **options):
+        while True:
+            for job in drain_sync_jobs(workers=options['workers'], rate=options['rate']):
+                self.stdout.write("{0}: {1}".format(job, job.summary))
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,36 @@
+from asylum.classes.conflicts import all_instructor_conflicts
+from asylum.classes.management import parse_day
+from asylum.classes.models import Instructor, Session
+from asylum.classes.teaching import teaching_load
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from optparse import make_option
+
+class Command(BaseCommand):
+    help = "Reports each instructor's teaching load, and any overlapping commitments"
+
+    option_list = BaseCommand.option_list + (
+        make_option('--from', dest='start',
+            help='Only count teaching on or after this date (YYYY-MM-DD)'),
+        make_option('--to', dest='end',
+            help='Only count teaching before this date (YYYY-MM-DD)'),
+    )
+
+    def handle(self, *args, **options):
+        start = parse_day(options['start'])
+        end = parse_day(options['end'])
+        load = list(teaching_load(start, end))
+        conflicts = all_instructor_conflicts(start, end)
+        instructors = Instructor.objects.in_bulk(
+                set(row['instructor'] for row in load) | set(c.resource for c in conflicts))
+
+        for row in load:
+            self.stdout.write("{0}: {1} hours over {2} meetings of {3} sessions".format(
+                instructors[row['instructor']], row['hours'], row['meetings'], row['sessions']))
+
+        sessions = Session.objects.in_bulk(set(c.session for c in conflicts) | set(c.other_session for c in conflicts))
+        for c in conflicts:
+            self.stdout.write("{0} is teaching {1} ({2}) and {3} ({4}) at once".format(
+                instructors[c.resource],
+                sessions[c.session], timezone.localtime(c.start),
+                sessions[c.other_session], timezone.localtime(c.other_start)))
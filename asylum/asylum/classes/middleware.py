@@ -0,0 +1,98 @@
+from asylum.classes import instrumentation
+from asylum.classes.models import RequestSample
+from django.conf import settings
+from django.core.urlresolvers import Resolver404, resolve
+from django.db import DatabaseError, connection
+from django.test.utils import CaptureQueriesContext
+import json
+import logging
+import random
+
+logger = logging.getLogger(__name__)
+
+# The fraction of requests to instrument; none unless it's set.
+DEFAULT_SAMPLE_RATE = 0.0
+
+# parts of a request -> the RequestSample field their time is kept in
+SAMPLE_FIELDS = (
+    ('expansion', 'expansion_time'),
+    ('markdown', 'markdown_time'),
+    ('template_text', 'template_text_time'),
+    ('eventbrite', 'eventbrite_time'),
+)
+
+def view_name(request):
+    try:
+        match = resolve(request.path_info)
+    except Resolver404:
+        return ''
+    return match.view_name or match.url_name or ''
+
+def server_timing(duration, queries, sql_time, parts):
+    """A Server-Timing header value, with durations in milliseconds."""
+    metrics = ['total;dur={0:.1f}'.format(duration * 1000),
+        'db;dur={0:.1f};desc="{1} queries"'.format(sql_time * 1000, queries)]
+    for name, (seconds, count) in parts.items():
+        metrics.append('{0};dur={1:.1f};desc="{2} calls"'.format(name, seconds * 1000, count))
+    return ', '.join(metrics)
+
+class InstrumentationMiddleware(object):
+    """Times a sample of requests: their queries, the instrumented parts
+    (see asylum.classes.instrumentation) and the whole.
+
+    Each sampled response gets a Server-Timing header, a structured log line
+    and a RequestSample for the admin's slowest endpoints report. The rate is
+    set with ASYLUM_INSTRUMENTATION_SAMPLE_RATE, from 0 to 1.
+    """
+    def process_request(self, request):
+        rate = getattr(settings, 'ASYLUM_INSTRUMENTATION_SAMPLE_RATE', DEFAULT_SAMPLE_RATE)
+        if rate <= 0 or random.random() >= rate:
+            # in case a previous request on this thread never finished
+            instrumentation.stop()
+            return
+        request._instrumentation_queries = CaptureQueriesContext(connection)
+        request._instrumentation_queries.__enter__()
+        instrumentation.start()
+
+    def process_response(self, request, response):
+        captured = getattr(request, '_instrumentation_queries', None)
+        if captured is None:
+            return response
+        del request._instrumentation_queries
+        captured.__exit__(None, None, None)
+        timings = instrumentation.stop()
+        if timings is None:
+            return response
+
+        duration = timings.elapsed()
+        queries = len(captured)
+        sql_time = sum(float(query['time']) for query in captured.captured_queries)
+        response['Server-Timing'] = server_timing(duration, queries, sql_time, timings.parts)
+
+        sample = RequestSample(
+                path=request.path[:255],
+                view=view_name(request)[:255],
+                method=request.method,
+                status=response.status_code,
+                duration=duration,
+                queries=queries,
+                sql_time=sql_time,
+                )
+        for part, field in SAMPLE_FIELDS:
+            setattr(sample, field, timings.parts.get(part, (0.0, 0))[0])
+        logger.info(json.dumps({
+            'path': sample.path,
+            'view': sample.view,
+            'method': sample.method,
+            'status': sample.status,
+            'duration_ms': round(duration * 1000, 1),
+            'queries': queries,
+            'sql_ms': round(sql_time * 1000, 1),
+            'parts': dict((name, {'ms': round(seconds * 1000, 1), 'calls': count})
+                for name, (seconds, count) in timings.parts.items()),
+            }))
+        try:
+            sample.save()
+        except DatabaseError:
+            logger.exception("Couldn't save a request sample")
+        return response
@@ -1,16 +1,21 @@
+from asylum.classes.instrumentation import instrumented
+from asylum.classes.permissions import EditablePermissionLogic
+from asylum.classes.rendering import render_markdown
+from asylum.classes.summaries import summarize
 from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.core import validators
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone, translation
 from django_eventbrite.models import Event as EBEvent
 from djmoney.models.fields import MoneyField
-from html2text import HTML2Text
-from markdown_deux import markdown
 from permission import add_permission_logic
 from permission.logics import AuthorPermissionLogic
-from permission.logics import CollaboratorsPermissionLogic
 from phonenumber_field.modelfields import PhoneNumberField
 from schedule.models import Event as CalEvent
+from schedule.utils import OccurrenceReplacer
 
 class Person(models.Model):
     CONTACT_METHOD_TYPES = (
@@ -68,6 +73,13 @@ class Instructor(Person):
                 ]
             )
 
+    def __init__(self, *args, **kwargs):
+        super(Instructor, self).__init__(*args, **kwargs)
+        self._loaded_user_id = self.user_id
+
+    def bio_as_html(self):
+        return render_markdown(self.bio)
+
     class Meta:
         permissions = (
             ('admin_instructor', 'Can change instructor administrative information'),
@@ -127,6 +139,12 @@ class AbsCourse(models.Model):
         return ", ".join(map(lambda i: i.name_display, self.instructors.all()))
     instructor_names.short_description='Instructors'
 
+    def blurb_as_html(self):
+        return render_markdown(self.blurb)
+
+    def description_as_html(self):
+        return render_markdown(self.description)
+
     def __str__(self):
         return self.name
 
@@ -147,6 +165,7 @@ class Course(AbsCourse):
     )
     state = models.CharField(max_length=10, default=STATE_CURRENT, choices=STATES)
     def set_from_event(self, event):
+        from html2text import HTML2Text
         self.name = event.name
         h=HTML2Text()
         self.description = h.handle(event.description)
@@ -154,18 +173,21 @@ class Course(AbsCourse):
         if event.tickets.count() > 0:
             self.ticket_price = event.tickets.first().cost
 
-    def create_session(self):
+    def build_session(self):
+        """An unsaved Session with this course's fields copied over."""
         session = Session()
         session.course = self
         for field in AbsCourse._meta.fields:
             setattr(session, field.name, getattr(self, field.name))
-        session.save()
-        for field in AbsCourse._meta.many_to_many:
-            print(field)
-            for obj in getattr(self, field.name).all():
-                getattr(session, field.name).add(obj)
+        return session
 
+    def create_session(self):
+        # this needs to be imported here due to cyclic dependencies
+        from asylum.classes.scheduling import copy_relations
+
+        session = self.build_session()
         session.save()
+        copy_relations([(self, session)])
         return session
 
     def __str__(self):
@@ -176,6 +198,27 @@ class Course(AbsCourse):
             ('change_course_state', 'Change course approval state'),
         )
 
+def weekday_mask(weekdays):
+    """The bitmask of some days of the week, numbered from Monday as 0."""
+    return sum(1 << day for day in set(weekdays))
+
+class SessionQuerySet(models.QuerySet):
+    def meets_on(self, *weekdays):
+        """Sessions meeting on any of the given days of the week."""
+        return self.extra(where=['{0}.weekdays & %s != 0'.format(self.model._meta.db_table)],
+                params=[weekday_mask(weekdays)])
+
+    def meets_only_on(self, *weekdays):
+        """Sessions meeting on no days of the week but the given ones, e.g.
+        meets_only_on(5, 6) for weekend classes."""
+        return self.exclude(meeting_count=0).extra(
+                where=['{0}.weekdays & %s = 0'.format(self.model._meta.db_table)],
+                params=[weekday_mask(range(7)) & ~weekday_mask(weekdays)])
+
+    def meets_between(self, start, end):
+        """Sessions with any meetings between start and end."""
+        return self.filter(first_start__lt=end, last_end__gt=start)
+
 class Session(AbsCourse):
     STATE_CANCELED = 'canceled'
     STATE_DRAFT = 'draft'
@@ -193,6 +236,26 @@ class Session(AbsCourse):
     event = models.OneToOneField(EBEvent, null=True, blank=True)
     state = models.CharField(max_length=20, default=STATE_DRAFT, choices=STATES)
     calendar_event = models.OneToOneField(CalEvent, null=True)
+    modified = models.DateTimeField(auto_now=True, db_index=True)
+
+    # A summary of the stored occurrences, kept with them by
+    # rebuild_occurrences() so it can be sorted and filtered on.
+    first_start = models.DateTimeField(null=True, blank=True, editable=False, db_index=True)
+    last_end = models.DateTimeField(null=True, blank=True, editable=False, db_index=True)
+    meeting_count = models.PositiveSmallIntegerField(default=0, editable=False)
+    weekdays = models.PositiveSmallIntegerField(default=0, editable=False,
+            help_text='The local days of the week it meets on, as a bitmask with Monday as 1')
+    days_display = models.CharField(max_length=100, blank=True, editable=False)
+    dates_display = models.CharField(max_length=100, blank=True, editable=False)
+    times_display = models.CharField(max_length=100, blank=True, editable=False)
+
+    objects = SessionQuerySet.as_manager()
+
+    def __init__(self, *args, **kwargs):
+        super(Session, self).__init__(*args, **kwargs)
+        # a new session has never had its occurrences built
+        self._loaded_calendar_event_id = self.calendar_event_id if self.pk else None
+        self._loaded_course_id = self.course_id
 
     def eb_id(self):
         if not self.event:
@@ -214,13 +277,13 @@ class Session(AbsCourse):
 
     def publish(self, request):
         # this needs to be imported here due to cyclic dependencies
-        from asylum.classes.utils import publish_to_eb
+        from asylum.classes.publishing import enqueue_publish
 
         if self.can_publish(request):
             self.state = self.STATE_READY_TO_PUBLISH
             self.save()
-            publish_to_eb(self)
-            # publish to eventbrite here
+            # the publish_worker command publishes this to Eventbrite
+            enqueue_publish(self)
 
     def can_cancel(self, request):
         has_perm = request.user.has_perm('classes.change_session_state')
@@ -239,18 +302,35 @@ class Session(AbsCourse):
             self.ticket_price = event.tickets[0].cost
         self.event = event
 
-    def save(self):
+    def save(self, *args, **kwargs):
         # twiddle the calendar here
-        if self.calendar_event:
+        if self.calendar_event and self.calendar_event.title != self.name:
             self.calendar_event.title = self.name
             self.calendar_event.save()
-        super(Session, self).save()
+        super(Session, self).save(*args, **kwargs)
+
+    def calendar_event_changed(self):
+        """Whether this has been pointed at a different calendar event since it was loaded."""
+        return self.calendar_event_id != self._loaded_calendar_event_id
 
     def get_absolute_url(self):
         from django.core.urlresolvers import reverse
         return reverse('asylum.classes.views.session_item', args=[str(self.id)])
 
+    @instrumented('occurrences')
     def get_occurrences(self):
+        """The stored meetings of this session, in order.
+
+        These are expanded from the calendar event by rebuild_occurrences(),
+        so reading them doesn't run the recurrence rules.
+        """
+        if not self.calendar_event_id:
+            return None
+        return list(self.occurrences.all())
+
+    @instrumented('expansion')
+    def expand_occurrences(self):
+        """Expands the calendar event into its (unsaved) occurrences."""
         cal = self.calendar_event
         if not cal:
             return None
@@ -260,19 +340,390 @@ class Session(AbsCourse):
             return None
 
         # the offsets here are to account for exact overlaps
-        return cal.get_occurrences(cal.start - timedelta(1), (cal.end_recurring_period or cal.end) + timedelta(1))
+        start = cal.start - timedelta(1)
+        end = (cal.end_recurring_period or cal.end) + timedelta(1)
+
+        # This mirrors CalEvent.get_occurrences(), which re-fetches the event
+        # and its persisted occurrences on every call. Going through
+        # occurrence_set lets them be prefetched for many sessions at once.
+        replacer = OccurrenceReplacer(cal.occurrence_set.all())
+        occurrences = []
+        for occ in cal._get_occurrence_list(start, end):
+            if replacer.has_occurrence(occ):
+                p_occ = replacer.get_occurrence(occ)
+                if p_occ.start < end and p_occ.end >= start:
+                    occurrences.append(p_occ)
+            else:
+                occurrences.append(occ)
+        occurrences += replacer.get_additional_occurrences(start, end)
+        return sorted(occurrences, key=lambda occ: occ.start)
+
+    def rebuild_occurrences(self):
+        """Replaces the stored occurrences with a fresh expansion."""
+        rows = []
+        for ordinal, occ in enumerate(self.expand_occurrences() or [], 1):
+            rows.append(SessionOccurrence(
+                session=self,
+                ordinal=ordinal,
+                start=occ.start,
+                end=occ.end,
+                description=occ.description or '',
+                ))
+        summary = self.summarize_occurrences(rows)
+        with transaction.atomic():
+            self.occurrences.all().delete()
+            SessionOccurrence.objects.bulk_create(rows)
+            # update() rather than save(), which would set off the signals again
+            Session.objects.filter(pk=self.pk).update(**summary)
+            for field, value in summary.items():
+                setattr(self, field, value)
+            self._loaded_calendar_event_id = self.calendar_event_id
+            self.rebuild_teaching(rows)
+        # drop anything prefetched before the rebuild
+        getattr(self, '_prefetched_objects_cache', {}).pop('occurrences', None)
+
+    def summarize_occurrences(self, occurrences):
+        """The values of the summary fields for a list of occurrences."""
+        # the display strings are for the public site, whoever rebuilds them
+        with translation.override(settings.LANGUAGE_CODE), timezone.override(timezone.get_default_timezone()):
+            summary = summarize(occurrences, date_format='F j')
+            return {
+                'first_start': occurrences[0].start if occurrences else None,
+                'last_end': max(o.end for o in occurrences) if occurrences else None,
+                'meeting_count': len(occurrences),
+                'weekdays': weekday_mask(timezone.localtime(o.start).weekday() for o in occurrences),
+                'days_display': summary.days,
+                'dates_display': summary.dates,
+                'times_display': summary.times,
+            }
+
+    def meeting_hours(self, meetings):
+        """The billed instructor hours for each of the given number of meetings."""
+        meetings = self.number_of_meetings or meetings
+        if not meetings:
+            return 0
+        return (Decimal(self.instructor_hours) / meetings).quantize(Decimal('0.01'))
+
+    def rebuild_teaching(self, occurrences=None):
+        """Replaces this session's entries in the instructors' timelines."""
+        rows = []
+        if self.state != self.STATE_CANCELED:
+            if occurrences is None:
+                occurrences = list(self.occurrences.all())
+            hours = self.meeting_hours(len(occurrences))
+            for instructor_id in self.instructors.values_list('pk', flat=True):
+                for occ in occurrences:
+                    rows.append(TeachingOccurrence(
+                        instructor_id=instructor_id,
+                        session=self,
+                        start=occ.start,
+                        end=occ.end,
+                        hours=hours,
+                        ))
+        with transaction.atomic():
+            TeachingOccurrence.objects.filter(session=self).delete()
+            TeachingOccurrence.objects.bulk_create(rows)
 
     class Meta:
         permissions = (
             ('change_session_state', 'Change session approval state'),
         )
 
+class SessionOccurrence(models.Model):
+    """A single meeting of a Session.
+
+    This is a denormalized copy of the expanded calendar event, kept up to date
+    by Session.rebuild_occurrences() whenever the event, its rule or its
+    persisted occurrences change.
+    """
+    session = models.ForeignKey(Session, related_name='occurrences')
+    ordinal = models.PositiveSmallIntegerField()
+    start = models.DateTimeField(db_index=True)
+    end = models.DateTimeField(db_index=True)
+    description = models.TextField(blank=True)
+
+    def __str__(self):
+        return "{0} #{1}".format(self.session, self.ordinal)
+
+    class Meta:
+        ordering = ('session', 'ordinal')
+        unique_together = (('session', 'ordinal'),)
+
+class TeachingOccurrence(models.Model):
+    """A meeting an instructor teaches.
+
+    This is a denormalized timeline of each instructor's stored session
+    occurrences, with the instructor hours billed for each. It's kept up to
+    date one session at a time by Session.rebuild_teaching(), or for newly
+    scheduled sessions all at once by teaching.rebuild_timelines().
+    """
+    instructor = models.ForeignKey(Instructor, related_name='timeline')
+    session = models.ForeignKey(Session, related_name='+')
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+    hours = models.DecimalField(max_digits=5, decimal_places=2)
+
+    def __str__(self):
+        return "{0}: {1}".format(self.instructor, self.session)
+
+    class Meta:
+        ordering = ('instructor', 'start')
+        index_together = (('instructor', 'start'),)
+
+class PublishJob(models.Model):
+    """A queued request to publish a Session to Eventbrite.
+
+    These are drained by the publish_worker management command. Each session
+    has a single job, identified by its idempotency key, which is retried with
+    exponential backoff until it succeeds or runs out of attempts.
+    """
+    STATE_PENDING = 'pending'
+    STATE_RUNNING = 'running'
+    STATE_DONE = 'done'
+    STATE_FAILED = 'failed'
+    STATE_SKIPPED = 'skipped'
+    STATES = (
+        (STATE_PENDING, 'Pending'),
+        (STATE_RUNNING, 'Running'),
+        (STATE_DONE, 'Done'),
+        (STATE_FAILED, 'Failed'),
+        (STATE_SKIPPED, 'Skipped'),
+    )
+    session = models.ForeignKey(Session, related_name='publish_jobs')
+    idempotency_key = models.CharField(max_length=100, unique=True)
+    state = models.CharField(max_length=10, default=STATE_PENDING, choices=STATES, db_index=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt = models.DateTimeField(default=timezone.now, db_index=True)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    modified = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return "Publish {0}".format(self.session)
+
+    class Meta:
+        ordering = ('-created',)
+
+class SyncCursor(models.Model):
+    """How far the Eventbrite change feed has been read for an organizer.
+
+    high_water is the latest "changed" timestamp stored for that resource, so
+    the next sync only asks for things modified after it. While a sync runs,
+    the organizer's first cursor is leased to it until locked_until.
+    """
+    organizer = models.CharField(max_length=50, help_text='The Eventbrite user whose events are synced')
+    resource = models.CharField(max_length=50)
+    high_water = models.DateTimeField(null=True, blank=True)
+    last_run = models.DateTimeField(null=True, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return "{0} {1} since {2}".format(self.organizer, self.resource, self.high_water)
+
+    class Meta:
+        unique_together = (('organizer', 'resource'),)
+
+class SyncJob(models.Model):
+    """A queued reload of some Eventbrite events, as requested from the admin.
+
+    Reloading is paced to Eventbrite's rate limit, so it's done by the
+    sync_worker management command rather than in the request.
+    """
+    STATE_PENDING = 'pending'
+    STATE_RUNNING = 'running'
+    STATE_DONE = 'done'
+    STATE_FAILED = 'failed'
+    STATES = (
+        (STATE_PENDING, 'Pending'),
+        (STATE_RUNNING, 'Running'),
+        (STATE_DONE, 'Done'),
+        (STATE_FAILED, 'Failed'),
+    )
+    eb_ids = models.TextField(help_text='The Eventbrite ids of the events, comma separated')
+    attendees = models.BooleanField(default=True, help_text='Whether to reload the attendees too')
+    state = models.CharField(max_length=10, default=STATE_PENDING, choices=STATES, db_index=True)
+    summary = models.TextField(blank=True)
+    requested_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
+    created = models.DateTimeField(auto_now_add=True)
+    modified = models.DateTimeField(auto_now=True)
+
+    def event_ids(self):
+        return [eb_id for eb_id in self.eb_ids.split(',') if eb_id]
+
+    def __str__(self):
+        return "Sync {0} events".format(len(self.event_ids()))
+
+    class Meta:
+        ordering = ('-created',)
+
+class SearchDocument(models.Model):
+    """The searchable text of a course or session, denormalized from its
+    instructors, categories and rooms.
+
+    Kept up to date by the signals; see asylum.classes.search.
+    """
+    KIND_COURSE = 'course'
+    KIND_SESSION = 'session'
+    KINDS = (
+        (KIND_COURSE, 'Course'),
+        (KIND_SESSION, 'Session'),
+    )
+    kind = models.CharField(max_length=10, choices=KINDS)
+    object_id = models.PositiveIntegerField()
+    title = models.CharField(max_length=255)
+    body = models.TextField()
+
+    def __str__(self):
+        return "{0} {1}".format(self.kind, self.title)
+
+    class Meta:
+        unique_together = (('kind', 'object_id'),)
+
+class RequestSample(models.Model):
+    """The timings of one request sampled by InstrumentationMiddleware."""
+    path = models.CharField(max_length=255)
+    view = models.CharField(max_length=255, db_index=True)
+    method = models.CharField(max_length=10)
+    status = models.PositiveSmallIntegerField()
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+    duration = models.FloatField(help_text='Seconds')
+    queries = models.PositiveIntegerField()
+    sql_time = models.FloatField(help_text='Seconds')
+    expansion_time = models.FloatField(default=0, help_text='Seconds spent expanding recurrences')
+    markdown_time = models.FloatField(default=0, help_text='Seconds spent rendering markdown')
+    template_text_time = models.FloatField(default=0, help_text='Seconds spent substituting TemplateTexts')
+    eventbrite_time = models.FloatField(default=0, help_text='Seconds spent waiting on Eventbrite')
+
+    def __str__(self):
+        return "{0} {1} in {2:.3f}s".format(self.method, self.path, self.duration)
+
+    class Meta:
+        ordering = ('-created',)
+
+class EnrollmentRollup(models.Model):
+    """The enrollment and revenue of a term's sessions, in all or for one
+    category, instructor or room. These are built by asylum.classes.rollups.
+    """
+    DIMENSION_TERM = 'term'
+    DIMENSION_CATEGORY = 'category'
+    DIMENSION_INSTRUCTOR = 'instructor'
+    DIMENSION_ROOM = 'room'
+    DIMENSIONS = (
+        (DIMENSION_TERM, 'Term'),
+        (DIMENSION_CATEGORY, 'Category'),
+        (DIMENSION_INSTRUCTOR, 'Instructor'),
+        (DIMENSION_ROOM, 'Room'),
+    )
+    term = models.CharField(max_length=7, db_index=True, help_text='e.g. 2015-Q1')
+    dimension = models.CharField(max_length=10, choices=DIMENSIONS)
+    key = models.PositiveIntegerField(null=True, help_text='The id of the category, instructor or room')
+    label = models.CharField(max_length=255)
+    sessions = models.PositiveIntegerField()
+    tickets_sold = models.PositiveIntegerField()
+    tickets_refunded = models.PositiveIntegerField()
+    gross_sales = models.DecimalField(max_digits=12, decimal_places=2)
+    eventbrite_fees = models.DecimalField(max_digits=12, decimal_places=2)
+    instructor_payout = models.DecimalField(max_digits=12, decimal_places=2)
+    min_enrollment = models.PositiveIntegerField(help_text='The total of the sessions\' minimums')
+    max_enrollment = models.PositiveIntegerField(help_text='The total of the sessions\' maximums')
+    sessions_under_minimum = models.PositiveIntegerField()
+    fill_ratio = models.FloatField(help_text='Tickets sold over the maximum enrollment')
+    built = models.DateTimeField()
+
+    def __str__(self):
+        return "{0} {1}".format(self.term, self.label)
+
+    class Meta:
+        ordering = ('-term', 'dimension', 'label')
+        unique_together = ('term', 'dimension', 'key')
+
+class ImmutableError(Exception):
+    """An attempt to change or delete a record that is kept as it was made."""
+
+class PayoutBatch(models.Model):
+    """The instructor payouts for the sessions that ended within a period.
+
+    Batches are computed by asylum.classes.payouts and never changed once
+    saved. Each session is paid in at most one batch.
+    """
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+    created = models.DateTimeField(auto_now_add=True)
+    created_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
+    sessions = models.ManyToManyField(Session, through='PayoutSession', related_name='payout_batches')
+    total = models.DecimalField(max_digits=12, decimal_places=2)
+
+    def save(self, *args, **kwargs):
+        if self.pk:
+            raise ImmutableError("Payout batch {0} can't be changed".format(self.pk))
+        super(PayoutBatch, self).save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ImmutableError("Payout batch {0} can't be deleted".format(self.pk))
+
+    def __str__(self):
+        return "Payouts for {0:%Y-%m-%d} to {1:%Y-%m-%d}".format(
+                timezone.localtime(self.start), timezone.localtime(self.end))
+
+    class Meta:
+        ordering = ('-created',)
+        verbose_name_plural = 'Payout batches'
+
+class PayoutSession(models.Model):
+    """A session paid in a batch. A paid session can't be deleted, or paid again."""
+    batch = models.ForeignKey(PayoutBatch, related_name='paid_sessions', on_delete=models.PROTECT)
+    session = models.OneToOneField(Session, related_name='payout', on_delete=models.PROTECT)
+
+    def save(self, *args, **kwargs):
+        if self.pk:
+            raise ImmutableError("Paid session {0} can't be changed".format(self.pk))
+        super(PayoutSession, self).save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ImmutableError("Paid session {0} can't be deleted".format(self.pk))
+
+    def __str__(self):
+        return "{0}: {1}".format(self.batch_id, self.session_id)
+
+class PayoutLine(models.Model):
+    """What one instructor is paid in a batch, and how it was worked out.
+
+    The instructor's terms are copied from when the batch was made.
+    """
+    batch = models.ForeignKey(PayoutBatch, related_name='lines', on_delete=models.PROTECT)
+    instructor = models.ForeignKey(Instructor, on_delete=models.PROTECT)
+    employment_type = models.CharField(max_length=10, choices=Instructor.EMPLOYMENT_TYPES)
+    payment_type = models.CharField(max_length=10, choices=Instructor.PAYMENT_TYPES)
+    percentage = models.PositiveSmallIntegerField()
+    sessions = models.PositiveIntegerField()
+    hours = models.DecimalField(max_digits=8, decimal_places=2)
+    tickets_sold = models.PositiveIntegerField()
+    net_sales = models.DecimalField(max_digits=12, decimal_places=2,
+            help_text="The instructor's share of ticket sales less Eventbrite fees")
+    materials = models.DecimalField(max_digits=12, decimal_places=2,
+            help_text='Material costs collected in the ticket price, reimbursed in full')
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+
+    def save(self, *args, **kwargs):
+        if self.pk:
+            raise ImmutableError("Payout line {0} can't be changed".format(self.pk))
+        super(PayoutLine, self).save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ImmutableError("Payout line {0} can't be deleted".format(self.pk))
+
+    def __str__(self):
+        return "{0}: {1}".format(self.instructor, self.amount)
+
+    class Meta:
+        ordering = ('instructor__name',)
+
 class TemplateText(models.Model):
     keyword = models.SlugField(unique=True, help_text='To use this, just place this keyword in curly braces (like so {{foo}}) in your text and it will be replaced when publishing.')
     text = models.TextField(help_text='This is the text that will be inserted')
 
     def text_as_html(self):
-        return markdown(self.text)
+        return render_markdown(self.text)
     text_as_html.allow_tags=True
     text_as_html.short_description='Text'
 
@@ -284,14 +735,14 @@ add_permission_logic(Instructor, AuthorPermissionLogic(field_name='user',
     delete_permission=False,
     ))
 
-add_permission_logic(Course, CollaboratorsPermissionLogic(
+add_permission_logic(Course, EditablePermissionLogic(
     field_name='instructors__user',
     any_permission=False,
     change_permission=True,
     delete_permission=False,
     ))
 
-add_permission_logic(Session, CollaboratorsPermissionLogic(
+add_permission_logic(Session, EditablePermissionLogic(
     field_name='instructors__user',
     any_permission=False,
     change_permission=True,
@@ -0,0 +1,114 @@
+"""Instructor payouts, computed a period at a time.
+
+A session is paid once it has ended. Its net sales are its valid ticket sales
+less Eventbrite's fees. Material costs collected in the ticket price are
+taken out of that and reimbursed in full; of the rest, each instructor gets
+their instructor_percentage. Co-taught sessions are split evenly between
+their instructors first.
+
+The figures for every instructor across all of a period's sessions come from
+one aggregate query, and are kept as a PayoutBatch that is never changed.
+Sessions without instructors aren't paid to anyone. The term rollups work
+out payouts with the same SQL, from asylum.classes.rollups.
+"""
+from asylum.classes.models import Instructor, PayoutBatch, PayoutLine, PayoutSession, Session
+from asylum.classes.rollups import (NET_SALES, SOLD, materials_expression, money, payout_expression,
+    sales_table, shares_table)
+from asylum.classes.sales import column
+from decimal import Decimal
+from django.db import connection, transaction
+
+def payable_sessions(start, end):
+    """Published sessions that ended within the period and haven't been paid."""
+    return Session.objects.filter(last_end__gte=start, last_end__lt=end).exclude(
+            event=None).exclude(state=Session.STATE_CANCELED).filter(payout_batches=None)
+
+def instructor_totals(sessions):
+    """(instructor id, sessions, hours, tickets sold, net sales, materials,
+    payout) for each instructor of the given sessions, with the sales,
+    materials and payouts of co-taught sessions split between their
+    instructors.
+    """
+    qn = connection.ops.quote_name
+    field = Session._meta.get_field('instructors')
+    through = qn(field.rel.through._meta.db_table)
+    instructor = '{0}.{1}'.format(through, qn(field.m2m_reverse_name()))
+    session = column(Session, Session._meta.pk.name)
+    materials, materials_params = materials_expression()
+    payout, payout_params = payout_expression(column(Instructor, 'instructor_percentage'), 'shares.instructors')
+    subquery, params = sessions.values_list('pk').query.sql_with_params()
+    sql = '''SELECT {instructor}, COUNT(*), SUM({hours}), SUM({sold}),
+            SUM({net} * 1.0 / shares.instructors),
+            SUM(({materials}) * 1.0 / shares.instructors),
+            SUM({payout})
+        FROM {sessions}
+        JOIN {through} ON {through}.{session_id} = {session}
+        JOIN {instructors} ON {instructor_pk} = {instructor}
+        JOIN ({shares}) shares ON shares.session_id = {session}
+        LEFT JOIN ({sales}) sales ON sales.event_id = {event}
+        WHERE {session} IN ({subquery})
+        GROUP BY {instructor}'''.format(
+            instructor=instructor,
+            hours=column(Session, 'instructor_hours'),
+            sold=SOLD,
+            net=NET_SALES,
+            materials=materials,
+            payout=payout,
+            sessions=qn(Session._meta.db_table),
+            through=through,
+            session_id=qn(field.m2m_column_name()),
+            session=session,
+            instructors=qn(Instructor._meta.db_table),
+            instructor_pk=column(Instructor, Instructor._meta.pk.name),
+            shares=shares_table(),
+            sales=sales_table(),
+            event=column(Session, 'event'),
+            subquery=subquery)
+    cursor = connection.cursor()
+    cursor.execute(sql, materials_params + payout_params + list(params))
+    return cursor.fetchall()
+
+def payout_lines(sessions):
+    """The unsaved PayoutLines of the given sessions."""
+    totals = instructor_totals(sessions)
+    instructors = Instructor.objects.in_bulk([row[0] for row in totals])
+    lines = []
+    for instructor_id, count, hours, sold, net, materials, amount in totals:
+        instructor = instructors[instructor_id]
+        lines.append(PayoutLine(
+                instructor=instructor,
+                employment_type=instructor.employment_type,
+                payment_type=instructor.payment_type,
+                percentage=instructor.instructor_percentage,
+                sessions=count,
+                hours=money(hours),
+                tickets_sold=sold or 0,
+                net_sales=money(net),
+                materials=money(materials),
+                amount=money(amount),
+                ))
+    return lines
+
+def create_batch(start, end, user=None):
+    """Pays the sessions that ended within the period and haven't been paid,
+    returning the new PayoutBatch, or None if there was nothing to pay.
+    """
+    with transaction.atomic():
+        # Lock the sessions, so a batch made at the same time waits for this
+        # one and then finds them paid. Locking the query itself would lock
+        # the outer join to the batches too, which some databases refuse.
+        session_ids = list(payable_sessions(start, end).values_list('pk', flat=True))
+        list(Session.objects.filter(pk__in=session_ids).select_for_update().values_list('pk'))
+        sessions = payable_sessions(start, end).filter(pk__in=session_ids)
+        session_ids = list(sessions.values_list('pk', flat=True))
+        if not session_ids:
+            return None
+        lines = payout_lines(sessions)
+        batch = PayoutBatch.objects.create(start=start, end=end, created_by=user,
+                total=sum((line.amount for line in lines), Decimal('0.00')))
+        for line in lines:
+            line.batch = batch
+        PayoutLine.objects.bulk_create(lines)
+        PayoutSession.objects.bulk_create([PayoutSession(batch=batch, session_id=session_id)
+            for session_id in session_ids])
+    return batch
@@ -0,0 +1,68 @@
+"""Which courses and sessions each instructor can edit.
+
+Checking a collaborator permission object by object means a join through
+the instructors for every row and every action in the admin. Instead, the
+ids of everything a user can edit are worked out in one query per model and
+kept on the user for the rest of the request, and in the shared cache until
+the user's instructors change. A process-local cache can't be invalidated
+from the other processes, so with one the ids are looked up every request.
+"""
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from permission.logics import CollaboratorsPermissionLogic
+
+# how long an index is kept without any change to invalidate it
+EDITABLE_TIMEOUT = 60 * 60
+
+# the models indexed, by label
+EDITABLE_MODELS = ('classes.course', 'classes.session')
+
+def model_label(model):
+    return '{0}.{1}'.format(model._meta.app_label, model._meta.model_name)
+
+def editable_key(label, user_id):
+    return 'asylum:editable:{0}:{1}'.format(label, user_id)
+
+def cache_is_shared():
+    return not isinstance(caches[DEFAULT_CACHE_ALIAS], LocMemCache)
+
+def editable_ids(user, model, field_name='instructors__user'):
+    """The set of ids of the model's objects the user collaborates on."""
+    label = model_label(model)
+    editable = user.__dict__.setdefault('_editable_ids', {})
+    if label not in editable:
+        key = editable_key(label, user.pk)
+        shared = cache_is_shared()
+        ids = cache.get(key) if shared else None
+        if ids is None:
+            ids = frozenset(model._default_manager.filter(**{field_name: user}).values_list('pk', flat=True))
+            if shared:
+                cache.set(key, ids, EDITABLE_TIMEOUT)
+        editable[label] = ids
+    return editable[label]
+
+def invalidate_editable(user_ids):
+    """Drops the indexes of users whose instructors have changed."""
+    keys = [editable_key(label, user_id)
+            for user_id in set(user_ids) if user_id is not None
+            for label in EDITABLE_MODELS]
+    if keys:
+        cache.delete_many(keys)
+
+def has_model_perm(user, perm):
+    """Whether the user has perm on every object, not just their own."""
+    return user.is_active and (user.is_superuser or perm in user.get_all_permissions())
+
+class EditablePermissionLogic(CollaboratorsPermissionLogic):
+    """CollaboratorsPermissionLogic, with the collaborators looked up in the
+    user's index of editable ids rather than on each object.
+    """
+    def has_perm(self, user_obj, perm, obj=None):
+        if obj is not None:
+            if not user_obj.is_authenticated() or not user_obj.is_active:
+                return False
+            if obj.pk not in editable_ids(user_obj, obj._meta.concrete_model, self.field_name):
+                return False
+        # Without an object, the logic only decides which permissions
+        # collaborators get, which is all that's left to check.
+        return super(EditablePermissionLogic, self).has_perm(user_obj, perm)
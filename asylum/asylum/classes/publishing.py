@@ -0,0 +1,117 @@
+from asylum.classes.instrumentation import eb
+from asylum.classes.models import PublishJob, Session
+from asylum.classes.utils import NotReadyToPublish, publish_to_eb
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.db import connection
+from django.utils import timezone
+import traceback
+
+MAX_ATTEMPTS = 8
+BACKOFF_BASE = timedelta(seconds=30)
+BACKOFF_MAX = timedelta(hours=6)
+# Running jobs that haven't finished in this long are assumed to have lost
+# their worker.
+STALE_AFTER = timedelta(minutes=15)
+
+def idempotency_key(session):
+    return 'publish-session-{0}'.format(session.pk)
+
+def enqueue_publish(session):
+    """Queues a session to be published, returning its job.
+
+    Enqueueing a session that already has an outstanding job returns that job
+    rather than creating another; a job that had given up is started afresh.
+    """
+    job, created = PublishJob.objects.get_or_create(
+            idempotency_key=idempotency_key(session),
+            defaults={'session': session},
+            )
+    if not created and job.state in (PublishJob.STATE_DONE, PublishJob.STATE_FAILED, PublishJob.STATE_SKIPPED):
+        job.state = PublishJob.STATE_PENDING
+        job.attempts = 0
+        job.next_attempt = timezone.now()
+        job.last_error = ''
+        job.save()
+    return job
+
+def backoff(attempts):
+    """How long to wait before retrying after the given number of attempts."""
+    return min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+
+def claim_jobs(limit):
+    """Marks up to limit due jobs as running and returns them.
+
+    Each job is claimed with a conditional update, so several workers can
+    drain the queue without publishing a session twice.
+    """
+    due = PublishJob.objects.filter(
+            state=PublishJob.STATE_PENDING,
+            next_attempt__lte=timezone.now(),
+            ).order_by('next_attempt').values_list('pk', flat=True)[:limit]
+    claimed = []
+    for pk in list(due):
+        updated = PublishJob.objects.filter(pk=pk, state=PublishJob.STATE_PENDING).update(
+                state=PublishJob.STATE_RUNNING,
+                modified=timezone.now(),
+                )
+        if updated:
+            claimed.append(pk)
+    return list(PublishJob.objects.filter(pk__in=claimed).select_related('session'))
+
+def requeue_stale_jobs():
+    return PublishJob.objects.filter(
+            state=PublishJob.STATE_RUNNING,
+            modified__lt=timezone.now() - STALE_AFTER,
+            ).update(state=PublishJob.STATE_PENDING, modified=timezone.now())
+
+def run_job(job, client=eb):
+    """Makes one attempt at a claimed job, recording the outcome."""
+    job.attempts += 1
+    try:
+        session = Session.objects.select_related('event', 'calendar_event').get(pk=job.session_id)
+        publish_to_eb(session, client)
+    except NotReadyToPublish as e:
+        # retrying won't help until the session is made ready again
+        job.state = PublishJob.STATE_SKIPPED
+        job.last_error = str(e)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.attempts >= MAX_ATTEMPTS:
+            job.state = PublishJob.STATE_FAILED
+        else:
+            job.state = PublishJob.STATE_PENDING
+            job.next_attempt = timezone.now() + backoff(job.attempts)
+    else:
+        job.state = PublishJob.STATE_DONE
+        job.last_error = ''
+    job.save()
+    return job
+
+def _run_in_thread(job, client):
+    try:
+        return run_job(job, client)
+    finally:
+        # each worker thread has its own connection
+        connection.close()
+
+def drain(client=eb, workers=4):
+    """Runs every due job, returning the jobs that were attempted.
+
+    With a single worker, jobs are run in the calling thread.
+    """
+    attempted = []
+    requeue_stale_jobs()
+    if workers <= 1:
+        jobs = claim_jobs(1)
+        while jobs:
+            attempted.append(run_job(jobs[0], client))
+            jobs = claim_jobs(1)
+        return attempted
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            jobs = claim_jobs(workers * 4)
+            if not jobs:
+                break
+            attempted.extend(executor.map(lambda job: _run_in_thread(job, client), jobs))
+    return attempted
@@ -0,0 +1,43 @@
+from asylum.classes.caching import digest
+from asylum.classes.instrumentation import instrumented
+from django.core.cache import cache
+import markdown_deux
+import threading
+
+# Rendered HTML is addressed by its source, so it never goes stale; this just
+# lets the cache backend reclaim entries nobody has asked for in a while.
+MARKDOWN_CACHE_TIMEOUT = 60 * 60 * 24 * 30
+
+_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+_style_digests = {}
+
+def style_digest(style):
+    """A digest of the markdown-deux settings for the named style."""
+    if style not in _style_digests:
+        options = markdown_deux.get_style(style)
+        _style_digests[style] = digest(repr(sorted(options.items())))
+    return _style_digests[style]
+
+@instrumented('markdown')
+def render_markdown(text, style='default'):
+    """Renders markdown to HTML, reusing earlier renderings of the same text."""
+    if not text:
+        return ''
+    key = 'asylum:markdown:{0}:{1}'.format(style_digest(style), digest(text))
+    html = cache.get(key)
+    with _stats_lock:
+        _stats['misses' if html is None else 'hits'] += 1
+    if html is None:
+        html = markdown_deux.markdown(text, style)
+        cache.set(key, html, MARKDOWN_CACHE_TIMEOUT)
+    return html
+
+def markdown_stats():
+    """Hit and miss counts for the markdown cache in this process."""
+    with _stats_lock:
+        return dict(_stats)
+
+def reset_markdown_stats():
+    with _stats_lock:
+        _stats['hits'] = _stats['misses'] = 0
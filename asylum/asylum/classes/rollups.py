@@ -0,0 +1,235 @@
+"""Enrollment and revenue totals for term reporting.
+
+Each term's published sessions are totalled over the term as a whole and by
+category, instructor and room, each with one aggregate query joining the
+sessions to their Eventbrite sales. The totals are kept as EnrollmentRollups,
+rebuilt nightly or on demand with the build_rollups command, so the reports
+read a few rows rather than every attendee.
+
+A term is a calendar quarter, by when a session first meets, e.g. "2015-Q1".
+A session with several categories, instructors or rooms counts towards each
+of them.
+"""
+from asylum.classes.models import Category, EnrollmentRollup, Instructor, Room, Session
+from asylum.classes.sales import (ATTENDEE_CANCELED, ATTENDEE_EVENT, ATTENDEE_EVENTBRITE_FEE,
+    ATTENDEE_GROSS, ATTENDEE_QUANTITY, ATTENDEE_REFUNDED, column)
+from collections import OrderedDict
+from datetime import datetime
+from decimal import Decimal
+from django.db import connection, transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+from django_eventbrite.models import Attendee
+import re
+
+CENT = Decimal('0.01')
+
+TERM_PATTERN = re.compile(r'^(\d{4})-Q([1-4])$')
+
+def term_of(when):
+    when = timezone.localtime(when)
+    return '{0}-Q{1}'.format(when.year, (when.month - 1) // 3 + 1)
+
+def term_bounds(term):
+    """The (start, end) datetimes of a term, in the current timezone."""
+    match = TERM_PATTERN.match(term)
+    if not match:
+        raise ValueError("Terms look like 2015-Q1, not {0}".format(term))
+    year, quarter = int(match.group(1)), int(match.group(2))
+    start = datetime(year, quarter * 3 - 2, 1)
+    end = datetime(year + 1, 1, 1) if quarter == 4 else datetime(year, quarter * 3 + 1, 1)
+    tz = timezone.get_current_timezone()
+    return timezone.make_aware(start, tz), timezone.make_aware(end, tz)
+
+def terms_between(first, last):
+    """The terms from the one containing first to the one containing last."""
+    terms = []
+    term = term_of(first)
+    while True:
+        terms.append(term)
+        if term == term_of(last):
+            return terms
+        term = term_of(term_bounds(term)[1])
+
+def sales_table():
+    """SQL for the valid sales, refunds and fees of each event."""
+    qn = connection.ops.quote_name
+    quantity = column(Attendee, ATTENDEE_QUANTITY)
+    refunded = column(Attendee, ATTENDEE_REFUNDED)
+    valid = 'NOT {0} AND NOT {1}'.format(refunded, column(Attendee, ATTENDEE_CANCELED))
+    return '''SELECT {event} AS event_id,
+            SUM(CASE WHEN {valid} THEN {quantity} ELSE 0 END) AS sold,
+            SUM(CASE WHEN {refunded} THEN {quantity} ELSE 0 END) AS refunded,
+            SUM(CASE WHEN {valid} THEN {gross} ELSE 0 END) AS gross,
+            SUM(CASE WHEN {valid} THEN {fee} ELSE 0 END) AS fees
+        FROM {attendee} GROUP BY {event}'''.format(
+            event=column(Attendee, ATTENDEE_EVENT),
+            valid=valid,
+            quantity=quantity,
+            refunded=refunded,
+            gross=column(Attendee, ATTENDEE_GROSS),
+            fee=column(Attendee, ATTENDEE_EVENTBRITE_FEE),
+            attendee=qn(Attendee._meta.db_table))
+
+def shares_table():
+    """SQL for the number of instructors of each session and their average
+    percentage, which is what the session pays as a percentage of its net
+    sales less materials.
+    """
+    qn = connection.ops.quote_name
+    field = Session._meta.get_field('instructors')
+    through = qn(field.rel.through._meta.db_table)
+    return '''SELECT {through}.{session} AS session_id,
+            COUNT(*) AS instructors,
+            AVG({percentage}) AS percentage
+        FROM {through} JOIN {instructor} ON {instructor_pk} = {through}.{instructor_id}
+        GROUP BY {through}.{session}'''.format(
+            through=through,
+            session=qn(field.m2m_column_name()),
+            instructor_id=qn(field.m2m_reverse_name()),
+            percentage=column(Instructor, 'instructor_percentage'),
+            instructor=qn(Instructor._meta.db_table),
+            instructor_pk=column(Instructor, Instructor._meta.pk.name))
+
+def relation_join(name):
+    """The join from sessions to one of their many-to-many relations, and
+    the column of the related ids.
+    """
+    qn = connection.ops.quote_name
+    field = Session._meta.get_field(name)
+    through = qn(field.rel.through._meta.db_table)
+    join = 'JOIN {0} ON {0}.{1} = {2}'.format(through, qn(field.m2m_column_name()),
+            column(Session, Session._meta.pk.name))
+    return join, '{0}.{1}'.format(through, qn(field.m2m_reverse_name()))
+
+# what a session joined to its sales_table() sold, and took less fees
+SOLD = 'COALESCE(sales.sold, 0)'
+NET_SALES = '(COALESCE(sales.gross, 0) - COALESCE(sales.fees, 0))'
+
+def materials_expression():
+    """SQL for the material costs a session collected in its ticket price,
+    and its params.
+    """
+    sql = 'CASE WHEN {0} = %s THEN {1} * {2} ELSE 0 END'.format(
+            column(Session, 'material_cost_collection'), SOLD, column(Session, 'material_cost'))
+    return sql, [Session.MATERIAL_COST_INCLUDED_IN_TICKET]
+
+def payout_expression(percentage, shares='1'):
+    """SQL for what a session pays its instructors at a percentage, split
+    into a number of shares, and its params.
+
+    Material costs collected in the ticket price are reimbursed in full, and
+    the percentage is of the rest of the net sales.
+    """
+    materials, params = materials_expression()
+    sql = '((({net}) - ({materials})) * {percentage} / 100.0 + ({materials})) / {shares}'.format(
+            net=NET_SALES, materials=materials, percentage=percentage, shares=shares)
+    return sql, params * 2
+
+def rollup_query(dimension):
+    """The SQL of a dimension's totals for a term, and its params, less the
+    term's start and end.
+    """
+    if dimension == EnrollmentRollup.DIMENSION_TERM:
+        join, key = '', 'NULL'
+    else:
+        join, key = relation_join(DIMENSION_RELATIONS[dimension])
+    if dimension == EnrollmentRollup.DIMENSION_INSTRUCTOR:
+        # each instructor's share of the session, at their own percentage
+        join = '{0} JOIN {1} ON {2} = {3}'.format(join, connection.ops.quote_name(Instructor._meta.db_table),
+                column(Instructor, Instructor._meta.pk.name), key)
+        payout, params = payout_expression(column(Instructor, 'instructor_percentage'), 'shares.instructors')
+    else:
+        # sessions without instructors have no percentage, and pay nothing
+        payout, params = payout_expression('shares.percentage')
+    sql = '''SELECT {key}, COUNT(DISTINCT {session}), SUM({sold}), SUM(COALESCE(sales.refunded, 0)),
+            SUM(COALESCE(sales.gross, 0)), SUM(COALESCE(sales.fees, 0)), SUM({payout}),
+            SUM({min_enrollment}), SUM({max_enrollment}),
+            SUM(CASE WHEN {sold} < {min_enrollment} THEN 1 ELSE 0 END)
+        FROM {sessions} {join}
+        LEFT JOIN ({sales}) sales ON sales.event_id = {event}
+        LEFT JOIN ({shares}) shares ON shares.session_id = {session}
+        WHERE {event} IS NOT NULL AND {first_start} >= %s AND {first_start} < %s
+        {group_by}'''.format(
+            key=key,
+            session=column(Session, Session._meta.pk.name),
+            sold=SOLD,
+            payout=payout,
+            min_enrollment=column(Session, 'min_enrollment'),
+            max_enrollment=column(Session, 'max_enrollment'),
+            sessions=connection.ops.quote_name(Session._meta.db_table),
+            join=join,
+            sales=sales_table(),
+            event=column(Session, 'event'),
+            shares=shares_table(),
+            first_start=column(Session, 'first_start'),
+            group_by='' if key == 'NULL' else 'GROUP BY {0}'.format(key))
+    return sql, params
+
+# the session relation each dimension is grouped by, and its model
+DIMENSION_RELATIONS = OrderedDict((
+    (EnrollmentRollup.DIMENSION_CATEGORY, 'category'),
+    (EnrollmentRollup.DIMENSION_INSTRUCTOR, 'instructors'),
+    (EnrollmentRollup.DIMENSION_ROOM, 'room'),
+))
+
+DIMENSION_MODELS = {
+    EnrollmentRollup.DIMENSION_CATEGORY: Category,
+    EnrollmentRollup.DIMENSION_INSTRUCTOR: Instructor,
+    EnrollmentRollup.DIMENSION_ROOM: Room,
+}
+
+def money(value):
+    return Decimal(str(value or 0)).quantize(CENT)
+
+def term_rollups(term):
+    """The unsaved EnrollmentRollups of a term, with one aggregate query per
+    dimension.
+    """
+    start, end = term_bounds(term)
+    built = timezone.now()
+    rollups = []
+    cursor = connection.cursor()
+    for dimension in [EnrollmentRollup.DIMENSION_TERM] + list(DIMENSION_RELATIONS):
+        sql, params = rollup_query(dimension)
+        cursor.execute(sql, params + [start, end])
+        rows = [row for row in cursor.fetchall() if row[1]]
+        labels = {}
+        if dimension in DIMENSION_MODELS:
+            labels = DIMENSION_MODELS[dimension].objects.in_bulk([row[0] for row in rows])
+        for key, sessions, sold, refunded, gross, fees, payout, minimum, maximum, under in rows:
+            rollups.append(EnrollmentRollup(
+                    term=term,
+                    dimension=dimension,
+                    key=key,
+                    label=str(labels.get(key, term))[:255],
+                    sessions=sessions,
+                    tickets_sold=sold or 0,
+                    tickets_refunded=refunded or 0,
+                    gross_sales=money(gross),
+                    eventbrite_fees=money(fees),
+                    instructor_payout=money(payout),
+                    min_enrollment=minimum or 0,
+                    max_enrollment=maximum or 0,
+                    sessions_under_minimum=under or 0,
+                    fill_ratio=float(sold or 0) / maximum if maximum else 0.0,
+                    built=built,
+                    ))
+    return rollups
+
+def build_rollups(terms=None):
+    """Rebuilds the rollups of the given terms, or of every term with
+    published sessions, returning the terms built.
+    """
+    if terms is None:
+        span = Session.objects.exclude(event=None).exclude(first_start=None).aggregate(
+                first=Min('first_start'), last=Max('first_start'))
+        if span['first'] is None:
+            return []
+        terms = terms_between(span['first'], span['last'])
+    for term in terms:
+        rollups = term_rollups(term)
+        with transaction.atomic():
+            EnrollmentRollup.objects.filter(term=term).delete()
+            EnrollmentRollup.objects.bulk_create(rollups)
+    return list(terms)
@@ -0,0 +1,75 @@
+"""Ticket sales figures for Eventbrite events, computed in SQL.
+
+These are the same figures as django_eventbrite's per-event methods
+(quantity_sold() and friends), but as correlated subqueries that can be added
+to any queryset with a column referencing an event. That way a whole page of
+sessions or events gets its figures in the one query, and can be sorted on
+them.
+"""
+from collections import OrderedDict
+from django.db import connection
+from django_eventbrite.models import Attendee
+
+# The Attendee fields the figures are computed from.
+ATTENDEE_EVENT = 'event'
+ATTENDEE_QUANTITY = 'quantity'
+ATTENDEE_REFUNDED = 'refunded'
+ATTENDEE_CANCELED = 'cancelled'
+ATTENDEE_GROSS = 'gross'
+ATTENDEE_EVENTBRITE_FEE = 'eventbrite_fee'
+
+SALES_FIELDS = (
+    'quantity_sold',
+    'quantity_refunded',
+    'quantity_canceled',
+    'ticket_sales',
+    'eventbrite_fees',
+)
+
+def column(model, field_name):
+    """The fully-qualified, quoted column of a model field, for raw SQL."""
+    qn = connection.ops.quote_name
+    field = model._meta.get_field(field_name)
+    return '{0}.{1}'.format(qn(model._meta.db_table), qn(field.column))
+
+def attendee_subquery(aggregate, event_column, condition=None):
+    qn = connection.ops.quote_name
+    sql = 'SELECT COALESCE({0}, 0) FROM {1} WHERE {2} = {3}'.format(
+            aggregate,
+            qn(Attendee._meta.db_table),
+            column(Attendee, ATTENDEE_EVENT),
+            event_column)
+    if condition:
+        sql = '{0} AND {1}'.format(sql, condition)
+    return sql
+
+def sales_selects(event_column, prefix=''):
+    """Extra select clauses for the sales of the event in event_column."""
+    quantity = 'SUM({0})'.format(column(Attendee, ATTENDEE_QUANTITY))
+    refunded = column(Attendee, ATTENDEE_REFUNDED)
+    canceled = column(Attendee, ATTENDEE_CANCELED)
+    valid = 'NOT {0} AND NOT {1}'.format(refunded, canceled)
+    selects = OrderedDict((
+        ('quantity_sold', attendee_subquery(quantity, event_column, valid)),
+        ('quantity_refunded', attendee_subquery(quantity, event_column, refunded)),
+        ('quantity_canceled', attendee_subquery(quantity, event_column, canceled)),
+        ('ticket_sales', attendee_subquery(
+            'SUM({0})'.format(column(Attendee, ATTENDEE_GROSS)), event_column, valid)),
+        ('eventbrite_fees', attendee_subquery(
+            'SUM({0})'.format(column(Attendee, ATTENDEE_EVENTBRITE_FEE)), event_column, valid)),
+    ))
+    return OrderedDict((prefix + name, sql) for name, sql in selects.items())
+
+def with_sales(queryset, event_field=None, prefix=''):
+    """Adds the sales figures to each object of queryset.
+
+    event_field names the foreign key to the event; without it, the queryset
+    is assumed to be of events, which will need a prefix so that the figures
+    don't hide the methods of the same name.
+    """
+    model = queryset.model
+    if event_field:
+        event_column = column(model, event_field)
+    else:
+        event_column = column(model, model._meta.pk.name)
+    return queryset.extra(select=sales_selects(event_column, prefix))
@@ -0,0 +1,110 @@
+from asylum.classes import search
+from asylum.classes.models import AbsCourse, Course, Instructor, Session
+from asylum.classes.permissions import invalidate_editable
+from asylum.classes.teaching import rebuild_timelines
+from collections import defaultdict
+from datetime import datetime
+from dateutil import rrule
+from django.db import transaction
+from django.utils import timezone
+from schedule.models import Event as CalEvent, Rule
+
+FREQUENCIES = {
+    'DAILY': rrule.DAILY,
+    'WEEKLY': rrule.WEEKLY,
+    'MONTHLY': rrule.MONTHLY,
+}
+
+def copy_relations(pairs):
+    """Copies the many-to-many relations of courses to their sessions.
+
+    pairs is a list of (course, session) tuples. The relations are read with
+    one query per relation and written with one bulk insert per relation,
+    however many sessions there are.
+    """
+    sessions = defaultdict(list)
+    for course, session in pairs:
+        sessions[course.pk].append(session.pk)
+    instructor_ids = set()
+
+    for name in (field.name for field in AbsCourse._meta.many_to_many):
+        course_field = Course._meta.get_field(name)
+        session_field = Session._meta.get_field(name)
+        links = course_field.rel.through.objects.filter(**{
+            course_field.m2m_field_name() + '__in': list(sessions),
+            }).values_list(course_field.m2m_field_name(), course_field.m2m_reverse_field_name())
+
+        through = session_field.rel.through
+        rows = []
+        for course_id, related_id in links:
+            if name == 'instructors':
+                instructor_ids.add(related_id)
+            for session_id in sessions[course_id]:
+                rows.append(through(**{
+                    session_field.m2m_field_name() + '_id': session_id,
+                    session_field.m2m_reverse_field_name() + '_id': related_id,
+                    }))
+        through.objects.bulk_create(rows)
+
+    # bulk_create doesn't send m2m_changed, so the signals can't do this
+    rebuild_timelines([session for course, session in pairs])
+    search.reindex(Session.objects.filter(pk__in=[session.pk for course, session in pairs]))
+    invalidate_editable(Instructor.objects.filter(pk__in=instructor_ids).values_list('user', flat=True))
+
+def meeting_starts(start, meetings, frequency='WEEKLY', weekdays=None):
+    """The start times of a number of meetings on a recurring pattern."""
+    return list(rrule.rrule(FREQUENCIES[frequency],
+        dtstart=start,
+        byweekday=weekdays or None,
+        count=meetings))
+
+def build_rule(frequency, weekdays, meetings):
+    """An unsaved Rule for the pattern.
+
+    Each session gets a rule of its own, since editing a rule reschedules
+    every session on it.
+    """
+    params = ['count:{0}'.format(meetings)]
+    if weekdays:
+        params.append('byweekday:{0}'.format(','.join(str(d) for d in sorted(weekdays))))
+    params = ';'.join(params)
+    return Rule(frequency=frequency, params=params,
+            name='{0} {1}'.format(frequency.title(), params)[:32],
+            description='Created for a term schedule')
+
+def schedule_term(courses, first_day, start_time, duration, frequency='WEEKLY', weekdays=None):
+    """Creates a draft session of each course, all meeting on the same pattern.
+
+    Each session meets its course's number_of_meetings times, starting on or
+    after first_day at start_time (in the current time zone) and lasting
+    duration, on the given weekdays (0 being Monday). Everything is created
+    in a single transaction.
+
+    Django can't bulk-create rows whose primary keys are needed afterwards,
+    so the rules, calendar events and sessions are inserted one by one, but
+    their instructors, rooms and categories are bulk inserted for the whole
+    term.
+    """
+    start = timezone.make_aware(datetime.combine(first_day, start_time), timezone.get_current_timezone())
+    pairs = []
+    with transaction.atomic():
+        for course in courses:
+            meetings = max(course.number_of_meetings, 1)
+            starts = meeting_starts(start, meetings, frequency, weekdays)
+            rule = None
+            if meetings > 1:
+                rule = build_rule(frequency, weekdays, meetings)
+                rule.save()
+            cal = CalEvent.objects.create(
+                    title=course.name,
+                    start=starts[0],
+                    end=starts[0] + duration,
+                    rule=rule,
+                    end_recurring_period=starts[-1] + duration,
+                    )
+            session = course.build_session()
+            session.calendar_event = cal
+            session.save()
+            pairs.append((course, session))
+        copy_relations(pairs)
+    return [session for course, session in pairs]
@@ -0,0 +1,149 @@
+"""Full-text search over courses and sessions.
+
+Each course and session has a SearchDocument holding its name and the text
+of its description, blurb, instructors, categories and rooms, so a search is
+a scan of one table rather than a LIKE across six joins. On SQLite with FTS5
+the documents are also indexed in a virtual table, keyed by document id, and
+matches are ranked with bm25; elsewhere searches fall back to LIKE on the
+documents.
+"""
+from asylum.classes.export import CHUNK_SIZE, chunked
+from asylum.classes.models import Course, SearchDocument, Session
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connection, connections, transaction
+from django.db.models import Q
+import re
+
+FTS_TABLE = 'classes_searchindex'
+
+# matches in the title count for more than matches in the body
+TITLE_WEIGHT = 10.0
+BODY_WEIGHT = 1.0
+
+KINDS = {
+    Course: SearchDocument.KIND_COURSE,
+    Session: SearchDocument.KIND_SESSION,
+}
+
+_has_fts = {}
+
+def has_fts():
+    """Whether the database has the full-text index, checked once per database."""
+    name = connection.settings_dict['NAME']
+    if name not in _has_fts:
+        _has_fts[name] = (connection.vendor == 'sqlite' and
+                FTS_TABLE in connection.introspection.table_names())
+    return _has_fts[name]
+
+def create_index(using=DEFAULT_DB_ALIAS, **kwargs):
+    """Creates the FTS5 table, if the database can have one.
+
+    Connected to post_migrate, as the app has no migrations to do it.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    try:
+        with transaction.atomic(using):
+            connection.cursor().execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS {0} USING fts5(title, body, tokenize='porter unicode61')".format(
+                    FTS_TABLE))
+    except DatabaseError:
+        # SQLite without FTS5; searches use the fallback
+        pass
+    _has_fts.pop(connection.settings_dict['NAME'], None)
+
+def document_text(obj):
+    """The (title, body) a course or session is searched by."""
+    parts = [obj.description, obj.blurb]
+    for instructor in obj.instructors.all():
+        parts.extend((instructor.name, instructor.asylum_name))
+    parts.extend(category.name for category in obj.category.all())
+    parts.extend(room.name for room in obj.room.all())
+    return obj.name, '\n'.join(part for part in parts if part)
+
+def index(objects):
+    """Brings the documents of some courses or sessions (of one model) up to date."""
+    objects = list(objects)
+    if not objects:
+        return
+    kind = KINDS[type(objects[0])]
+    with transaction.atomic():
+        existing = dict(SearchDocument.objects.filter(
+            kind=kind, object_id__in=[obj.pk for obj in objects]).values_list('object_id', 'pk'))
+        rows = []
+        for obj in objects:
+            title, body = document_text(obj)
+            if obj.pk in existing:
+                doc_id = existing[obj.pk]
+                SearchDocument.objects.filter(pk=doc_id).update(title=title, body=body)
+            else:
+                doc_id = SearchDocument.objects.create(kind=kind, object_id=obj.pk, title=title, body=body).pk
+            rows.append((doc_id, title, body))
+        if has_fts():
+            cursor = connection.cursor()
+            cursor.executemany('DELETE FROM {0} WHERE rowid = %s'.format(FTS_TABLE),
+                    [(doc_id,) for doc_id, title, body in rows])
+            cursor.executemany('INSERT INTO {0} (rowid, title, body) VALUES (%s, %s, %s)'.format(FTS_TABLE), rows)
+
+def reindex(queryset):
+    """Indexes a queryset of courses or sessions, a chunk at a time."""
+    batch = []
+    for obj in chunked(queryset.prefetch_related('instructors', 'category', 'room')):
+        batch.append(obj)
+        if len(batch) == CHUNK_SIZE:
+            index(batch)
+            batch = []
+    index(batch)
+
+def unindex(model, pks):
+    documents = SearchDocument.objects.filter(kind=KINDS[model], object_id__in=list(pks))
+    with transaction.atomic():
+        if has_fts():
+            doc_ids = list(documents.values_list('pk', flat=True))
+            connection.cursor().executemany('DELETE FROM {0} WHERE rowid = %s'.format(FTS_TABLE),
+                    [(doc_id,) for doc_id in doc_ids])
+        documents.delete()
+
+def rebuild():
+    """Rebuilds every document from scratch."""
+    with transaction.atomic():
+        SearchDocument.objects.all().delete()
+        if has_fts():
+            connection.cursor().execute('DELETE FROM {0}'.format(FTS_TABLE))
+        reindex(Course.objects.all())
+        reindex(Session.objects.all())
+
+def terms(text):
+    return re.findall(r'\w+', text, re.UNICODE)
+
+def search(queryset, text):
+    """Filters a queryset of courses or sessions to those matching every term
+    of text, best matches first.
+
+    Terms match as prefixes, so a search can be typed out incrementally.
+    """
+    words = terms(text)
+    if not words:
+        return queryset.none()
+    kind = KINDS[queryset.model]
+    documents = SearchDocument._meta.db_table
+    if not has_fts():
+        matching = SearchDocument.objects.filter(kind=kind)
+        for word in words:
+            matching = matching.filter(Q(title__icontains=word) | Q(body__icontains=word))
+        return queryset.filter(pk__in=matching.values('object_id')).order_by('name')
+
+    qn = connection.ops.quote_name
+    match = ' '.join('"{0}"*'.format(word) for word in words)
+    pk_column = '{0}.{1}'.format(qn(queryset.model._meta.db_table), qn(queryset.model._meta.pk.column))
+    return queryset.extra(
+            select={'search_rank': 'bm25({0}, {1}, {2})'.format(FTS_TABLE, TITLE_WEIGHT, BODY_WEIGHT)},
+            tables=[documents, FTS_TABLE],
+            where=[
+                '{0}.kind = %s'.format(qn(documents)),
+                '{0}.object_id = {1}'.format(qn(documents), pk_column),
+                '{0}.rowid = {1}.id'.format(FTS_TABLE, qn(documents)),
+                '{0} MATCH %s'.format(FTS_TABLE),
+            ],
+            params=[kind, match],
+        ).order_by('search_rank')
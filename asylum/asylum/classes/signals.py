@@ -0,0 +1,255 @@
+from asylum.classes.caching import bump_version, invalidate_catalogue
+from asylum.classes.models import Category, Course, Instructor, Room, Session, TeachingOccurrence, TemplateText
+from asylum.classes import search
+from asylum.classes.permissions import invalidate_editable
+from asylum.classes.sales import ATTENDEE_EVENT
+from asylum.classes.utils import TEMPLATE_TEXT_VERSION
+from django.contrib.auth.models import User
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from django_eventbrite.models import Attendee, Event as EBEvent
+from schedule.models import Event as CalEvent, Occurrence, Rule
+
+def touch(sessions):
+    """Marks sessions as modified when something they show changes elsewhere.
+
+    This is what lets API clients sync with modified_since.
+    """
+    sessions.update(modified=timezone.now())
+
+def rebuild_occurrences(sessions):
+    course_ids = []
+    pks = []
+    for session in sessions:
+        session.rebuild_occurrences()
+        course_ids.append(session.course_id)
+        pks.append(session.pk)
+    if pks:
+        touch(Session.objects.filter(pk__in=pks))
+        invalidate_catalogue(course_ids)
+
+@receiver(post_save, sender=CalEvent)
+def calendar_event_saved(sender, instance, **kwargs):
+    sessions = list(Session.objects.filter(calendar_event=instance))
+    for session in sessions:
+        # use the instance that was saved rather than reloading it
+        session.calendar_event = instance
+    rebuild_occurrences(sessions)
+
+@receiver(post_save, sender=Rule)
+def rule_saved(sender, instance, **kwargs):
+    sessions = Session.objects.filter(calendar_event__rule=instance)
+    rebuild_occurrences(sessions.select_related('calendar_event__rule'))
+
+@receiver(post_save, sender=Occurrence)
+@receiver(post_delete, sender=Occurrence)
+def occurrence_changed(sender, instance, **kwargs):
+    sessions = Session.objects.filter(calendar_event=instance.event_id)
+    rebuild_occurrences(sessions.select_related('calendar_event__rule'))
+
+@receiver(post_save, sender=TemplateText)
+@receiver(post_delete, sender=TemplateText)
+def template_text_changed(sender, **kwargs):
+    bump_version(TEMPLATE_TEXT_VERSION)
+    invalidate_catalogue()
+
+@receiver(post_save, sender=Session)
+def session_saved(sender, instance, **kwargs):
+    # Changes to the calendar event itself are picked up above; this handles
+    # a session being pointed at a different one.
+    if instance.calendar_event_changed():
+        instance.rebuild_occurrences()
+    else:
+        # the state or hours may have changed
+        instance.rebuild_teaching()
+    # a session moved to another course leaves the old course's fragment stale
+    invalidate_catalogue([instance._loaded_course_id, instance.course_id])
+    instance._loaded_course_id = instance.course_id
+
+@receiver(post_delete, sender=Session)
+def session_deleted(sender, instance, **kwargs):
+    invalidate_catalogue([instance.course_id])
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def course_changed(sender, instance, **kwargs):
+    touch(Session.objects.filter(course=instance.pk))
+    invalidate_catalogue([instance.pk])
+
+# These show up on the pages but not inside the course fragments. Their
+# sessions are touched before a delete, while they can still be found.
+@receiver(post_save, sender=Category)
+@receiver(pre_delete, sender=Category)
+def category_changed(sender, instance, **kwargs):
+    touch(Session.objects.filter(category=instance))
+    invalidate_catalogue()
+
+@receiver(post_save, sender=Instructor)
+@receiver(pre_delete, sender=Instructor)
+def instructor_changed(sender, instance, **kwargs):
+    touch(Session.objects.filter(instructors=instance))
+    invalidate_catalogue()
+
+@receiver(post_save, sender=Room)
+@receiver(pre_delete, sender=Room)
+def room_changed(sender, instance, **kwargs):
+    touch(Session.objects.filter(room=instance))
+    invalidate_catalogue()
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Instructor)
+@receiver(post_delete, sender=Room)
+def catalogue_changed(sender, **kwargs):
+    invalidate_catalogue()
+
+@receiver(post_save, sender=EBEvent)
+@receiver(post_delete, sender=EBEvent)
+def eventbrite_event_changed(sender, instance, **kwargs):
+    sessions = Session.objects.filter(event=instance.pk)
+    touch(sessions)
+    invalidate_catalogue(sessions.values_list('course_id', flat=True))
+
+@receiver(post_save, sender=Attendee)
+@receiver(post_delete, sender=Attendee)
+def attendee_changed(sender, instance, **kwargs):
+    # the remaining capacity in the API has changed
+    event_id = getattr(instance, Attendee._meta.get_field(ATTENDEE_EVENT).attname)
+    touch(Session.objects.filter(event=event_id))
+
+@receiver(m2m_changed, sender=Session.category.through)
+@receiver(m2m_changed, sender=Session.room.through)
+def session_relations_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse and action in ('post_add', 'post_remove', 'post_clear'):
+        touch(Session.objects.filter(pk=instance.pk))
+        invalidate_catalogue([instance.course_id])
+    elif reverse and action in ('post_add', 'post_remove'):
+        touch(Session.objects.filter(pk__in=pk_set))
+        invalidate_catalogue()
+    elif reverse and action == 'pre_clear':
+        # afterwards there's no telling which sessions were affected
+        relation = 'category' if sender is Session.category.through else 'room'
+        touch(Session.objects.filter(**{relation: instance}))
+        invalidate_catalogue()
+
+@receiver(m2m_changed, sender=Course.category.through)
+def course_categories_changed(sender, instance, action, reverse, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_catalogue([] if reverse else [instance.pk])
+
+@receiver(m2m_changed, sender=Session.instructors.through)
+def session_instructors_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        touch(Session.objects.filter(instructors=instance))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        instance.rebuild_teaching()
+        touch(Session.objects.filter(pk=instance.pk))
+        invalidate_catalogue([instance.course_id])
+    elif action == 'post_clear':
+        # instance is an instructor who no longer teaches anything
+        TeachingOccurrence.objects.filter(instructor=instance).delete()
+        invalidate_catalogue()
+    else:
+        for session in Session.objects.filter(pk__in=pk_set):
+            session.rebuild_teaching()
+        touch(Session.objects.filter(pk__in=pk_set))
+        invalidate_catalogue()
+
+# Editable ids
+
+@receiver(m2m_changed, sender=Course.instructors.through)
+@receiver(m2m_changed, sender=Session.instructors.through)
+def editors_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            invalidate_editable([instance.user_id])
+    elif action == 'pre_clear':
+        # afterwards there's no telling whose were affected
+        instance._editors_cleared = list(instance.instructors.values_list('user', flat=True))
+    elif action == 'post_clear':
+        invalidate_editable(instance._editors_cleared)
+    elif action in ('post_add', 'post_remove'):
+        invalidate_editable(Instructor.objects.filter(pk__in=pk_set).values_list('user', flat=True))
+
+@receiver(post_save, sender=Instructor)
+def instructor_user_changed(sender, instance, **kwargs):
+    if instance._loaded_user_id != instance.user_id:
+        invalidate_editable([instance._loaded_user_id, instance.user_id])
+        instance._loaded_user_id = instance.user_id
+
+@receiver(post_delete, sender=Instructor)
+def instructor_deleted(sender, instance, **kwargs):
+    invalidate_editable([instance.user_id])
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    # in case the id is given to a new user
+    invalidate_editable([instance.pk])
+
+# Search documents
+
+@receiver(post_save, sender=Course)
+@receiver(post_save, sender=Session)
+def course_indexed(sender, instance, **kwargs):
+    search.index([instance])
+
+@receiver(post_delete, sender=Course)
+@receiver(post_delete, sender=Session)
+def course_unindexed(sender, instance, **kwargs):
+    search.unindex(sender, [instance.pk])
+
+@receiver(m2m_changed, sender=Course.instructors.through)
+@receiver(m2m_changed, sender=Course.category.through)
+@receiver(m2m_changed, sender=Course.room.through)
+@receiver(m2m_changed, sender=Session.instructors.through)
+@receiver(m2m_changed, sender=Session.category.through)
+@receiver(m2m_changed, sender=Session.room.through)
+def course_relations_indexed(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            search.index([instance])
+    elif action == 'pre_clear':
+        # afterwards there's no telling which were affected
+        relation = SEARCHED_RELATIONS[type(instance)]
+        instance._search_cleared = list(model.objects.filter(**{relation: instance}).values_list('pk', flat=True))
+    elif action == 'post_clear':
+        search.reindex(model.objects.filter(pk__in=instance._search_cleared))
+    elif action in ('post_add', 'post_remove'):
+        search.reindex(model.objects.filter(pk__in=pk_set))
+
+# the relation from courses and sessions to each model they're searched by
+SEARCHED_RELATIONS = {
+    Instructor: 'instructors',
+    Category: 'category',
+    Room: 'room',
+}
+
+def reindex_related(instance):
+    relation = SEARCHED_RELATIONS[type(instance)]
+    for model in (Course, Session):
+        search.reindex(model.objects.filter(**{relation: instance}))
+
+@receiver(post_save, sender=Instructor)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Room)
+def related_indexed(sender, instance, **kwargs):
+    reindex_related(instance)
+
+@receiver(pre_delete, sender=Instructor)
+@receiver(pre_delete, sender=Category)
+@receiver(pre_delete, sender=Room)
+def related_deleting(sender, instance, **kwargs):
+    # find what to reindex while the relations are still there
+    relation = SEARCHED_RELATIONS[type(instance)]
+    instance._search_related = [(model, list(model.objects.filter(**{relation: instance}).values_list('pk', flat=True)))
+            for model in (Course, Session)]
+
+@receiver(post_delete, sender=Instructor)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Room)
+def related_deleted(sender, instance, **kwargs):
+    for model, pks in getattr(instance, '_search_related', ()):
+        search.reindex(model.objects.filter(pk__in=pks))
+
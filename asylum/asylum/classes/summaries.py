@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+"""One-line summaries of when sessions meet, as shown in the listing.
+
+A summary is worked out in one pass over a session's occurrences, formatting
+only the handful of values that end up in the text, and is memoized on the
+occurrence times and formats, so a listing re-rendered after an edit mostly
+reuses the summaries of the sessions that didn't change.
+"""
+from asylum.classes.caching import LRUCache
+from collections import namedtuple
+from django.conf import settings
+from django.utils import timezone, translation
+from django.utils.dateformat import format, time_format
+from django.utils.timezone import template_localtime
+
+WEEKDAYS = frozenset((0, 1, 2, 3, 4))
+WEEKENDDAYS = frozenset((5, 6))
+ALL_DAYS = WEEKDAYS | WEEKENDDAYS
+
+Summary = namedtuple('Summary', 'count days dates times')
+
+EMPTY = Summary(0, '', '', '')
+
+summary_cache = LRUCache(4096)
+
+def oxford_comma(items):
+    if len(items) == 0:
+        return ''
+    if len(items) == 1:
+        return items[0]
+    elif len(items) == 2:
+        return "{0} & {1}".format(*items)
+    else:
+        joinme = items[:-1]
+        joinme.append("& {0}".format(items[-1]))
+        return ", ".join(joinme)
+
+def daynames(starts, fmt='l'):
+    """e.g. "Wednesdays", "Wednesday & Friday" or "Weekends"."""
+    # the day of the week depends on the time zone the day is named in
+    starts = [template_localtime(start) for start in starts]
+    unique_days = set()
+    for start in starts:
+        unique_days.add(start.weekday())
+
+    if len(starts) == 1:
+        return format(starts[0], fmt)
+    if unique_days == WEEKDAYS:
+        return "Weekdays"
+    if unique_days == WEEKENDDAYS:
+        return "Weekend" if len(starts) == 2 else "Weekends"
+    if unique_days == ALL_DAYS:
+        return "Daily"
+
+    # By doing it this way, we're guaranteed that the output represents the
+    # data regardless of the complexities of the repeating cycles.
+    days = [format(start, fmt) for start in starts[:len(unique_days)]]
+    if len(unique_days) == 1:
+        # e.g. "Wednesdays"
+        return "{0}s".format(days[0])
+    if len(starts) == len(unique_days):
+        # e.g. "Wednesday & Friday"
+        # e.g. "Wednesday, Thursday & Friday"
+        return oxford_comma(days)
+    # e.g. "Wednesdays & Fridays"
+    return oxford_comma(["{0}s".format(day) for day in days])
+
+def daterange(first, last, count, fmt=None):
+    """e.g. "March 4–25" or "March 4 & April 1"."""
+    fmt = fmt or settings.DATE_FORMAT
+    first = template_localtime(first)
+    if count == 1:
+        return format(first, fmt)
+    last = template_localtime(last)
+    delim = "–" if count > 2 else " & "
+    if first.month == last.month:
+        return "{0}{1}{2}".format(format(first, fmt), delim, last.day)
+    return "{0}{1}{2}".format(format(first, fmt), delim, format(last, fmt))
+
+def timerange(start, end):
+    """e.g. "6–9 p.m." or "10 a.m.–1 p.m."."""
+    start = template_localtime(start)
+    end = template_localtime(end)
+    if (start.hour < 12) == (end.hour < 12):
+        # the same half of the day, which needn't be repeated
+        return "{0}–{1}".format(start.hour % 12 or 12, time_format(end, settings.TIME_FORMAT))
+    return "{0}–{1}".format(time_format(start, settings.TIME_FORMAT), time_format(end, settings.TIME_FORMAT))
+
+def summarize(occurrences, day_format='l', date_format=None):
+    """The Summary of a list of occurrences, in order."""
+    times = tuple((o.start, o.end) for o in occurrences or ())
+    if not times:
+        return EMPTY
+    key = (times, day_format, date_format, timezone.get_current_timezone_name(), translation.get_language())
+    summary = summary_cache.get(key)
+    if summary is None:
+        starts = [start for start, end in times]
+        summary = Summary(
+                count=len(times),
+                days=daynames(starts, day_format),
+                dates=daterange(starts[0], starts[-1], len(starts), date_format),
+                times=timerange(*times[0]),
+                )
+        summary_cache.set(key, summary)
+    return summary
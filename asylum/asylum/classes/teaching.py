@@ -0,0 +1,65 @@
+from asylum.classes.models import Session, SessionOccurrence, TeachingOccurrence
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import Count, Max, Min, Sum
+
+def teaching(start=None, end=None):
+    """The instructors' timelines, optionally within a period."""
+    occurrences = TeachingOccurrence.objects.all()
+    if start:
+        occurrences = occurrences.filter(end__gt=start)
+    if end:
+        occurrences = occurrences.filter(start__lt=end)
+    return occurrences
+
+def rebuild_timelines(sessions):
+    """Session.rebuild_teaching() for many sessions, with one query for all
+    of their instructors and one for all of their occurrences.
+    """
+    sessions = dict((session.pk, session) for session in sessions)
+    field = Session._meta.get_field('instructors')
+    links = field.rel.through.objects.filter(**{
+        field.m2m_field_name() + '__in': list(sessions),
+        }).values_list(field.m2m_field_name(), field.m2m_reverse_field_name())
+    instructors = defaultdict(list)
+    for session_id, instructor_id in links:
+        instructors[session_id].append(instructor_id)
+    occurrences = defaultdict(list)
+    for occ in SessionOccurrence.objects.filter(session__in=list(sessions)):
+        occurrences[occ.session_id].append(occ)
+
+    rows = []
+    for session_id, session in sessions.items():
+        if session.state == Session.STATE_CANCELED:
+            continue
+        hours = session.meeting_hours(len(occurrences[session_id]))
+        for instructor_id in instructors[session_id]:
+            for occ in occurrences[session_id]:
+                rows.append(TeachingOccurrence(
+                    instructor_id=instructor_id,
+                    session=session,
+                    start=occ.start,
+                    end=occ.end,
+                    hours=hours,
+                    ))
+    with transaction.atomic():
+        TeachingOccurrence.objects.filter(session__in=list(sessions)).delete()
+        TeachingOccurrence.objects.bulk_create(rows)
+
+def busy(instructor, start, end):
+    """The (start, end) times the instructor is teaching within a period."""
+    return list(teaching(start, end).filter(instructor=instructor).values_list('start', 'end'))
+
+def teaching_load(start=None, end=None):
+    """The hours, meetings and sessions each instructor teaches within a period.
+
+    This is a single aggregate query over the timelines, returning a dict per
+    instructor, busiest first.
+    """
+    return teaching(start, end).values('instructor').annotate(
+            hours=Sum('hours'),
+            meetings=Count('id'),
+            sessions=Count('session', distinct=True),
+            first_start=Min('start'),
+            last_end=Max('end'),
+            ).order_by('-hours')
@@ -0,0 +1,9 @@
+from asylum.classes.rendering import render_markdown
+from django import template
+from django.utils.safestring import mark_safe
+register = template.Library()
+
+@register.filter(name='markdown')
+def markdown_filter(value, style='default'):
+    """A drop-in for markdown_deux's filter that caches the rendered HTML."""
+    return mark_safe(render_markdown(value, style))
@@ -1,3 +1,989 @@
+from asylum.classes.admin import AsylumAdminSite, SessionAdmin
+from asylum.classes.benchmarks import (STARTUP_STEPS, cold_import, eventbrite_templates, regressions,
+    synthetic_attendee, synthetic_catalogue, synthetic_event)
+from asylum.classes.conflicts import all_room_conflicts, instructor_conflicts, room_conflicts
+from asylum.classes.eb_sync import (RateLimiter, drain_sync_jobs, enqueue_sync, store_attendees, store_events,
+    sync_changes, sync_events)
+from asylum.classes.export import CHUNK_SIZE, export_events, export_sessions
+from asylum.classes.forms import ScheduleTermForm
+from asylum.classes.enrollment import send_digest, under_enrolled
+from asylum.classes.models import Category, Course, EnrollmentRollup, ImmutableError, Instructor, PayoutSession, PublishJob, RequestSample, Room, Session, SyncCursor, SyncJob, TeachingOccurrence, TemplateText
+from asylum.classes.payouts import create_batch
+from asylum.classes.permissions import editable_ids
+from asylum.classes.rollups import build_rollups, term_of
+from asylum.classes.publishing import BACKOFF_BASE, MAX_ATTEMPTS, drain, enqueue_publish
+from asylum.classes.scheduling import schedule_term
+from asylum.classes.sales import with_sales
+from asylum.classes.search import search
+from asylum.classes.summaries import EMPTY, summarize
+from asylum.classes.templatetags.schedule_extra import daynames
+from asylum.classes.teaching import teaching_load
+from asylum.classes.rendering import markdown_stats, render_markdown, reset_markdown_stats
+from asylum.classes.utils import PublishError, compile_template, render_template_text
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import ProtectedError
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.six import StringIO
+from django_eventbrite.models import Attendee, Event
+import csv
+import json
+import os
+import time as time_module
+from schedule.models import Event as CalEvent, Rule
 
-# Create your tests here.
+class AppQueries(CaptureQueriesContext):
+    """The queries made, less the database cache's own, which a deployment
+    with memcached wouldn't make.
+    """
+    def __init__(self):
+        super(AppQueries, self).__init__(connection)
+
+    @property
+    def captured_queries(self):
+        table = settings.CACHES['default'].get('LOCATION', '')
+        return [q for q in super(AppQueries, self).captured_queries
+                if not (table and table in q['sql'])]
+
+@contextmanager
+def assert_app_queries(test, count):
+    with AppQueries() as queries:
+        yield
+    test.assertEqual(len(queries), count, '\n'.join(q['sql'] for q in queries))
+
+def make_course(name='Intro to Welding', **kwargs):
+    fields = {
+        'name': name,
+        'blurb': 'Learn to *weld*.',
+        'description': 'All about welding.',
+        'max_enrollment': 8,
+        'ticket_price': 100,
+        'material_cost': 20,
+    }
+    fields.update(kwargs)
+    return Course.objects.create(**fields)
+
+def make_session(course, start=None, meetings=4, **kwargs):
+    start = start or timezone.make_aware(datetime(2015, 3, 4, 18), timezone.utc)
+    rule, _ = Rule.objects.get_or_create(name='Weekly', frequency='WEEKLY', description='Weekly')
+    cal = CalEvent.objects.create(
+            title=course.name,
+            start=start,
+            end=start + timedelta(hours=3),
+            rule=rule if meetings > 1 else None,
+            end_recurring_period=start + timedelta(weeks=meetings - 1, hours=3),
+            )
+    session = course.create_session()
+    session.calendar_event = cal
+    for field, value in kwargs.items():
+        setattr(session, field, value)
+    session.save()
+    return session
+
+class SessionListTest(TestCase):
+    def add_courses(self, category, count):
+        for i in range(count):
+            course = make_course('Course {0}'.format(i))
+            course.category.add(category)
+            make_session(course)
+            make_session(course, meetings=1)
+
+    def count_listing_queries(self):
+        with AppQueries() as queries:
+            response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_is_independent_of_catalogue_size(self):
+        metal = Category.objects.create(name='Metal')
+        self.add_courses(metal, 2)
+        small = self.count_listing_queries()
+
+        self.add_courses(metal, 10)
+        self.add_courses(Category.objects.create(name='Wood'), 10)
+        self.assertEqual(self.count_listing_queries(), small)
+
+    def test_listing_shows_sessions(self):
+        metal = Category.objects.create(name='Metal')
+        self.add_courses(metal, 1)
+        response = self.client.get('/')
+        self.assertContains(response, 'Course 0')
+        self.assertContains(response, 'Wednesdays')
+
+    def test_sessions_link_to_their_pages(self):
+        self.add_courses(Category.objects.create(name='Metal'), 1)
+        response = self.client.get('/')
+        for session in Session.objects.all():
+            self.assertContains(response, 'href="{0}"'.format(session.get_absolute_url()))
+        self.assertNotContains(response, '/admin/')
+
+class PageCacheTest(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Metal')
+        self.course = make_course()
+        self.course.category.add(self.category)
+        self.session = make_session(self.course)
+
+    def test_pages_are_cached(self):
+        self.client.get('/')
+        with assert_app_queries(self, 0):
+            response = self.client.get('/')
+        self.assertContains(response, 'Intro to Welding')
+
+        self.client.get('/courses/session/{0}/'.format(self.session.pk))
+        with assert_app_queries(self, 0):
+            self.client.get('/courses/session/{0}/'.format(self.session.pk))
+
+    def test_edits_invalidate(self):
+        self.client.get('/')
+        self.course.name = 'Advanced Welding'
+        self.course.save()
+        self.assertContains(self.client.get('/'), 'Advanced Welding')
+
+        self.category.name = 'Metalwork'
+        self.category.save()
+        self.assertContains(self.client.get('/'), 'Metalwork')
+
+        rule = self.session.calendar_event.rule
+        rule.params = 'count:4;byweekday:3'
+        rule.save()
+        self.assertContains(self.client.get('/'), 'Thursdays')
+
+Meeting = namedtuple('Meeting', 'start end')
+
+class SummaryTest(TestCase):
+    def summary(self, *days, **kwargs):
+        hours = kwargs.get('hours', (18, 21))
+        meetings = []
+        for day in days:
+            start = timezone.make_aware(datetime(2015, 3, day, hours[0]), timezone.utc)
+            meetings.append(Meeting(start, start.replace(hour=hours[1])))
+        return summarize(meetings, date_format='F j')
+
+    def test_summaries(self):
+        self.assertEqual(self.summary(4, 11, 18).days, 'Wednesdays')
+        self.assertEqual(self.summary(4, 6, 11, 13).days, 'Wednesdays & Fridays')
+        self.assertEqual(self.summary(4, 6).days, 'Wednesday & Friday')
+        self.assertEqual(self.summary(7, 8).days, 'Weekend')
+        self.assertEqual(self.summary(4, 11, 18).dates, 'March 4–18')
+        self.assertEqual(self.summary(4, 11).dates, 'March 4 & 11')
+
+    def test_days_are_local(self):
+        # 2 a.m. UTC on a Thursday is still Wednesday evening in New York
+        self.assertEqual(self.summary(5, 12, hours=(2, 4)).days, 'Wednesdays')
+
+    def test_no_occurrences(self):
+        self.assertEqual(summarize([]), EMPTY)
+        self.assertEqual(daynames([]), '')
+
+    def test_summaries_are_memoized(self):
+        self.assertIs(self.summary(4, 11), self.summary(4, 11))
+
+class SessionOccurrenceTest(TestCase):
+    def setUp(self):
+        self.session = make_session(make_course())
+
+    def test_occurrences_are_stored(self):
+        occurrences = self.session.get_occurrences()
+        self.assertEqual([o.ordinal for o in occurrences], [1, 2, 3, 4])
+        self.assertEqual(occurrences[1].start - occurrences[0].start, timedelta(weeks=1))
+
+    def test_rebuilt_when_calendar_event_changes(self):
+        cal = self.session.calendar_event
+        cal.end_recurring_period += timedelta(weeks=2)
+        cal.save()
+        self.assertEqual(self.session.occurrences.count(), 6)
+
+    def test_rebuilt_when_rule_changes(self):
+        rule = self.session.calendar_event.rule
+        rule.frequency = 'DAILY'
+        rule.save()
+        self.assertEqual(self.session.occurrences.count(), 22)
+
+    def test_summary_is_stored(self):
+        session = Session.objects.get(pk=self.session.pk)
+        self.assertEqual(session.meeting_count, 4)
+        self.assertEqual(session.last_end - session.first_start, timedelta(weeks=3, hours=3))
+        self.assertEqual(session.days_display, 'Wednesdays')
+        self.assertEqual(session.dates_display, 'March 4–25')
+
+        cal = session.calendar_event
+        cal.end_recurring_period += timedelta(weeks=2)
+        cal.save()
+        self.assertEqual(Session.objects.get(pk=self.session.pk).meeting_count, 6)
+
+    def test_filters_on_weekdays(self):
+        march = timezone.make_aware(datetime(2015, 3, 1), timezone.utc)
+        april = timezone.make_aware(datetime(2015, 4, 1), timezone.utc)
+        saturday = make_session(make_course('Weekend Welding'), start=march + timedelta(days=6, hours=18))
+        self.assertEqual(list(Session.objects.meets_only_on(5, 6).meets_between(march, april)), [saturday])
+        self.assertEqual(set(Session.objects.meets_on(2, 5)), set([self.session, saturday]))
+        self.assertEqual(list(Session.objects.meets_on(0)), [])
+
+    def test_reading_does_not_expand(self):
+        session = Session.objects.get(pk=self.session.pk)
+        with assert_app_queries(self, 1):
+            self.assertEqual(len(session.get_occurrences()), 4)
+
+class TemplateTextTest(TestCase):
+    def setUp(self):
+        self.text = TemplateText.objects.create(keyword='age', text='18+')
+
+    def test_substitutes_texts(self):
+        self.assertEqual(render_template_text('Ages {{age}}'), 'Ages 18+')
+
+    def test_texts_are_cached(self):
+        render_template_text('{{age}}')
+        with assert_app_queries(self, 0):
+            self.assertEqual(render_template_text('{{age}}'), '18+')
+
+    def test_editing_a_text_invalidates(self):
+        render_template_text('{{age}}')
+        self.text.text = '21+'
+        self.text.save()
+        self.assertEqual(render_template_text('{{age}}'), '21+')
+        self.text.delete()
+        self.assertEqual(render_template_text('{{age}}'), '')
+
+    def test_compiled_templates_are_reused(self):
+        self.assertIs(compile_template('a {{age}}'), compile_template('a {{age}}'))
+
+class MarkdownCacheTest(TestCase):
+    def setUp(self):
+        reset_markdown_stats()
+
+    def test_renders_are_reused(self):
+        first = render_markdown('Some *emphasis* here')
+        self.assertEqual(render_markdown('Some *emphasis* here'), first)
+        self.assertIn('<em>emphasis</em>', first)
+        self.assertEqual(markdown_stats(), {'hits': 1, 'misses': 1})
+
+
+class FailingEventbrite(object):
+    """A stand-in for the eb client that fails every request."""
+    def __init__(self):
+        self.calls = 0
+
+    def post_event(self, data):
+        self.calls += 1
+        return {'error': 'INTERNAL_ERROR', 'error_description': 'try again later'}
+
+    def post_event_ticket_classes(self, eb_id, data):
+        self.calls += 1
+        return {'error': 'INTERNAL_ERROR', 'error_description': 'try again later'}
+
+class PublishJobTest(TestCase):
+    def setUp(self):
+        self.session = make_session(make_course(), state=Session.STATE_READY_TO_PUBLISH)
+
+    def test_enqueue_is_idempotent(self):
+        job = enqueue_publish(self.session)
+        self.assertEqual(enqueue_publish(self.session).pk, job.pk)
+        self.assertEqual(PublishJob.objects.count(), 1)
+
+    def test_failures_are_retried_with_backoff(self):
+        enqueue_publish(self.session)
+        client = FailingEventbrite()
+        before = timezone.now()
+        drain(client, workers=1)
+
+        job = PublishJob.objects.get()
+        self.assertEqual(job.state, PublishJob.STATE_PENDING)
+        self.assertEqual(job.attempts, 1)
+        self.assertIn('INTERNAL_ERROR', job.last_error)
+        self.assertGreaterEqual(job.next_attempt, before + BACKOFF_BASE)
+
+        # not due yet, so draining again doesn't call Eventbrite
+        drain(client, workers=1)
+        self.assertEqual(client.calls, 1)
+        self.assertEqual(Session.objects.get(pk=self.session.pk).state, Session.STATE_READY_TO_PUBLISH)
+
+    def test_gives_up_after_max_attempts(self):
+        job = enqueue_publish(self.session)
+        client = FailingEventbrite()
+        for i in range(MAX_ATTEMPTS):
+            PublishJob.objects.filter(pk=job.pk).update(next_attempt=timezone.now())
+            drain(client, workers=1)
+        self.assertEqual(PublishJob.objects.get().state, PublishJob.STATE_FAILED)
+        self.assertEqual(client.calls, MAX_ATTEMPTS)
+
+    def test_sessions_not_ready_are_skipped(self):
+        enqueue_publish(self.session)
+        Session.objects.filter(pk=self.session.pk).update(state=Session.STATE_DRAFT)
+        client = FailingEventbrite()
+        drain(client, workers=1)
+        job = PublishJob.objects.get()
+        self.assertEqual(job.state, PublishJob.STATE_SKIPPED)
+        self.assertIn('not ready to publish', job.last_error)
+        self.assertEqual(client.calls, 0)
+
+class RecordedEventbrite(object):
+    """A stand-in for the eb client that replays recorded change feeds.
+
+    Like Eventbrite, it only returns items changed since changed_since, a
+    page of page_size at a time.
+    """
+    def __init__(self, page_size=1):
+        path = os.path.join(os.path.dirname(__file__), 'test_data', 'eventbrite_changes.json')
+        with open(path) as f:
+            self.recorded = json.load(f)
+        self.page_size = page_size
+        self.calls = []
+
+    def feed(self, key, page=1, changed_since=None, **params):
+        self.calls.append((key, page, changed_since))
+        items = self.recorded[key]
+        if changed_since:
+            since = parse_datetime(changed_since)
+            items = [i for i in items if parse_datetime(i['changed']) > since]
+        page_count = max(1, (len(items) + self.page_size - 1) // self.page_size)
+        start = (page - 1) * self.page_size
+        return {
+            key: items[start:start + self.page_size],
+            'pagination': {'page_number': page, 'page_count': page_count},
+        }
+
+    def get_user_owned_events(self, user_id, **params):
+        return self.feed('events', **params)
+
+    def get_user_owned_event_attendees(self, user_id, **params):
+        return self.feed('attendees', **params)
+
+    def get_event(self, eb_id):
+        self.calls.append(('event', eb_id))
+        for event in self.recorded['events']:
+            if event['id'] == str(eb_id):
+                return event
+        return {'error': 'NOT_FOUND', 'error_description': 'No such event'}
+
+    def get_event_attendees(self, eb_id, page=1):
+        self.calls.append(('attendees', page, eb_id))
+        items = [a for a in self.recorded['attendees'] if a['event_id'] == str(eb_id)]
+        page_count = max(1, (len(items) + self.page_size - 1) // self.page_size)
+        start = (page - 1) * self.page_size
+        return {
+            'attendees': items[start:start + self.page_size],
+            'pagination': {'page_number': page, 'page_count': page_count},
+        }
+
+class SyncEventsTest(TestCase):
+    def test_events_and_attendees_are_stored(self):
+        client = RecordedEventbrite()
+        results = sync_events(['16012431001', '16012431002', '404'], client=client, rate=1000)
+        by_id = dict((r.eb_id, r) for r in results)
+        self.assertEqual(by_id['16012431001'].attendees, 2)
+        self.assertEqual(by_id['16012431002'].attendees, 0)
+        self.assertIn('NOT_FOUND', str(by_id['404'].error))
+        self.assertEqual(Event.objects.count(), 2)
+        self.assertEqual(Attendee.objects.count(), 2)
+        # one page of attendees each, with a page size of one
+        self.assertEqual(len([c for c in client.calls if c[0] == 'attendees' and c[2] == '16012431001']), 2)
+
+    def test_admin_requests_are_queued(self):
+        job = enqueue_sync(['16012431001'])
+        self.assertEqual(Event.objects.count(), 0)
+        self.assertEqual(drain_sync_jobs(client=RecordedEventbrite(), rate=1000), [job])
+        job = SyncJob.objects.get()
+        self.assertEqual(job.state, SyncJob.STATE_DONE)
+        self.assertIn('Synced 1 events (2 attendees)', job.summary)
+        self.assertEqual(drain_sync_jobs(client=RecordedEventbrite()), [])
+
+    def test_limiter_paces_requests(self):
+        limiter = RateLimiter(50, burst=2)
+        start = time_module.time()
+        for i in range(7):
+            limiter.wait()
+        # the burst is free, then each request waits a fiftieth of a second
+        self.assertGreaterEqual(time_module.time() - start, 5 / 50.0 * 0.9)
+
+class SyncChangesTest(TestCase):
+    def test_only_changes_are_fetched(self):
+        client = RecordedEventbrite()
+        self.assertEqual(sync_changes(client=client), {'events': 2, 'attendees': 2})
+        self.assertEqual(Event.objects.count(), 2)
+        self.assertEqual(Attendee.objects.count(), 2)
+        cursor = SyncCursor.objects.get(resource='attendees')
+        self.assertEqual(cursor.high_water, parse_datetime('2015-02-15T08:30:00Z'))
+
+        client.calls = []
+        self.assertEqual(sync_changes(client=client), {'events': 0, 'attendees': 0})
+        self.assertEqual(client.calls, [
+            ('events', 1, '2015-02-14T17:45:00Z'),
+            ('attendees', 1, '2015-02-15T08:30:00Z'),
+            ])
+
+    def test_overlapping_runs_are_refused(self):
+        sync_changes(client=RecordedEventbrite())
+        cursor = SyncCursor.objects.get(resource='events')
+        self.assertIsNone(cursor.locked_until)
+
+        SyncCursor.objects.filter(pk=cursor.pk).update(locked_until=timezone.now() + timedelta(minutes=5))
+        self.assertIsNone(sync_changes(client=RecordedEventbrite()))
+        # a lease left by a run that died runs out
+        SyncCursor.objects.filter(pk=cursor.pk).update(locked_until=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(sync_changes(client=RecordedEventbrite()), {'events': 0, 'attendees': 0})
+
+    def test_failed_feed_keeps_earlier_progress(self):
+        client = RecordedEventbrite()
+        client.get_user_owned_event_attendees = lambda user_id, **params: {'error': 'INTERNAL_ERROR'}
+        with self.assertRaises(PublishError):
+            sync_changes(client=client)
+        self.assertEqual(Event.objects.count(), 2)
+        self.assertEqual(SyncCursor.objects.get(resource='events').high_water, parse_datetime('2015-02-14T17:45:00Z'))
+        self.assertIsNone(SyncCursor.objects.get(resource='attendees').high_water)
+        self.assertIsNone(SyncCursor.objects.get(resource='events').locked_until)
+
+class SessionChangelistTest(TestCase):
+    def setUp(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.login(username='admin', password='admin')
+
+    def add_sessions(self, count):
+        for i in range(count):
+            course = make_course('Course {0}'.format(i))
+            course.instructors.add(Instructor.objects.create(name='Instructor {0}'.format(i)))
+            make_session(course)
+
+    def count_changelist_queries(self, **params):
+        with AppQueries() as queries:
+            response = self.client.get('/admin/classes/session/', params)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_is_independent_of_page_size(self):
+        self.add_sessions(2)
+        few = self.count_changelist_queries()
+        self.add_sessions(20)
+        self.assertEqual(self.count_changelist_queries(), few)
+
+    def assert_row_order(self, column, sessions):
+        content = self.client.get('/admin/classes/session/', {'o': column}).content.decode('utf-8')
+        positions = [content.index(session.name) for session in sessions]
+        self.assertEqual(positions, sorted(positions))
+
+    def test_sorts_on_sales(self):
+        synthetic_catalogue(3, sessions_per_course=1)
+        _, attendee_template = eventbrite_templates()
+        sessions = list(Session.objects.select_related('event').order_by('pk'))
+        # the first session sells most, the last least
+        store_attendees([synthetic_attendee(attendee_template, session.pk * 1000 + i, session.event.eb_id)
+            for n, session in enumerate(sessions) for i in range(3 - n)])
+
+        for name in ('quantity_sold', 'ticket_sales'):
+            # the action checkbox is column 0
+            column = SessionAdmin.list_display.index(name) + 1
+            self.assert_row_order(column, list(reversed(sessions)))
+            self.assert_row_order('-{0}'.format(column), sessions)
+
+def csv_rows(response):
+    return list(csv.reader(b''.join(response.streaming_content).decode('utf-8').splitlines()))
+
+class ExportTest(TestCase):
+    def test_events_are_exported_a_chunk_at_a_time(self):
+        event_template, attendee_template = eventbrite_templates()
+        count = CHUNK_SIZE + 5
+        store_events([synthetic_event(event_template, 1000 + i, 'Event {0}'.format(i)) for i in range(count)])
+        store_attendees([synthetic_attendee(attendee_template, 5000 + i, 1000) for i in range(2)])
+
+        with AppQueries() as queries:
+            rows = csv_rows(export_events(Event.objects.all()))
+        # one query per chunk, and one to find there are no more
+        self.assertEqual(len(queries), 3)
+        header, rows = rows[0], rows[1:]
+        self.assertEqual(len(rows), count)
+        pks = [int(row[header.index('id')]) for row in rows]
+        self.assertEqual(pks, sorted(Event.objects.values_list('pk', flat=True)))
+        first = dict(zip(header, rows[0]))
+        self.assertEqual(first['eb_id'], '1000')
+        self.assertEqual(first['quantity_sold'], '2')
+        self.assertEqual(dict(zip(header, rows[1]))['quantity_sold'], '0')
+
+    def test_sessions_have_their_sales(self):
+        synthetic_catalogue(2, sessions_per_course=1, attendees_per_event=3)
+        rows = csv_rows(export_sessions(Session.objects.all()))
+        header, rows = rows[0], rows[1:]
+        self.assertEqual([int(row[0]) for row in rows], sorted(Session.objects.values_list('pk', flat=True)))
+        self.assertEqual([row[header.index('quantity_sold')] for row in rows], ['3', '3'])
+
+    def test_event_admin_export_has_sales(self):
+        event_template, attendee_template = eventbrite_templates()
+        store_events([synthetic_event(event_template, 1000, 'Welding')])
+        store_attendees([synthetic_attendee(attendee_template, 5000, 1000)])
+        User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.login(username='admin', password='admin')
+        # the first format is CSV
+        response = self.client.post('/admin/django_eventbrite/event/export/', {'file_format': '0'})
+        rows = list(csv.reader(response.content.decode('utf-8').splitlines()))
+        self.assertEqual(dict(zip(rows[0], rows[1]))['quantity_sold'], '1')
+
+class SearchTest(TestCase):
+    def setUp(self):
+        self.welding = make_course('Intro to Welding', description='Safety first.')
+        self.welder = Instructor.objects.create(name='Pat Smith')
+        self.welding.instructors.add(self.welder)
+        self.welding.category.add(Category.objects.create(name='Metal'))
+        self.sewing = make_course('Sewing', blurb='Make a bag.', description='Welding is not covered.')
+
+    def names(self, text):
+        return [course.name for course in search(Course.objects.all(), text)]
+
+    def test_finds_by_related_text(self):
+        self.assertEqual(self.names('pat metal'), ['Intro to Welding'])
+        self.assertEqual(self.names('bag'), ['Sewing'])
+        self.assertEqual(self.names('knitting'), [])
+
+    def test_follows_edits(self):
+        self.welder.name = 'Sam Jones'
+        self.welder.save()
+        self.assertEqual(self.names('pat'), [])
+        self.assertEqual(self.names('jones'), ['Intro to Welding'])
+
+        self.welding.instructors.clear()
+        self.assertEqual(self.names('jones'), [])
+        self.welding.delete()
+        self.assertEqual(self.names('welding'), ['Sewing'])
+
+    def test_search_endpoint_lists_public_sessions(self):
+        public = make_session(self.welding, state=Session.STATE_PUBLIC)
+        make_session(self.welding)
+        response = self.client.get('/courses/api/search.json', {'q': 'weld', 'fields': 'id'})
+        self.assertEqual(json.loads(response.content.decode('utf-8'))['results'], [{'id': public.pk}])
+
+    def test_admin_search(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.login(username='admin', password='admin')
+        self.welding.instructors.add(Instructor.objects.create(name='Pat Jones'))
+        response = self.client.get('/admin/classes/course/', {'q': 'pat'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.welding])
+
+class ScheduleTermTest(TestCase):
+    def setUp(self):
+        self.room = Room.objects.create(name='Classroom')
+        self.courses = []
+        for i in range(3):
+            course = make_course('Course {0}'.format(i), number_of_meetings=4)
+            course.room.add(self.room)
+            course.instructors.add(Instructor.objects.create(name='Instructor {0}'.format(i)))
+            self.courses.append(course)
+
+    def test_creates_sessions_on_the_pattern(self):
+        sessions = schedule_term(self.courses, date(2015, 3, 2), time(18, 30), timedelta(hours=3),
+                weekdays=[1, 3])
+        self.assertEqual(len(sessions), 3)
+        for course, session in zip(self.courses, sessions):
+            self.assertEqual(session.state, Session.STATE_DRAFT)
+            self.assertEqual(list(session.room.all()), [self.room])
+            self.assertEqual(list(session.instructors.all()), list(course.instructors.all()))
+            starts = [timezone.localtime(o.start) for o in session.get_occurrences()]
+            self.assertEqual([s.day for s in starts], [3, 5, 10, 12])
+            self.assertEqual(starts[0].time(), time(18, 30))
+
+    def test_editing_one_sessions_rule_leaves_the_others(self):
+        first, second, third = schedule_term(self.courses, date(2015, 3, 2), time(18, 30), timedelta(hours=3),
+                weekdays=[1, 3])
+        rule = first.calendar_event.rule
+        self.assertNotEqual(rule.pk, second.calendar_event.rule.pk)
+        rule.params = 'count:2;byweekday:1,3'
+        rule.save()
+        self.assertEqual(Session.objects.get(pk=first.pk).meeting_count, 2)
+        self.assertEqual(Session.objects.get(pk=second.pk).meeting_count, 4)
+
+    def test_create_session_copies_relations(self):
+        session = self.courses[0].create_session()
+        self.assertEqual(list(session.room.all()), [self.room])
+        self.assertEqual(session.name, 'Course 0')
+
+    def test_meetings_take_some_time(self):
+        data = {'first_day': '2015-03-02', 'start_time': '18:30', 'frequency': 'WEEKLY', 'hours': '0'}
+        self.assertIn('hours', ScheduleTermForm(data).errors)
+
+    def test_command_applies_category_and_courses(self):
+        category = Category.objects.create(name='Welding')
+        for course in self.courses[:2]:
+            course.category.add(category)
+        call_command('schedule_term', str(self.courses[1].pk), str(self.courses[2].pk), category='Welding',
+                first_day='2015-03-02', start_time='18:30', hours='3', stdout=StringIO())
+        self.assertEqual([s.course for s in Session.objects.all()], [self.courses[1]])
+
+class RoomConflictTest(TestCase):
+    def setUp(self):
+        self.room = Room.objects.create(name='Classroom')
+        self.booked = make_session(make_course('Booked'))
+        self.booked.room.add(self.room)
+
+    def occurrences(self, session):
+        return [(o.start, o.end) for o in session.get_occurrences()]
+
+    def test_overlapping_session_conflicts(self):
+        start = self.booked.calendar_event.start + timedelta(weeks=2, hours=1)
+        other = make_session(make_course('Other'), start=start, meetings=1)
+        conflicts = room_conflicts(self.occurrences(other), [self.room], other.pk)
+        self.assertEqual([c.other_session for c in conflicts], [self.booked.pk])
+
+        other.room.add(self.room)
+        self.assertEqual(len(all_room_conflicts()), 1)
+
+    def test_sessions_in_several_rooms_conflict_once(self):
+        self.booked.room.add(Room.objects.create(name='Workshop'))
+        start = self.booked.calendar_event.start + timedelta(hours=1)
+        other = make_session(make_course('Other'), start=start, meetings=1)
+        conflicts = room_conflicts(self.occurrences(other), [self.room], other.pk)
+        self.assertEqual([(c.resource, c.other_session) for c in conflicts], [(self.room.pk, self.booked.pk)])
+
+        other.room.add(self.room)
+        self.assertEqual(len(all_room_conflicts()), 1)
+
+    def test_adjacent_session_does_not_conflict(self):
+        start = self.booked.calendar_event.end
+        other = make_session(make_course('Other'), start=start)
+        self.assertEqual(room_conflicts(self.occurrences(other), [self.room], other.pk), [])
+
+    def test_canceled_sessions_free_the_room(self):
+        self.booked.state = Session.STATE_CANCELED
+        self.booked.save()
+        other = make_session(make_course('Other'))
+        self.assertEqual(room_conflicts(self.occurrences(other), [self.room], other.pk), [])
+
+class TeachingTest(TestCase):
+    def setUp(self):
+        self.instructor = Instructor.objects.create(name='Ada')
+        self.session = make_session(make_course(instructor_hours=12, number_of_meetings=4))
+
+    def test_timeline_follows_assignments(self):
+        self.assertEqual(TeachingOccurrence.objects.count(), 0)
+        self.session.instructors.add(self.instructor)
+        self.assertEqual(self.instructor.timeline.count(), 4)
+        self.session.instructors.remove(self.instructor)
+        self.assertEqual(self.instructor.timeline.count(), 0)
+
+    def test_timeline_follows_schedule_and_state(self):
+        self.session.instructors.add(self.instructor)
+        cal = self.session.calendar_event
+        cal.end_recurring_period += timedelta(weeks=1)
+        cal.save()
+        self.assertEqual(self.instructor.timeline.count(), 5)
+
+        self.session.state = Session.STATE_CANCELED
+        self.session.save()
+        self.assertEqual(self.instructor.timeline.count(), 0)
+
+    def test_load_and_conflicts(self):
+        self.session.instructors.add(self.instructor)
+        load = list(teaching_load())
+        self.assertEqual(load[0]['hours'], Decimal('12'))
+        self.assertEqual(load[0]['meetings'], 4)
+
+        other = make_session(make_course('Other'), meetings=1)
+        occurrences = [(o.start, o.end) for o in other.get_occurrences()]
+        conflicts = instructor_conflicts(occurrences, [self.instructor], other.pk)
+        self.assertEqual([c.other_session for c in conflicts], [self.session.pk])
+
+    def test_scheduled_sessions_are_on_the_timeline(self):
+        course = make_course('Scheduled', instructor_hours=6, number_of_meetings=3)
+        course.instructors.add(self.instructor)
+        session, = schedule_term([course], date(2015, 3, 2), time(18, 30), timedelta(hours=2))
+        timeline = self.instructor.timeline.filter(session=session)
+        self.assertEqual(timeline.count(), 3)
+        self.assertEqual(set(timeline.values_list('hours', flat=True)), set([Decimal('2')]))
+        self.assertEqual(list(teaching_load())[0]['meetings'], 3)
+
+class FeedTest(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Metal')
+        course = make_course()
+        course.category.add(self.category)
+        self.session = make_session(course, state=Session.STATE_PUBLIC)
+        self.url = '/courses/category/{0}.ics'.format(self.category.pk)
+
+    def test_feed_lists_public_occurrences(self):
+        make_session(make_course('Draft'))
+        response = self.client.get(self.url)
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        self.assertEqual(response.content.count(b'BEGIN:VEVENT'), 4)
+        self.assertNotIn(b'Draft', response.content)
+
+    def test_unchanged_feed_is_not_rebuilt(self):
+        etag = self.client.get(self.url)['ETag']
+        with assert_app_queries(self, 1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.session.state = Session.STATE_CANCELED
+        self.session.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(b'BEGIN:VEVENT', response.content)
+
+    def test_feed_for_a_deleted_category_is_gone(self):
+        etag = self.client.get(self.url)['ETag']
+        self.category.delete()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 404)
+        self.assertEqual(self.client.get('/courses/room/999.ics', HTTP_IF_NONE_MATCH=etag).status_code, 404)
+
+class ApiTest(TestCase):
+    url = '/courses/api/sessions.json'
+
+    def setUp(self):
+        self.course = make_course()
+        self.course.category.add(Category.objects.create(name='Metal'))
+        self.sessions = [make_session(self.course, state=Session.STATE_PUBLIC) for i in range(3)]
+        make_session(make_course('Draft'))
+
+    def get(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content.decode('utf-8'))
+
+    def test_pages_through_public_sessions(self):
+        first = self.get(limit=2)
+        self.assertEqual([s['id'] for s in first['results']], [s.pk for s in self.sessions[:2]])
+        second = self.get(limit=2, cursor=first['next'])
+        self.assertEqual([s['id'] for s in second['results']], [self.sessions[2].pk])
+        self.assertIsNone(second['next'])
+
+        session = second['results'][0]
+        self.assertEqual(session['course'], {'id': self.course.pk, 'name': 'Intro to Welding'})
+        self.assertEqual(session['categories'][0]['name'], 'Metal')
+        self.assertEqual(len(session['occurrences']), 4)
+        self.assertEqual(session['ticket_price']['currency'], 'USD')
+        self.assertEqual(session['remaining'], session['max_enrollment'])
+
+    def test_field_selection(self):
+        page = self.get(fields='id,name')
+        self.assertEqual(list(page['results'][0]), ['id', 'name'])
+        self.assertEqual(self.client.get(self.url, {'fields': 'secret'}).status_code, 400)
+
+    def test_query_count_is_independent_of_page_size(self):
+        with AppQueries() as queries:
+            self.get(limit=1)
+        small = len(queries)
+        with AppQueries() as queries:
+            self.get(limit=3)
+        self.assertEqual(len(queries), small)
+
+    def test_unchanged_page_is_not_rebuilt(self):
+        etag = self.client.get(self.url)['ETag']
+        with assert_app_queries(self, 1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_related_edits_are_picked_up_since(self):
+        since = timezone.now()
+        self.assertEqual(self.get(modified_since=since.isoformat())['results'], [])
+        self.course.name = 'Advanced Welding'
+        self.course.save()
+        self.assertEqual(len(self.get(modified_since=since.isoformat())['results']), 3)
+
+class BenchmarkTest(TestCase):
+    def test_synthetic_catalogue(self):
+        synthetic_catalogue(3, sessions_per_course=2, attendees_per_event=2, template_texts=2)
+        self.assertEqual(Session.objects.filter(state=Session.STATE_PUBLIC).exclude(event=None).count(), 6)
+        self.assertEqual(Attendee.objects.count(), 12)
+
+    def test_regressions(self):
+        baseline = {'catalogue': {'session_list_queries': 5, 'session_list_seconds': 1.0, 'courses': 100}}
+        results = {'catalogue': {'session_list_queries': 6, 'session_list_seconds': 1.1, 'courses': 200}}
+        self.assertEqual(regressions(baseline, results),
+                [('catalogue', 'session_list_queries', 5, 6)])
+
+class InstrumentationTest(TestCase):
+    def setUp(self):
+        self.session = make_session(make_course())
+
+    @override_settings(ASYLUM_INSTRUMENTATION_SAMPLE_RATE=1)
+    def test_sampled_requests_are_timed(self):
+        response = self.client.get('/courses/session/{0}/'.format(self.session.pk))
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('template_text;dur=', response['Server-Timing'])
+        sample = RequestSample.objects.get()
+        self.assertEqual(sample.view, 'asylum.classes.views.session_item')
+        self.assertGreater(sample.queries, 0)
+
+        User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.login(username='admin', password='admin')
+        self.assertContains(self.client.get('/admin/classes/requestsample/'), 'session_item')
+
+    def test_unsampled_requests_are_not(self):
+        response = self.client.get('/courses/session/{0}/'.format(self.session.pk))
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(RequestSample.objects.count(), 0)
+
+class AdminSiteTest(TestCase):
+    def test_registrations_are_stolen_on_first_use(self):
+        stock = admin.AdminSite(name='stock')
+        stock.register(Room)
+        site = AsylumAdminSite(name='lazy')
+        self.assertFalse(site.discovered)
+        site.get_urls()
+        self.assertTrue(site.discovered)
+        site.steal_registrations(stock)
+        self.assertIn(Room, site._registry)
+        self.assertNotIn(Room, stock._registry)
+
+    def test_public_requests_do_not_import_the_admin(self):
+        name, setup, statement, teardown = STARTUP_STEPS[1]
+        # the first request's setup seeds a session the listing links to
+        self.assertIn('create_session()', setup)
+        cold_import(statement + '; assert b"/courses/session/" in Client().get("/").content'
+            '; assert not [m for m in ("asylum.classes.admin", "import_export.admin", '
+            '"pagedown.widgets", "html2text", "django_eventbrite.utils") if m in sys.modules]', setup,
+            repeat=1, teardown=teardown)
+
+class EditableIdsTest(TestCase):
+    def setUp(self):
+        # user ids are reused once each test is rolled back
+        cache.clear()
+        self.user = User.objects.create_user('teacher', 'teacher@example.com', 'teacher')
+        self.user.is_staff = True
+        self.user.save()
+        self.instructor = Instructor.objects.create(name='Pat', user=self.user,
+                employment_type='1099', payment_type='check')
+        self.course = make_course()
+        self.course.instructors.add(self.instructor)
+        self.other = make_course('Intro to Lathes')
+
+    def test_collaborators_can_change_their_own(self):
+        self.assertTrue(self.user.has_perm('classes.change_course', self.course))
+        self.assertFalse(self.user.has_perm('classes.change_course', self.other))
+
+        user = User.objects.get(pk=self.user.pk)
+        with assert_app_queries(self, 0):
+            # from the shared cache
+            self.assertEqual(editable_ids(user, Course), frozenset([self.course.pk]))
+
+    def test_instructor_changes_invalidate(self):
+        editable_ids(self.user, Course)
+        self.course.instructors.remove(self.instructor)
+        self.assertFalse(User.objects.get(pk=self.user.pk).has_perm('classes.change_course', self.course))
+
+        self.other.instructors.add(self.instructor)
+        self.assertTrue(User.objects.get(pk=self.user.pk).has_perm('classes.change_course', self.other))
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_process_local_cache_is_not_trusted(self):
+        editable_ids(self.user, Course)
+        # as if from another process, where no signal invalidates this one's cache
+        Course.instructors.through.objects.filter(course=self.course).delete()
+        self.assertEqual(editable_ids(User.objects.get(pk=self.user.pk), Course), frozenset())
+
+    def test_changelist_only_shows_editable(self):
+        self.client.login(username='teacher', password='teacher')
+        response = self.client.get('/admin/classes/course/')
+        self.assertContains(response, 'Intro to Welding')
+        self.assertNotContains(response, 'Intro to Lathes')
+
+class RollupTest(TestCase):
+    def setUp(self):
+        synthetic_catalogue(3, sessions_per_course=1, attendees_per_event=2)
+
+    def test_totals_match_the_sales(self):
+        sessions = list(with_sales(Session.objects.all(), 'event'))
+        self.assertEqual(build_rollups(), [term_of(sessions[0].first_start)])
+        total = EnrollmentRollup.objects.get(dimension=EnrollmentRollup.DIMENSION_TERM)
+        self.assertEqual(total.sessions, 3)
+        self.assertEqual(total.tickets_sold, sum(s.quantity_sold for s in sessions))
+        self.assertEqual(total.max_enrollment, sum(s.max_enrollment for s in sessions))
+        by_room = EnrollmentRollup.objects.filter(dimension=EnrollmentRollup.DIMENSION_ROOM)
+        # every session is in two rooms
+        self.assertEqual(sum(r.sessions for r in by_room), 6)
+
+    def test_report_and_export(self):
+        build_rollups()
+        User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.login(username='admin', password='admin')
+        self.assertContains(self.client.get('/admin/classes/enrollmentrollup/'), 'Instructor payout')
+        response = self.client.get('/admin/classes/enrollmentrollup/export/')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()),
+                EnrollmentRollup.objects.count() + 1)
+
+    def test_rebuilding_a_malformed_term(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.login(username='admin', password='admin')
+        response = self.client.post('/admin/classes/enrollmentrollup/', {'term': '2015-Q5'}, follow=True)
+        self.assertContains(response, 'Terms look like 2015-Q1')
+        self.assertEqual(EnrollmentRollup.objects.count(), 0)
+
+class PayoutTest(TestCase):
+    def setUp(self):
+        synthetic_catalogue(2, sessions_per_course=1, attendees_per_event=2)
+        self.start = timezone.make_aware(datetime(2015, 1, 1), timezone.utc)
+        self.end = timezone.make_aware(datetime(2016, 1, 1), timezone.utc)
+
+    def test_sessions_are_paid_once(self):
+        sessions = list(with_sales(Session.objects.all(), 'event'))
+        batch = create_batch(self.start, self.end)
+        self.assertEqual(batch.sessions.count(), 2)
+        net = sum(s.ticket_sales - s.eventbrite_fees for s in sessions)
+        self.assertAlmostEqual(float(sum(line.net_sales for line in batch.lines.all())), float(net), places=1)
+        self.assertEqual(batch.total, sum(line.amount for line in batch.lines.all()))
+
+        self.assertIsNone(create_batch(self.start, self.end))
+        with self.assertRaises(ImmutableError):
+            batch.save()
+
+    def test_paid_sessions_are_kept(self):
+        batch = create_batch(self.start, self.end)
+        session = batch.sessions.all()[0]
+        with self.assertRaises(ProtectedError):
+            session.delete()
+        with self.assertRaises(ImmutableError):
+            session.payout.delete()
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                PayoutSession.objects.create(batch=batch, session=session)
+
+    def test_materials_in_the_ticket_are_reimbursed(self):
+        Session.objects.update(material_cost_collection=Session.MATERIAL_COST_INCLUDED_IN_TICKET)
+        sessions = list(with_sales(Session.objects.all(), 'event'))
+        batch = create_batch(self.start, self.end)
+        materials = sum(s.quantity_sold * s.material_cost.amount for s in sessions)
+        self.assertAlmostEqual(float(sum(line.materials for line in batch.lines.all())), float(materials), places=1)
+        for line in batch.lines.all():
+            self.assertAlmostEqual(float(line.amount),
+                    float((line.net_sales - line.materials) * line.percentage / 100 + line.materials), places=1)
+
+    def test_rollups_pay_the_same(self):
+        Session.objects.update(material_cost_collection=Session.MATERIAL_COST_INCLUDED_IN_TICKET)
+        build_rollups()
+        batch = create_batch(self.start, self.end)
+        for dimension in (EnrollmentRollup.DIMENSION_TERM, EnrollmentRollup.DIMENSION_INSTRUCTOR):
+            rollups = EnrollmentRollup.objects.filter(dimension=dimension)
+            self.assertAlmostEqual(float(sum(r.instructor_payout for r in rollups)), float(batch.total), places=1)
+
+class LowEnrollmentTest(TestCase):
+    def test_finds_sessions_below_their_minimum(self):
+        synthetic_catalogue(3, sessions_per_course=1, attendees_per_event=1)
+        sessions = list(Session.objects.order_by('pk'))
+        Session.objects.update(min_enrollment=0)
+        Session.objects.filter(pk=sessions[0].pk).update(min_enrollment=100)
+        start = timezone.make_aware(datetime(2015, 1, 1), timezone.utc)
+        end = timezone.make_aware(datetime(2015, 3, 1), timezone.utc)
+        with assert_app_queries(self, 1):
+            found = list(under_enrolled(start, end))
+        self.assertEqual(found, [sessions[0]])
+
+        send_digest(found, 14, ['staff@example.com'])
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn(sessions[0].name, mail.outbox[0].body)
+
+    def test_command_sends_with_the_configured_backend(self):
+        session = make_session(make_course(), state=Session.STATE_PUBLIC,
+                start=timezone.now() + timedelta(days=3), min_enrollment=4)
+        store_events([synthetic_event(eventbrite_templates()[0], 1000, 'Intro to Welding')])
+        session.event = Event.objects.get(eb_id='1000')
+        session.save()
+        call_command('low_enrollment', recipients=['staff@example.com'], stdout=StringIO())
+        self.assertEqual([m.to for m in mail.outbox], [['staff@example.com']])
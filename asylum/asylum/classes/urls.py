@@ -1,7 +1,11 @@
-from asylum.classes.admin import admin_site
 from django.conf.urls import patterns, include, url
-from . import views
+from . import api, feeds, views
 
 urlpatterns = patterns('',
     url('^session/(?P<id>\d+)/', views.session_item),
+    url('^calendar\.ics$', feeds.session_feed, {'kind': 'all'}, name='session_feed'),
+    url('^category/(?P<id>\d+)\.ics$', feeds.session_feed, {'kind': 'category'}, name='category_feed'),
+    url('^room/(?P<id>\d+)\.ics$', feeds.session_feed, {'kind': 'room'}, name='room_feed'),
+    url('^api/sessions\.json$', api.session_list, name='api_sessions'),
+    url('^api/search\.json$', api.session_search, name='api_search'),
 )
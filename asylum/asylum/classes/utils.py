@@ -1,9 +1,41 @@
+from asylum.classes.caching import LRUCache, digest, get_version
+from asylum.classes.instrumentation import eb, instrumented
 from asylum.classes.models import Session, TemplateText
 from django.template import Template, Context
-#from django_eventbrite.utils import eb, e2l
-from django_eventbrite.utils import eb, to_multipart, to_datetime, e2l, to_money
 from django_eventbrite.models import Event, TicketType
-from markdown_deux import markdown
+import threading
+
+TEMPLATE_TEXT_VERSION = 'template_text'
+
+_template_texts = {'version': None, 'texts': {}}
+_template_texts_lock = threading.Lock()
+
+# Compiled description/blurb templates, keyed by a digest of their source.
+# They don't depend on the TemplateTexts, which are only supplied at render
+# time, so editing one doesn't invalidate them.
+compiled_templates = LRUCache(256)
+
+def template_texts():
+    """The keyword → text map of all the TemplateTexts.
+
+    This is kept for the life of the process and only reloaded once a
+    TemplateText has been saved or deleted, in this or any other process.
+    """
+    version = get_version(TEMPLATE_TEXT_VERSION)
+    with _template_texts_lock:
+        if _template_texts['version'] != version:
+            _template_texts['texts'] = dict(TemplateText.objects.values_list('keyword', 'text'))
+            _template_texts['version'] = version
+        return _template_texts['texts']
+
+def compile_template(source):
+    """A compiled Template for the given source, cached by content."""
+    key = digest(source)
+    template = compiled_templates.get(key)
+    if template is None:
+        template = Template(source)
+        compiled_templates.set(key, template)
+    return template
 
 class TemplateTextContext(Context):
     def __init__(self):
@@ -11,50 +43,85 @@ class TemplateTextContext(Context):
         self.load_text_templates()
 
     def load_text_templates(self):
-        temps = {}
-        for template in TemplateText.objects.all():
-            temps[template.keyword] = template.text
-        self.update(temps)
+        # copied, as rendering can write to the topmost dict
+        self.update(dict(template_texts()))
+
+@instrumented('template_text')
+def render_template_text(text):
+    """Substitutes the TemplateTexts into the given text."""
+    return compile_template(text).render(TemplateTextContext())
 
 def multipart_markdown(md_text, template_text=True):
+    # only needed to publish, so kept out of the listing's imports
+    from django_eventbrite.utils import to_multipart
+    from markdown_deux import markdown
+
     if template_text:
-        md_text = Template(md_text).render(TemplateTextContext())
+        md_text = render_template_text(md_text)
 
     return to_multipart(md_text, markdown(md_text))
 
-def publish_to_eb(session):
-    if session.state not in (Session.STATE_READY_TO_PUBLISH,):
+class PublishError(Exception):
+    """Eventbrite rejected part of a publish request."""
+
+class NotReadyToPublish(Exception):
+    """The session is in a state that can't be published."""
+
+def check_response(result):
+    if 'error' in result:
+        raise PublishError("{0}: {1}".format(result['error'], result.get('error_description', '')))
+    return result
+
+def publish_to_eb(session, client=eb):
+    """Creates the Eventbrite event and ticket class for a session.
+
+    This can safely be retried after a failure, as it skips any step whose
+    result has already been stored locally. The session only becomes public
+    once both steps have succeeded.
+    """
+    from django_eventbrite.utils import e2l, to_datetime, to_money, to_multipart
+
+    if session.state == Session.STATE_PUBLIC:
+        # an earlier attempt got all the way
         return
-    event = {}
-    event['name'] = to_multipart(session.name)
-    event['description'] = multipart_markdown(session.description)
-    event['start'] = to_datetime(session.calendar_event.start)
-    event['end'] = to_datetime(session.get_occurrences()[-1].end)
-    event['capacity'] = session.max_enrollment
+    if session.state != Session.STATE_READY_TO_PUBLISH:
+        raise NotReadyToPublish("Session {0} is {1}, not ready to publish".format(
+            session.pk, session.get_state_display()))
 
-    # TODO add some default somewhere
-    event['currency'] = 'USD'
+    if not session.event:
+        event = {}
+        event['name'] = to_multipart(session.name)
+        event['description'] = multipart_markdown(session.description)
+        event['start'] = to_datetime(session.first_start)
+        event['end'] = to_datetime(session.last_end)
+        event['capacity'] = session.max_enrollment
 
-    result = eb.post_event({'event': event})
+        # TODO add some default somewhere
+        event['currency'] = 'USD'
 
-    session.event = e2l(Event, 'event', result)
-    session.state = Session.STATE_PUBLIC
-    session.save()
+        result = check_response(client.post_event({'event': event}))
+
+        session.event = e2l(Event, 'event', result)
+        session.save()
 
     eb_id = session.event.eb_id
 
     # once the event is created, the tickets can be created and loaded into the DB
-    tc = {}
-    tc['name'] = 'General Admission'
-    if session.material_cost_collection == Session.MATERIAL_COST_INCLUDED_IN_TICKET:
-        tc['name'] = "{0} + Materials".format(tc['name'])
+    if not session.event.tickets.exists():
+        tc = {}
+        tc['name'] = 'General Admission'
+        if session.material_cost_collection == Session.MATERIAL_COST_INCLUDED_IN_TICKET:
+            tc['name'] = "{0} + Materials".format(tc['name'])
 
-    tc['description'] = ''
-    tc['quantity_total'] = session.max_enrollment
-    tc['cost'] = to_money(session.ticket_price)
-    tc['donation'] = False
-    tc['free'] = False
-    tc['include_fee'] = False
+        tc['description'] = ''
+        tc['quantity_total'] = session.max_enrollment
+        tc['cost'] = to_money(session.ticket_price)
+        tc['donation'] = False
+        tc['free'] = False
+        tc['include_fee'] = False
 
-    e2l(TicketType, 'ticket_class', eb.post_event_ticket_classes(eb_id, {'ticket_class': tc}))
+        result = check_response(client.post_event_ticket_classes(eb_id, {'ticket_class': tc}))
+        e2l(TicketType, 'ticket_class', result)
 
+    session.state = Session.STATE_PUBLIC
+    session.save()
@@ -1,26 +1,62 @@
-from asylum.classes.utils import TemplateTextContext
-from asylum.classes.models import Session, Category
+from asylum.classes.caching import CATALOGUE_VERSION, course_version, digest, get_version, get_versions
+from asylum.classes.listing import catalogue
+from asylum.classes.utils import TEMPLATE_TEXT_VERSION, render_template_text
+from asylum.classes.models import Session
+from django.core.cache import cache
 from django.shortcuts import render
-from django.http import Http404
-from django.template import Template
+from django.http import Http404, HttpResponse
+from django.utils.translation import get_language
+
+# Pages are cached under the catalogue version, which the signals bump
+# whenever anything shown on them is edited.
+PAGE_CACHE_TIMEOUT = 60 * 60 * 24
+
+def page_key(name, *parts):
+    parts = (get_version(CATALOGUE_VERSION), get_language()) + parts
+    return 'asylum:page:{0}:{1}'.format(name, ':'.join(str(part) for part in parts))
+
+def cached_page(key, render_page):
+    content = cache.get(key)
+    if content is None:
+        content = render_page().content
+        cache.set(key, content, PAGE_CACHE_TIMEOUT)
+    return HttpResponse(content)
 
 def session_list(request):
-    categories = Category.objects.order_by('name')
+    def render_page():
+        categories = list(catalogue())
+        courses = [course for category in categories for course in category.course_set.all()]
+        # each course's fragment is only re-rendered when that course changes
+        versions = get_versions(course_version(course.pk) for course in courses)
+        for course in courses:
+            course.fragment_version = versions[course_version(course.pk)]
+        # and each category's when its name or any of its courses change
+        for category in categories:
+            category.fragment_version = digest(u' '.join([category.name] +
+                [u'{0}:{1}'.format(course.pk, course.fragment_version) for course in category.course_set.all()]))
+
+        return render(request, 'session_list.html', {
+            'categories': categories,
+            'fragment_timeout': PAGE_CACHE_TIMEOUT,
+            'language': get_language(),
+            })
 
-    return render(request, 'session_list.html', { 'categories': categories })
+    return cached_page(page_key('session_list'), render_page)
 
 def session_item(request, id):
-    try:
-        s = Session.objects.get(pk=id)
-    except Session.DoesNotExist:
-        raise Http404("Session doesn't exist")
-
-    context = TemplateTextContext()
-    description = Template(s.description).render(context)
-    blurb = Template(s.blurb).render(context)
-
-    return render(request, 'session_item.html', {
-            'session': s,
-            'description': description,
-            'blurb': blurb,
-            })
+    def render_page():
+        try:
+            s = Session.objects.get(pk=id)
+        except Session.DoesNotExist:
+            raise Http404("Session doesn't exist")
+
+        description = render_template_text(s.description)
+        blurb = render_template_text(s.blurb)
+
+        return render(request, 'session_item.html', {
+                'session': s,
+                'description': description,
+                'blurb': blurb,
+                })
+
+    return cached_page(page_key('session_item', id, get_version(TEMPLATE_TEXT_VERSION)), render_page)
@@ -44,6 +44,7 @@ INSTALLED_APPS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    'asylum.classes.middleware.InstrumentationMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -54,6 +55,9 @@ MIDDLEWARE_CLASSES = (
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 )
 
+# The fraction of requests whose queries and render times are recorded
+ASYLUM_INSTRUMENTATION_SAMPLE_RATE = 0.0
+
 TEMPLATE_CONTEXT_PROCESSORS = (
     'django.contrib.auth.context_processors.auth',
     'django.core.context_processors.request',
@@ -79,6 +83,20 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/1.7/topics/cache/
+
+# Cached pages and the versions that invalidate them have to be shared by
+# every worker process, so the default is the database rather than local
+# memory. Create the table with "manage.py createcachetable", or point
+# local_settings at memcached.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'asylum_cache',
+    }
+}
+
 # Internationalization
 # https://docs.djangoproject.com/en/1.7/topics/i18n/
 
@@ -99,6 +117,9 @@ USE_TZ = True
 # Weeks start on Monday.
 FIRST_DAY_OF_WEEK = 1
 
+# Who gets the digest of under-enrolled sessions from the low_enrollment command
+ASYLUM_LOW_ENROLLMENT_RECIPIENTS = ()
+
 
 try:
     from .local_settings import *
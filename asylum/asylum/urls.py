@@ -1,4 +1,3 @@
-from asylum.classes.admin import admin_site
 from django.conf.urls import patterns, include, url
 
 urlpatterns = patterns('',
@@ -9,5 +8,6 @@ urlpatterns = patterns('',
      url(r'^$', 'asylum.classes.views.session_list', name='home'),
      url(r'^courses/', include('asylum.classes.urls')),
 
-    url(r'^admin/', include(admin_site.urls)),
+    # by name, so the admin is only imported once it's first used
+    url(r'^admin/', include('asylum.classes.admin_urls', namespace='admin', app_name='admin')),
 )